@@ -98,6 +98,58 @@ DATABASES = {
 }
 
 
+# Cache
+
+# По умолчанию - память процесса; для общего кэша нескольких процессов
+# задаётся другой бэкенд, например
+# django.core.cache.backends.redis.RedisCache и CACHE_LOCATION=redis://...
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'knockdown'),
+    }
+}
+
+
+# Stats
+
+# true - агрегация после сессии выполняется воркером
+# (python manage.py run_aggregation_worker), а не в запросе
+STATS_ASYNC_AGGREGATION = os.getenv('STATS_ASYNC_AGGREGATION', 'false') == 'true'
+
+# Попыток обработки задачи агрегации до пометки failed
+STATS_AGGREGATION_MAX_ATTEMPTS = int(
+    os.getenv('STATS_AGGREGATION_MAX_ATTEMPTS', '5')
+)
+
+# Максимум сессий в одном запросе импорта (POST /api/stats/sessions/import/)
+STATS_IMPORT_MAX_SESSIONS = int(os.getenv('STATS_IMPORT_MAX_SESSIONS', '500'))
+
+
+# Lessons
+
+# Поиск слов для генерации уроков по индексу словаря в памяти процесса
+# (false - запросами к БД)
+DICTIONARY_INDEX_ENABLED = os.getenv('DICTIONARY_INDEX_ENABLED', 'true') == 'true'
+# Через сколько секунд индекс перестраивается (изменения словаря,
+# сделанные другими процессами, например populate_dictionary.py)
+DICTIONARY_INDEX_TTL = int(os.getenv('DICTIONARY_INDEX_TTL', '3600'))
+# Минимальная доля символов урока, входящих в целевые буквы/биграммы
+LESSON_TARGET_DENSITY = float(os.getenv('LESSON_TARGET_DENSITY', '0.25'))
+# Время жизни кэша проблемных клавиш пользователя в секундах
+# (кэш сбрасывается и при сохранении новой сессии)
+PROBLEM_KEYS_CACHE_TTL = int(os.getenv('PROBLEM_KEYS_CACHE_TTL', '3600'))
+# Сколько заранее сгенерированных уроков хранится на набор параметров
+# запроса генерации (0 - пул отключён)
+LESSON_POOL_SIZE = int(os.getenv('LESSON_POOL_SIZE', '3'))
+# Время жизни кэша публичного каталога уроков в секундах (версия каталога
+# меняется при сохранении уроков; при кэше в памяти процесса TTL
+# ограничивает устаревание в других процессах)
+LESSON_CATALOG_CACHE_TTL = int(os.getenv('LESSON_CATALOG_CACHE_TTL', '3600'))
+
+
 # Auth
 
 AUTH_USER_MODEL = 'users.User'
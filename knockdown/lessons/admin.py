@@ -1,6 +1,18 @@
 from django.contrib import admin
-from .models import Lesson, UserLessonProgress, DictionaryWord
+from .models import (
+    Lesson,
+    UserLessonProgress,
+    DictionaryWord,
+    DictionaryWordLetter,
+    DictionaryWordBigram,
+    PooledLesson,
+    LessonPoolJob
+)
 
 admin.site.register(Lesson)
 admin.site.register(UserLessonProgress)
 admin.site.register(DictionaryWord)
+admin.site.register(DictionaryWordLetter)
+admin.site.register(DictionaryWordBigram)
+admin.site.register(PooledLesson)
+admin.site.register(LessonPoolJob)
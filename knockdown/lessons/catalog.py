@@ -0,0 +1,100 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from .models import Lesson
+from .serializers import LessonDetailSerializer, LessonListSerializer
+
+PREFIX = 'lesson_catalog'
+
+
+def get_list():
+    """
+    Публичный каталог уроков (данные LessonListSerializer без прогресса),
+    ETag и Last-Modified: {'data', 'etag', 'last_modified'}
+    """
+    return _get_or_build('list', _build_list)
+
+
+def get_detail(lesson_id):
+    """Публичные данные одного урока или None, если урока нет"""
+    return _get_or_build(f'detail:{lesson_id}', lambda: _build_detail(lesson_id))
+
+
+def bump():
+    """
+    Новая версия каталога: сразу и ещё раз после фиксации транзакции
+    (иначе параллельный запрос мог бы закэшировать старые данные
+    под новой версией)
+    """
+    _set_version()
+    transaction.on_commit(_set_version)
+
+
+def _set_version():
+    # Время изменения хранится рядом с версией: удаление урока
+    # не оставляет следа в updated_at оставшихся уроков
+    cache.set_many({
+        f'{PREFIX}:version': time.time_ns(),
+        f'{PREFIX}:bumped_at': timezone.now(),
+    }, None)
+
+
+def _version():
+    version = cache.get(f'{PREFIX}:version')
+    if version is None:
+        cache.add(f'{PREFIX}:version', time.time_ns(), None)
+        version = cache.get(f'{PREFIX}:version')
+    return version
+
+
+def _get_or_build(name, build):
+    key = f'{PREFIX}:{_version()}:{name}'
+    entry = cache.get(key)
+    if entry is None:
+        entry = build()
+        if entry is None:
+            return None
+        cache.set(key, entry, settings.LESSON_CATALOG_CACHE_TTL)
+    return entry
+
+
+def _build_list():
+    lessons = list(Lesson.objects.all())
+    data = LessonListSerializer(lessons, many=True).data
+    changes = [lesson.updated_at for lesson in lessons]
+    changes.append(cache.get(f'{PREFIX}:bumped_at'))
+    last_modified = max(
+        (changed for changed in changes if changed), default=None
+    )
+    return _entry(data, last_modified)
+
+
+def _build_detail(lesson_id):
+    lesson = Lesson.objects.filter(pk=lesson_id).first()
+    if lesson is None:
+        return None
+    return _entry(LessonDetailSerializer(lesson).data, lesson.updated_at)
+
+
+def _entry(data, last_modified):
+    # Обычные списки и словари вместо ReturnList/ReturnDict сериализатора
+    data = json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+    return {
+        'data': data,
+        'etag': etag(data),
+        'last_modified': last_modified,
+    }
+
+
+def etag(data):
+    """Сильный ETag по содержимому ответа"""
+    payload = json.dumps(
+        data, cls=DjangoJSONEncoder, ensure_ascii=False, sort_keys=True
+    )
+    return '"%s"' % hashlib.md5(payload.encode()).hexdigest()
@@ -0,0 +1,102 @@
+import threading
+import time
+from array import array
+from collections import defaultdict
+
+from django.conf import settings
+from .models import DictionaryWord
+
+
+class DictionaryIndex:
+    """
+    Инвертированный индекс словаря в памяти процесса:
+    буква -> позиции слов, биграмма -> позиции слов.
+    Позиции хранятся компактными массивами array('I'),
+    частотность слов - параллельным массивом frequencies
+    """
+
+    def __init__(self, rows):
+        """rows - пары (слово, частотность)"""
+        self.words = []
+        self.frequencies = array('I')
+        letters = defaultdict(list)
+        bigrams = defaultdict(list)
+
+        for position, (word, frequency) in enumerate(rows):
+            self.words.append(word)
+            self.frequencies.append(frequency)
+            for letter in set(word):
+                letters[letter].append(position)
+            for bigram in {word[i:i+2] for i in range(len(word) - 1)}:
+                bigrams[bigram].append(position)
+
+        self.letters = {
+            letter: array('I', positions)
+            for letter, positions in letters.items()
+        }
+        self.bigrams = {
+            bigram: array('I', positions)
+            for bigram, positions in bigrams.items()
+        }
+
+    @classmethod
+    def from_db(cls):
+        return cls(
+            DictionaryWord.objects.order_by('id').values_list(
+                'word', 'frequency'
+            ).iterator(chunk_size=2000)
+        )
+
+    def weigh_by_letters(self, letters):
+        """Поток (слово, вес) для слов с ХОТЯ БЫ ОДНОЙ из букв"""
+        return self.weigh(letters=dict.fromkeys(letters, 1))
+
+    def weigh_by_bigrams(self, bigrams):
+        """Поток (слово, вес) для слов с ХОТЯ БЫ ОДНОЙ из биграмм"""
+        return self.weigh(bigrams=dict.fromkeys(bigrams, 1))
+
+    def weigh(self, letters=None, bigrams=None):
+        """
+        Поток (слово, вес) для слов с ХОТЯ БЫ ОДНОЙ из клавиш.
+        letters/bigrams - словари клавиша -> вес; вес слова - частотность,
+        умноженная на сумму весов покрытых им клавиш
+        """
+        coverage = defaultdict(int)
+        for postings, weights in (
+            (self.letters, letters or {}), (self.bigrams, bigrams or {})
+        ):
+            for key, weight in weights.items():
+                for position in postings.get(key, ()):
+                    coverage[position] += weight
+
+        for position, score in coverage.items():
+            yield self.words[position], self.frequencies[position] * score
+
+
+_index = None
+_built_at = 0.0
+_lock = threading.Lock()
+
+
+def get_index():
+    """
+    Индекс текущего процесса. Строится при первом обращении и заново -
+    после изменения словаря (сигналы DictionaryWord) или по истечении
+    DICTIONARY_INDEX_TTL секунд (изменения из других процессов)
+    """
+    global _index, _built_at
+
+    ttl = settings.DICTIONARY_INDEX_TTL
+    with _lock:
+        if _index is None or time.monotonic() - _built_at > ttl:
+            _index = DictionaryIndex.from_db()
+            _built_at = time.monotonic()
+        return _index
+
+
+def invalidate():
+    """Сброс индекса - следующий запрос построит его заново"""
+    global _index
+
+    with _lock:
+        _index = None
@@ -70,3 +70,111 @@ class DictionaryWord(models.Model):
 
     def __str__(self):
         return f"{self.word}"
+
+    def build_keys(self):
+        """Несохранённые связи слова с его буквами и биграммами"""
+        letters = [
+            DictionaryWordLetter(word=self, letter=letter)
+            for letter in sorted(set(self.word))
+        ]
+        bigrams = [
+            DictionaryWordBigram(word=self, bigram=bigram)
+            for bigram in sorted({
+                self.word[i:i+2] for i in range(len(self.word) - 1)
+            })
+        ]
+        return letters, bigrams
+
+
+class DictionaryWordLetter(models.Model):
+    """Буква слова словаря (поиск слов по буквам через индекс)"""
+    word = models.ForeignKey(
+        DictionaryWord,
+        on_delete=models.CASCADE,
+        related_name='letter_keys'
+    )
+    letter = models.CharField(max_length=1)
+
+    class Meta:
+        unique_together = ['word', 'letter']
+        indexes = [
+            # Покрывающий индекс: буква -> id слов без чтения таблицы
+            models.Index(fields=['letter', 'word'], name='dict_letter_word_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.word.word}: '{self.letter}'"
+
+
+class DictionaryWordBigram(models.Model):
+    """Биграмма слова словаря (поиск слов по биграммам через индекс)"""
+    word = models.ForeignKey(
+        DictionaryWord,
+        on_delete=models.CASCADE,
+        related_name='bigram_keys'
+    )
+    bigram = models.CharField(max_length=2)
+
+    class Meta:
+        unique_together = ['word', 'bigram']
+        indexes = [
+            models.Index(fields=['bigram', 'word'], name='dict_bigram_word_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.word.word}: '{self.bigram}'"
+
+
+class PooledLesson(models.Model):
+    """
+    Заранее сгенерированный урок пользователя. Пул пополняет воркер
+    по задачам LessonPoolJob, урок устаревает при смене проблемных
+    клавиш (keys_fingerprint)
+    """
+    user = models.ForeignKey(
+        'users.User',
+        on_delete=models.CASCADE,
+        related_name='pooled_lessons'
+    )
+    # Параметры запроса генерации
+    request_type = models.CharField(max_length=10)
+    difficulty = models.IntegerField()
+    length = models.IntegerField()
+    keys_fingerprint = models.CharField(max_length=32)
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'request_type', 'difficulty', 'length'],
+                name='pooled_lesson_params_idx'
+            ),
+        ]
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.user.username}: {self.data.get('title', '')}"
+
+
+class LessonPoolJob(models.Model):
+    """
+    Задача пополнения пула уроков пользователя для набора параметров.
+    Разбирается воркером (python manage.py run_aggregation_worker)
+    """
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE)
+    request_type = models.CharField(max_length=10)
+    difficulty = models.IntegerField()
+    length = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # Повторные постановки одной задачи не копятся
+        unique_together = ['user', 'request_type', 'difficulty', 'length']
+        ordering = ['id']
+
+    def __str__(self):
+        return (
+            f"{self.user.username}: {self.request_type}, "
+            f"{self.difficulty}, {self.length}"
+        )
@@ -0,0 +1,86 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+PREFIX = 'problem_keys'
+
+
+def get_or_compute(user, params, compute):
+    """
+    Проблемные клавиши пользователя из кэша или compute().
+    params - кортеж параметров анализа (вид, limit, min_occurrences,
+    error_threshold), входит в ключ вместе с версией пользователя
+    """
+    key = f'{PREFIX}:{user.pk}:{_version(user.pk)}:' + ':'.join(
+        str(param) for param in params
+    )
+    value = cache.get(key)
+    if value is not None:
+        _count('hits')
+        return value
+
+    _count('misses')
+    value = compute()
+    cache.set(key, value, settings.PROBLEM_KEYS_CACHE_TTL)
+    return value
+
+
+def invalidate(user_id):
+    """
+    Сброс кэша пользователя сменой версии - записи со старой версией
+    больше не читаются и вытесняются по TTL
+    """
+    cache.set(_version_key(user_id), time.time_ns(), None)
+
+
+def invalidate_on_commit(user_id):
+    """
+    Сброс после фиксации транзакции: иначе параллельный запрос
+    успел бы закэшировать статистику без новой сессии
+    """
+    transaction.on_commit(lambda: invalidate(user_id))
+
+
+def stats():
+    """Счётчики попаданий и промахов кэша"""
+    counters = cache.get_many([f'{PREFIX}:hits', f'{PREFIX}:misses'])
+    hits = counters.get(f'{PREFIX}:hits', 0)
+    misses = counters.get(f'{PREFIX}:misses', 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 3) if total else 0.0,
+    }
+
+
+def reset_stats():
+    cache.delete_many([f'{PREFIX}:hits', f'{PREFIX}:misses'])
+
+
+def _version_key(user_id):
+    return f'{PREFIX}:{user_id}:version'
+
+
+def _version(user_id):
+    """
+    Текущая версия кэша пользователя. Если версия вытеснена из кэша,
+    создаётся новая - старые записи при этом не оживают
+    """
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        cache.add(_version_key(user_id), time.time_ns(), None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def _count(counter):
+    key = f'{PREFIX}:{counter}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Счётчика ещё нет (или он вытеснен)
+        if not cache.add(key, 1, None):
+            cache.incr(key)
@@ -0,0 +1,29 @@
+import heapq
+import math
+import random
+
+
+def weighted_sample(items, k, rng=None):
+    """
+    Взвешенная выборка k элементов без возвращения из потока пар
+    (значение, вес) за один проход с памятью O(k).
+
+    Алгоритм A-Res (Efraimidis, Spirakis): каждому элементу назначается
+    ключ u ** (1 / вес), u ~ U(0, 1], и остаются k наибольших ключей.
+    Для устойчивости считается логарифм ключа: log(u) / вес.
+    Результат - по убыванию ключа.
+    """
+    rng = rng or random
+    heap = []
+
+    for value, weight in items:
+        if weight <= 0:
+            continue
+        key = math.log(1.0 - rng.random()) / weight
+        if len(heap) < k:
+            heapq.heappush(heap, (key, value))
+        elif key > heap[0][0]:
+            heapq.heapreplace(heap, (key, value))
+
+    heap.sort(reverse=True)
+    return [value for _, value in heap]
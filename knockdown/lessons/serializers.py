@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Lesson, UserLessonProgress
+from .services import LessonUnlockService
 from django.utils import timezone
 
 
@@ -63,56 +64,57 @@ class LessonDetailSerializer(LessonSerializer):
 
     def get_is_unlocked(self, obj):
         """Проверка, доступен ли урок пользователю"""
-        if obj.order_index == 1:
-            return True  # первый урок всегда доступен
-
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            # Урок доступен если предыдущий пройден
-            prev_lesson = Lesson.objects.filter(
-                order_index=obj.order_index - 1
-            ).first()
-
-            if prev_lesson:
-                try:
-                    prev_progress = UserLessonProgress.objects.get(
-                        user=request.user,
-                        lesson=prev_lesson
-                    )
-                    return prev_progress.is_passed
-                except UserLessonProgress.DoesNotExist:
-                    return False
-        return False
+        return is_unlocked(obj, self.context)
 
 
 class LessonListSerializer(serializers.ModelSerializer):
     """Упрощенный для списка уроков (включает данные об is_passed)"""
     progress = serializers.SerializerMethodField()
+    is_unlocked = serializers.SerializerMethodField()
 
     class Meta:
         model = Lesson
         fields = [
             'id', 'title', 'description', 'difficulty_level',
-            'lesson_type', 'order_index', 'progress'
+            'lesson_type', 'order_index', 'progress', 'is_unlocked'
         ]
 
     def get_progress(self, obj):
         """Только минимальная информация о прогрессе"""
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            try:
-                progress = UserLessonProgress.objects.get(
-                    user=request.user,
-                    lesson=obj
-                )
-                return {
-                    'is_passed': progress.is_passed,
-                    'best_speed': progress.best_speed,
-                    'completion_count': progress.completion_count
-                }
-            except UserLessonProgress.DoesNotExist:
-                return None
-        return None
+        lesson_state = _lesson_state(obj, self.context)
+        return lesson_state['progress'] if lesson_state else None
+
+    def get_is_unlocked(self, obj):
+        """Проверка, доступен ли урок пользователю"""
+        return is_unlocked(obj, self.context)
+
+
+def is_unlocked(lesson, context):
+    """
+    Доступность урока по состоянию курса пользователя.
+    Первый урок доступен всегда, остальные - только авторизованным
+    """
+    if lesson.order_index == 1:
+        return True  # первый урок всегда доступен
+
+    lesson_state = _lesson_state(lesson, context)
+    return lesson_state['is_unlocked'] if lesson_state else False
+
+
+def _lesson_state(lesson, context):
+    """
+    Состояние урока из LessonUnlockService.course_state. Состояние курса
+    считается одним запросом на сериализацию и хранится в контексте;
+    без авторизованного пользователя - None
+    """
+    course_state = context.get('course_state')
+    if course_state is None:
+        request = context.get('request')
+        if not (request and request.user.is_authenticated):
+            return None
+        course_state = LessonUnlockService.course_state(request.user)
+        context['course_state'] = course_state
+    return course_state.get(lesson.id)
 
 
 class UserLessonProgressSerializer(serializers.ModelSerializer):
@@ -184,6 +186,48 @@ class UserLessonProgressSerializer(serializers.ModelSerializer):
         progress.save()
         return progress
 
+    @staticmethod
+    def update_from_sessions(sessions):
+        """
+        Обновляет прогресс по нескольким сессиям одного урока
+        одним сохранением (импорт пачки сессий)
+        """
+        session = sessions[0]
+        lesson = session.lesson
+        progress, _ = UserLessonProgress.objects.get_or_create(
+            user=session.user,
+            lesson=lesson
+        )
+
+        progress.best_speed = max(
+            progress.best_speed,
+            *(session.average_speed_wpm for session in sessions)
+        )
+        progress.best_accuracy = max(
+            progress.best_accuracy,
+            *(session.accuracy_percentage for session in sessions)
+        )
+        progress.completion_count += len(sessions)
+        progress.last_completed_at = max(
+            finished_at for finished_at in (
+                progress.last_completed_at,
+                *(session.finished_at for session in sessions)
+            )
+            if finished_at
+        )
+
+        passed = [
+            session.finished_at for session in sessions
+            if session.average_speed_wpm >= lesson.required_speed
+            and session.accuracy_percentage >= lesson.required_accuracy
+        ]
+        if passed and not progress.is_passed:
+            progress.is_passed = True
+            progress.passed_at = min(passed)
+
+        progress.save()
+        return progress
+
 
 class GenerateLessonRequestSerializer(serializers.Serializer):
     """Для запроса генерации урока"""
@@ -1,17 +1,42 @@
+import hashlib
+import heapq
+import json
+import logging
 import random
-from django.db.models import Sum, Avg, Q
+from itertools import groupby
+from operator import itemgetter
+from django.db.models import Count, Sum, Avg, Q, F, Value, FilteredRelation
 from django.utils import timezone
 from datetime import timedelta
-from django.db import connection
-from .models import DictionaryWord
-from stats.models import DailyLetterStatistics, DailyBigramStatistics
+from django.conf import settings
+from django.db import transaction
+from . import dictionary_index, problem_keys_cache
+from .sampling import weighted_sample
+from .text_builder import LessonTextBuilder
+from .models import (
+    Lesson,
+    DictionaryWord,
+    DictionaryWordLetter,
+    DictionaryWordBigram,
+    PooledLesson,
+    LessonPoolJob
+)
+from stats.models import (
+    DailyLetterStatistics,
+    DailyBigramStatistics,
+    UserLetterTotals,
+    UserBigramTotals
+)
+
+logger = logging.getLogger(__name__)
 
 
 class LessonGenerator:
     """Генератор персонализированных уроков"""
 
-    def __init__(self, user):
+    def __init__(self, user, rng=None):
         self.user = user
+        self.rng = rng or random.Random()
 
     def generate(
             self, type='auto', difficulty=1, length=200,
@@ -19,6 +44,10 @@ class LessonGenerator:
     ):
         """Основной метод генерации"""
 
+        if type == 'mixed':
+            return self.generate_mixed_lesson(
+                target_letters, target_bigrams, difficulty, length
+            )
         if type == 'bigrams' or (type == 'auto' and target_bigrams):
             return self.generate_bigram_lesson(
                 target_bigrams, difficulty, length
@@ -28,6 +57,25 @@ class LessonGenerator:
                 target_letters, difficulty, length
             )
 
+    def target_fingerprint(self, type='auto'):
+        """
+        Отпечаток проблемных клавиш, на которые generate(type) строит урок
+        без явных целей (уроки пула устаревают при его смене)
+        """
+        if type == 'mixed':
+            letters, bigrams = self.get_problem_keys()
+            keys = [key for key, _ in letters + bigrams]
+        elif type == 'bigrams':
+            keys = self.get_problem_bigrams(limit=5)
+        else:
+            keys = self.get_problem_letters(limit=5)
+        return hashlib.md5(
+            json.dumps(keys, ensure_ascii=False).encode()
+        ).hexdigest()
+
+    # Окна анализа в днях, по возрастанию; после них - итоги за всё время
+    PERIODS = [7, 14, 30, 90, 365]
+
     def get_problem_letters(
             self, limit=5, days_delta=7, min_occurrences=10, error_threshold=15
             ):
@@ -35,41 +83,15 @@ class LessonGenerator:
         Анализ дневной статистики - буквы с ошибками > threshold%
         с каскадным расширением периода
         """
-
-        # Перебор разных периоды: 7, 14, 30, 90 дней, все время
-        periods = [7, 14, 30, 90, 365, None]  # None = все время
-
-        for days in periods:
-            if days:
-                start_date = timezone.now().date() - timedelta(days=days)
-                stats = DailyLetterStatistics.objects.filter(
-                    user=self.user,
-                    date__gte=start_date
-                )
-            else:
-                # Все время
-                stats = DailyLetterStatistics.objects.filter(user=self.user)
-
-            if stats.exists():
-                aggregated = stats.values('letter').annotate(
-                    total_occ=Sum('total_occurrences'),
-                    total_err=Sum('total_errors')
-                ).filter(total_occ__gte=min_occurrences)
-
-                problem_letters = []
-                for stat in aggregated:
-                    error_rate = stat['total_err'] * 100 / stat['total_occ']
-                    if error_rate > error_threshold:
-                        problem_letters.append({
-                            'letter': stat['letter'],
-                            'error_rate': error_rate
-                            })
-
-                if problem_letters:
-                    problem_letters.sort(
-                        key=lambda x: x['error_rate'], reverse=True
-                    )
-                    return [item['letter'] for item in problem_letters[:limit]]
+        problem_letters = problem_keys_cache.get_or_compute(
+            self.user, ('letters', limit, min_occurrences, error_threshold),
+            lambda: self._find_problem_keys(
+                DailyLetterStatistics, UserLetterTotals, 'letter',
+                limit, min_occurrences, error_threshold
+            )
+        )
+        if problem_letters:
+            return problem_letters
 
         # Если нет статистики - возвращаются частотные буквы
         return ['а', 'о', 'е', 'и', 'н'][:limit]
@@ -81,98 +103,237 @@ class LessonGenerator:
         Анализ дневной статистики - биаграммы с ошибками > threshold%
         с каскадным расширением периода
         """
+        problem_bigrams = problem_keys_cache.get_or_compute(
+            self.user, ('bigrams', limit, min_occurrences, error_threshold),
+            lambda: self._find_problem_keys(
+                DailyBigramStatistics, UserBigramTotals, 'bigram',
+                limit, min_occurrences, error_threshold
+            )
+        )
+        if problem_bigrams:
+            return problem_bigrams
+
+        # Если нет статистики - частотные биграммы русского языка
+        return ['ст', 'но', 'то', 'на', 'по'][:limit]
+
+    def get_problem_keys(
+            self, letters_limit=3, bigrams_limit=3,
+            letter_options=(10, 15), bigram_options=(5, 15)
+    ):
+        """
+        Проблемные буквы и биграммы одним запросом к статистике
+        (объединение оконных сумм обеих таблиц).
+        *_options - (min_occurrences, error_threshold).
+        Возвращает два списка пар (клавиша, процент ошибок);
+        без статистики - частотные клавиши с весом на пороге ошибок
+        """
+        return problem_keys_cache.get_or_compute(
+            self.user,
+            ('mixed', letters_limit, bigrams_limit,
+             *letter_options, *bigram_options),
+            lambda: self._find_mixed_problem_keys(
+                letters_limit, bigrams_limit, letter_options, bigram_options
+            )
+        )
 
-        periods = [7, 14, 30, 90, 365, None]
+    def _find_mixed_problem_keys(
+            self, letters_limit, bigrams_limit, letter_options, bigram_options
+    ):
+        """Поиск для get_problem_keys без кэша"""
+        rows = list(
+            self._window_query(DailyLetterStatistics, 'letter').union(
+                self._window_query(DailyBigramStatistics, 'bigram'),
+                all=True
+            )
+        )
 
-        for days in periods:
-            if days:
-                start_date = timezone.now().date() - timedelta(days=days)
-                stats = DailyBigramStatistics.objects.filter(
-                    user=self.user,
-                    date__gte=start_date
+        kinds = {
+            'letter': (letters_limit, *letter_options),
+            'bigram': (bigrams_limit, *bigram_options),
+        }
+        found = {
+            kind: self._pick_window(
+                [row for row in rows if row['kind'] == kind], *params
+            )
+            for kind, params in kinds.items()
+        }
+
+        # Все время - итоги пользователя по тем клавишам, где окна пусты
+        missing = [kind for kind, keys in found.items() if not keys]
+        if missing:
+            totals = {
+                'letter': (UserLetterTotals, 'letter'),
+                'bigram': (UserBigramTotals, 'bigram'),
+            }
+            queries = [
+                self._totals_query(*totals[kind], kinds[kind][1]).annotate(
+                    kind=Value(kind)
+                )
+                for kind in missing
+            ]
+            total_rows = list(queries[0].union(*queries[1:], all=True))
+            if not total_rows and self._ensure_totals():
+                total_rows = list(queries[0].union(*queries[1:], all=True))
+            for kind in missing:
+                found[kind] = _rank_problem_keys(
+                    (
+                        (row['key'], row['occurrences'], row['errors'])
+                        for row in total_rows if row['kind'] == kind
+                    ),
+                    *kinds[kind]
                 )
-            else:
-                stats = DailyBigramStatistics.objects.filter(user=self.user)
-
-            if stats.exists():
-                aggregated = stats.values('bigram').annotate(
-                    total_occ=Sum('total_occurrences'),
-                    total_err=Sum('total_errors')
-                ).filter(total_occ__gte=min_occurrences)
-
-                problem_bigrams = []
-                for stat in aggregated:
-                    error_rate = stat['total_err'] * 100 / stat['total_occ']
-                    if error_rate > error_threshold:
-                        problem_bigrams.append({
-                            'bigram': stat['bigram'],
-                            'error_rate': error_rate
-                            })
-
-                if problem_bigrams:
-                    problem_bigrams.sort(
-                        key=lambda x: x['error_rate'], reverse=True
-                    )
-                    return [item['bigram'] for item in problem_bigrams[:limit]]
 
-        # Если нет статистики - частотные биграммы русского языка
-        return ['ст', 'но', 'то', 'на', 'по'][:limit]
+        letters = found['letter'] or [
+            (letter, letter_options[1])
+            for letter in ['а', 'о', 'е', 'и', 'н'][:letters_limit]
+        ]
+        bigrams = found['bigram'] or [
+            (bigram, bigram_options[1])
+            for bigram in ['ст', 'но', 'то', 'на', 'по'][:bigrams_limit]
+        ]
+        return letters, bigrams
+
+    def _find_problem_keys(
+            self, daily_model, totals_model, key_field,
+            limit, min_occurrences, error_threshold
+    ):
+        """
+        Каскадный поиск проблемных клавиш за один проход: суммы по всем
+        окнам считаются одним запросом (Sum с filter), первое окно
+        с подходящими клавишами выбирается в Python.
+        Если ни одно окно не подошло - читаются итоги за всё время.
+        """
+        rows = list(self._window_query(daily_model, key_field))
+        problem_keys = self._pick_window(
+            rows, limit, min_occurrences, error_threshold
+        )
+        if not problem_keys:
+            totals = list(
+                self._totals_query(totals_model, key_field, min_occurrences)
+            )
+            if not totals and self._ensure_totals():
+                totals = list(self._totals_query(
+                    totals_model, key_field, min_occurrences
+                ))
+            problem_keys = _rank_problem_keys(
+                (
+                    (row['key'], row['occurrences'], row['errors'])
+                    for row in totals
+                ),
+                limit, min_occurrences, error_threshold
+            )
+        return [key for key, _ in problem_keys]
+
+    def _window_query(self, daily_model, key_field):
+        """
+        Суммы нажатий и ошибок по клавишам для каждого окна PERIODS.
+        Строки: key, kind ('letter'/'bigram'), occ_<дни>, err_<дни>
+        """
+        today = timezone.now().date()
+
+        buckets = {}
+        for days in self.PERIODS:
+            since = Q(date__gte=today - timedelta(days=days))
+            buckets[f'occ_{days}'] = Sum('total_occurrences', filter=since)
+            buckets[f'err_{days}'] = Sum('total_errors', filter=since)
+
+        return daily_model.objects.filter(
+            user=self.user,
+            date__gte=today - timedelta(days=self.PERIODS[-1])
+        ).values(key=F(key_field)).annotate(
+            kind=Value(key_field), **buckets
+        ).order_by()
+
+    def _totals_query(self, totals_model, key_field, min_occurrences):
+        """Итоги пользователя за всё время: key, occurrences, errors"""
+        return totals_model.objects.filter(
+            user=self.user,
+            total_occurrences__gte=min_occurrences
+        ).values(
+            key=F(key_field),
+            occurrences=F('total_occurrences'),
+            errors=F('total_errors')
+        ).order_by()
+
+    def _ensure_totals(self):
+        """
+        Пересборка итогов, если их ещё нет (история до их появления).
+        True - итоги пересобраны и запрос стоит повторить
+        """
+        # stats.services сам импортирует этот модуль
+        from stats.services import KeyTotalsService
+
+        return KeyTotalsService.ensure(self.user)
+
+    def _pick_window(self, rows, limit, min_occurrences, error_threshold):
+        """Проблемные клавиши первого окна PERIODS, где они нашлись"""
+        for days in self.PERIODS:
+            problem_keys = _rank_problem_keys(
+                (
+                    (row['key'], row[f'occ_{days}'], row[f'err_{days}'])
+                    for row in rows
+                ),
+                limit, min_occurrences, error_threshold
+            )
+            if problem_keys:
+                return problem_keys
+        return []
 
     def find_words_by_letters(self, letters, limit=30):
         """Поиск слов, содержащих ХОТЯ БЫ ОДНУ из указанных букв"""
 
-        # Создается OR условие для всех букв
-        query = Q()
-        for letter in letters:
-            query |= Q(letters__contains=letter)  # OR для каждой буквы
-
-        # Получаются все подходящие слова
-        words_qs = DictionaryWord.objects.filter(query).order_by('-frequency')
-        all_words = list(words_qs.values_list('word', flat=True))
-
-        # Если слов меньше чем нужно, возвращаются все
-        if len(all_words) <= limit:
-            return all_words
+        if settings.DICTIONARY_INDEX_ENABLED:
+            index = dictionary_index.get_index()
+            candidates = index.weigh_by_letters(letters)
+        else:
+            # Поиск по индексу (letter, word) таблицы связей
+            candidates = _weigh_from_db(
+                DictionaryWordLetter.objects.filter(letter__in=letters)
+            )
 
-        # Иначе возвращаются случайные limit штук
-        return random.sample(all_words, limit)
+        return weighted_sample(candidates, limit, self.rng)
 
     def find_words_by_bigrams(self, bigrams, limit=30):
         """Поиск слов, содержащих ХОТЯ БЫ ОДНУ из указанных биграмм"""
 
-        # PostgreSQL: используем ORM запрос
-        if connection.vendor == 'postgresql':
-            query = Q()
-
-            for bigram in bigrams:
-                query |= Q(bigrams__contains=[bigram])
-
-            words_qs = DictionaryWord.objects.filter(
-                query
-            ).order_by('-frequency')
-            all_words = list(words_qs.values_list('word', flat=True))
+        if settings.DICTIONARY_INDEX_ENABLED:
+            index = dictionary_index.get_index()
+            candidates = index.weigh_by_bigrams(bigrams)
+        else:
+            # Поиск по индексу (bigram, word) таблицы связей -
+            # одинаково для PostgreSQL и SQLite
+            candidates = _weigh_from_db(
+                DictionaryWordBigram.objects.filter(bigram__in=bigrams)
+            )
 
-            if len(all_words) <= limit:
-                return all_words
+        return weighted_sample(candidates, limit, self.rng)
 
-            return random.sample(all_words, limit)
+    def find_words_by_keys(self, letters, bigrams, limit=30):
+        """
+        Поиск слов по буквам и биграммам сразу - единый пул кандидатов.
+        letters/bigrams - словари клавиша -> вес; вес слова -
+        частотность, умноженная на сумму весов покрытых клавиш
+        """
 
-        # SQLite: фильтрация в Python
+        if settings.DICTIONARY_INDEX_ENABLED:
+            index = dictionary_index.get_index()
+            candidates = index.weigh(letters, bigrams)
         else:
-            all_words = DictionaryWord.objects.all().order_by('-frequency')
-            result = []
-            for word_obj in all_words:
-                if any(bigram in word_obj.bigrams for bigram in bigrams):
-                    result.append(word_obj.word)
-                    if len(result) >= limit:
-                        break
-            return result
+            candidates = _weigh_keys_from_db(letters, bigrams)
 
-    def build_lesson_text(self, words, length=200):
-        """Составление текста из слов"""
+        return weighted_sample(candidates, limit, self.rng)
 
-        selected = random.sample(words, min(len(words), length//5))
-        return ' '.join(selected)
+    def build_lesson_text(self, words, length=200, letters=(), bigrams=()):
+        """
+        Составление текста из слов: ровно length символов
+        с плотностью целевых букв/биграмм не ниже LESSON_TARGET_DENSITY
+        """
+        builder = LessonTextBuilder(
+            words, letters, bigrams,
+            density=settings.LESSON_TARGET_DENSITY,
+            rng=self.rng
+        )
+        return builder.build(length)
 
     def generate_letter_lesson(
             self, target_letters=None, difficulty=3, length=200
@@ -183,7 +344,7 @@ class LessonGenerator:
             target_letters = self.get_problem_letters(limit=5)
 
         words = self.find_words_by_letters(target_letters)
-        text = self.build_lesson_text(words, length)
+        text = self.build_lesson_text(words, length, letters=target_letters)
 
         return {
             'title': f'Тренировка букв: {", ".join(target_letters)}',
@@ -205,7 +366,7 @@ class LessonGenerator:
             target_bigrams = self.get_problem_bigrams(limit=5)
 
         words = self.find_words_by_bigrams(target_bigrams)
-        text = self.build_lesson_text(words, length)
+        text = self.build_lesson_text(words, length, bigrams=target_bigrams)
 
         return {
             'title': f'Тренировка биграмм: {", ".join(target_bigrams)}',
@@ -217,3 +378,297 @@ class LessonGenerator:
             'required_accuracy': 0.0,
             'word_count': len(words),
         }
+
+    def generate_mixed_lesson(
+            self, target_letters=None, target_bigrams=None,
+            difficulty=3, length=200
+    ):
+        """
+        Урок на проблемные буквы и биграммы одновременно: слова
+        выбираются из общего пула по взвешенному покрытию обоих наборов
+        """
+
+        if target_letters and target_bigrams:
+            letters, bigrams = [], []
+        else:
+            letters, bigrams = self.get_problem_keys()
+
+        # Явно заданные клавиши - с максимальным весом
+        letter_weights = (
+            dict.fromkeys(target_letters, 100) if target_letters
+            else dict(letters)
+        )
+        bigram_weights = (
+            dict.fromkeys(target_bigrams, 100) if target_bigrams
+            else dict(bigrams)
+        )
+        target_letters = list(letter_weights)
+        target_bigrams = list(bigram_weights)
+
+        words = self.find_words_by_keys(letter_weights, bigram_weights)
+        text = self.build_lesson_text(
+            words, length, letters=target_letters, bigrams=target_bigrams
+        )
+
+        return {
+            'title': (
+                f'Смешанная тренировка: {", ".join(target_letters)}; '
+                f'{", ".join(target_bigrams)}'
+            ),
+            'content': text,
+            'lesson_type': 'mixed',
+            'difficulty_level': difficulty,
+            'target': target_letters + target_bigrams,
+            'required_speed': 0,
+            'required_accuracy': 0.0,
+            'word_count': len(words),
+        }
+
+
+class LessonPool:
+    """
+    Пул заранее сгенерированных уроков пользователя (LESSON_POOL_SIZE
+    на набор параметров запроса). Урок из пула выдаётся одним запросом.
+    Промах генерации и сохранение сессии только ставят задачу
+    LessonPoolJob, уроки генерирует воркер - без фоновых потоков
+    в обработчиках запросов (на serverless они останавливаются после
+    ответа). Без воркера пул пуст и каждый урок генерируется в запросе
+    """
+
+    @staticmethod
+    def params(data):
+        """
+        Параметры запроса для пула (тип, сложность, длина) или None,
+        если заданы явные цели или пул отключён
+        """
+        if not settings.LESSON_POOL_SIZE:
+            return None
+        if data.get('target_letters') or data.get('target_bigrams'):
+            return None
+        return (
+            data.get('type', 'auto'),
+            data.get('difficulty', 1),
+            data.get('length', 200),
+        )
+
+    @staticmethod
+    def pop(user, params):
+        """Урок из пула с актуальными проблемными клавишами или None"""
+        fingerprint = LessonGenerator(user).target_fingerprint(params[0])
+        entry = LessonPool._entries(user, params).filter(
+            keys_fingerprint=fingerprint
+        ).first()
+
+        # Удаление без блокировок: урок достаётся тому запросу,
+        # который удалил строку
+        if entry and PooledLesson.objects.filter(pk=entry.pk).delete()[0]:
+            return entry.data
+        return None
+
+    @staticmethod
+    def refill(user, params=None):
+        """
+        Удаление устаревших уроков и пополнение пула до LESSON_POOL_SIZE.
+        Без params - для всех наборов параметров, уже бывших в пуле
+        """
+        if params:
+            params_list = [params]
+        else:
+            params_list = PooledLesson.objects.filter(user=user).values_list(
+                'request_type', 'difficulty', 'length'
+            ).distinct().order_by()
+
+        size = settings.LESSON_POOL_SIZE
+        for params in list(params_list):
+            generator = LessonGenerator(user)
+            fingerprint = generator.target_fingerprint(params[0])
+            entries = LessonPool._entries(user, params)
+            entries.exclude(keys_fingerprint=fingerprint).delete()
+
+            missing = size - entries.count()
+            PooledLesson.objects.bulk_create([
+                PooledLesson(
+                    user=user,
+                    request_type=params[0],
+                    difficulty=params[1],
+                    length=params[2],
+                    keys_fingerprint=fingerprint,
+                    data=generator.generate(*params),
+                )
+                for _ in range(missing)
+            ])
+
+            # Параллельные пополнения могли превысить размер пула
+            extra = list(
+                entries.order_by('-id').values_list('pk', flat=True)[size:]
+            )
+            if extra:
+                PooledLesson.objects.filter(pk__in=extra).delete()
+
+    @staticmethod
+    def schedule_refill(user, params=None):
+        """
+        Постановка задач пополнения пула для воркера.
+        Без params - для всех наборов параметров, уже бывших в пуле
+        """
+        if not settings.LESSON_POOL_SIZE:
+            return
+        if params:
+            params_list = [params]
+        else:
+            params_list = PooledLesson.objects.filter(user=user).values_list(
+                'request_type', 'difficulty', 'length'
+            ).distinct().order_by()
+        LessonPoolJob.objects.bulk_create(
+            [
+                LessonPoolJob(
+                    user=user, request_type=request_type,
+                    difficulty=difficulty, length=length
+                )
+                for request_type, difficulty, length in params_list
+            ],
+            ignore_conflicts=True
+        )
+
+    @staticmethod
+    def process(limit=20):
+        """
+        Обработка пачки задач пополнения пула. Ошибка пополнения
+        пишется в лог, задача снимается - следующий промах поставит её
+        снова. Возвращает количество обработанных задач
+        """
+        with transaction.atomic():
+            jobs = list(
+                LessonPoolJob.objects.select_for_update(
+                    skip_locked=True, of=('self',)
+                ).select_related('user').order_by('id')[:limit]
+            )
+            for job in jobs:
+                params = (job.request_type, job.difficulty, job.length)
+                try:
+                    with transaction.atomic():
+                        LessonPool.refill(job.user, params)
+                except Exception:
+                    logger.exception(
+                        'Ошибка пополнения пула: пользователь %s, %s',
+                        job.user_id, params
+                    )
+            LessonPoolJob.objects.filter(
+                pk__in=[job.pk for job in jobs]
+            ).delete()
+        return len(jobs)
+
+    @staticmethod
+    def _entries(user, params):
+        request_type, difficulty, length = params
+        return PooledLesson.objects.filter(
+            user=user,
+            request_type=request_type,
+            difficulty=difficulty,
+            length=length
+        )
+
+
+class LessonUnlockService:
+    """Доступность уроков курса и прогресс пользователя по ним"""
+
+    @staticmethod
+    def course_state(user):
+        """
+        Одним запросом (уроки LEFT JOIN прогресс пользователя):
+        {id урока: {'is_unlocked': ..., 'progress': краткий прогресс или None}}.
+        Урок доступен, если он первый (order_index = 1) или пройден
+        предыдущий по order_index урок
+        """
+        rows = Lesson.objects.annotate(
+            user_progress=FilteredRelation(
+                'userlessonprogress',
+                condition=Q(userlessonprogress__user=user)
+            )
+        ).values_list(
+            'id', 'order_index',
+            'user_progress__is_passed',
+            'user_progress__best_speed',
+            'user_progress__completion_count'
+        ).order_by('order_index', 'id')
+
+        passed_by_order = {}
+        state = {}
+        for lesson_id, order_index, is_passed, best_speed, count in rows:
+            # Среди уроков с одинаковым order_index учитывается первый
+            passed_by_order.setdefault(order_index, bool(is_passed))
+            state[lesson_id] = {
+                'order_index': order_index,
+                'progress': None if is_passed is None else {
+                    'is_passed': is_passed,
+                    'best_speed': best_speed,
+                    'completion_count': count
+                }
+            }
+
+        for lesson in state.values():
+            order_index = lesson.pop('order_index')
+            lesson['is_unlocked'] = (
+                order_index == 1 or passed_by_order.get(order_index - 1, False)
+            )
+        return state
+
+
+def _rank_problem_keys(rows, limit, min_occurrences, error_threshold):
+    """
+    Отбор клавиш с процентом ошибок > error_threshold
+    из строк (клавиша, нажатия, ошибки): пары (клавиша, процент ошибок)
+    по убыванию процента ошибок
+    """
+    problem_keys = []
+    for key, occurrences, errors in rows:
+        if not occurrences or occurrences < min_occurrences:
+            continue
+        error_rate = errors * 100 / occurrences
+        if error_rate > error_threshold:
+            problem_keys.append((key, error_rate))
+
+    problem_keys.sort(key=lambda x: x[1], reverse=True)
+    return problem_keys[:limit]
+
+
+def _weigh_from_db(keys_qs, chunk_size=2000):
+    """
+    Поток (слово, вес) по найденным связям слово - клавиша.
+    Вес - частотность слова, умноженная на число покрытых им клавиш
+    """
+    rows = keys_qs.values_list(
+        'word__word', 'word__frequency'
+    ).annotate(
+        coverage=Count('id')
+    ).order_by()
+
+    for word, frequency, coverage in rows.iterator(chunk_size=chunk_size):
+        yield word, frequency * coverage
+
+
+def _weigh_keys_from_db(letters, bigrams, chunk_size=2000):
+    """
+    Поток (слово, вес) по связям слово - буква и слово - биграмма.
+    Оба потока упорядочены по слову и сливаются без загрузки в память;
+    вес - частотность слова, умноженная на сумму весов его клавиш
+    """
+    streams = []
+    for model, key_field, weights in (
+        (DictionaryWordLetter, 'letter', letters),
+        (DictionaryWordBigram, 'bigram', bigrams),
+    ):
+        if weights:
+            streams.append(model.objects.filter(
+                **{f'{key_field}__in': list(weights)}
+            ).values_list(
+                'word_id', 'word__word', 'word__frequency', key_field
+            ).order_by('word_id').iterator(chunk_size=chunk_size))
+
+    # Буквы и биграммы различаются длиной, поэтому веса в одном словаре
+    weights = {**letters, **bigrams}
+    merged = heapq.merge(*streams, key=itemgetter(0))
+    for _, rows in groupby(merged, key=itemgetter(0)):
+        rows = list(rows)
+        _, word, frequency, _ = rows[0]
+        yield word, frequency * sum(weights[row[3]] for row in rows)
@@ -0,0 +1,30 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from . import catalog, dictionary_index
+from .models import Lesson, DictionaryWord, DictionaryWordLetter, DictionaryWordBigram
+
+
+@receiver(post_save, sender=DictionaryWord)
+@receiver(post_delete, sender=DictionaryWord)
+def invalidate_dictionary_index(sender, **kwargs):
+    """Словарь изменился - индекс в памяти устарел"""
+    dictionary_index.invalidate()
+
+
+@receiver(post_save, sender=DictionaryWord)
+def sync_word_keys(sender, instance, created, **kwargs):
+    """Обновление связей слова с буквами и биграммами"""
+    if not created:
+        instance.letter_keys.all().delete()
+        instance.bigram_keys.all().delete()
+
+    letters, bigrams = instance.build_keys()
+    DictionaryWordLetter.objects.bulk_create(letters, ignore_conflicts=True)
+    DictionaryWordBigram.objects.bulk_create(bigrams, ignore_conflicts=True)
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def bump_catalog_version(sender, **kwargs):
+    """Уроки изменились - кэш публичного каталога устарел"""
+    catalog.bump()
@@ -0,0 +1,93 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from lessons import dictionary_index
+from lessons.models import DictionaryWord
+from lessons.services import LessonGenerator
+
+User = get_user_model()
+
+WORDS = ['слово', 'стол', 'нос', 'каша', 'щука', 'мир']
+
+
+def create_word(word, frequency=1):
+    return DictionaryWord.objects.create(
+        word=word,
+        length=len(word),
+        frequency=frequency,
+        letters=''.join(sorted(set(word))),
+        bigrams=[word[i:i+2] for i in range(len(word) - 1)]
+    )
+
+
+class DictionaryIndexTest(TestCase):
+    """Модульные тесты индекса словаря в памяти"""
+
+    def setUp(self):
+        # Индекс живёт в памяти процесса и переживает откат транзакции теста
+        dictionary_index.invalidate()
+        for frequency, word in enumerate(WORDS, start=1):
+            create_word(word, frequency)
+        self.user = User.objects.create_user(username='testuser', password='12345')
+
+    def tearDown(self):
+        dictionary_index.invalidate()
+
+    def test_weigh(self):
+        """
+        Тест: веса слов по буквам и биграммам
+        Ожидается: слова с хотя бы одной из клавиш, вес - частотность,
+        умноженная на сумму весов покрытых клавиш
+        """
+        index = dictionary_index.get_index()
+
+        self.assertEqual(
+            dict(index.weigh_by_letters(['щ', 'р'])), {'щука': 5, 'мир': 6}
+        )
+        self.assertEqual(
+            dict(index.weigh_by_bigrams(['ст', 'ос'])), {'стол': 2, 'нос': 3}
+        )
+        self.assertEqual(
+            dict(index.weigh(letters={'о': 2}, bigrams={'ло': 3})),
+            {'слово': 1 * (2 + 3), 'стол': 2 * 2, 'нос': 3 * 2}
+        )
+        self.assertEqual(list(index.weigh_by_bigrams(['яя'])), [])
+
+    def test_generation_does_not_scan_dictionary(self):
+        """
+        Тест: поиск слов при построенном индексе
+        Ожидается: ни одного запроса к БД, найдены все подходящие слова
+        """
+        generator = LessonGenerator(self.user)
+        dictionary_index.get_index()
+
+        with self.assertNumQueries(0):
+            letters_words = generator.find_words_by_letters(['с'])
+            bigram_words = generator.find_words_by_bigrams(['ос', 'ка'])
+
+        self.assertCountEqual(letters_words, ['нос', 'стол', 'слово'])
+        self.assertCountEqual(bigram_words, ['щука', 'каша', 'нос'])
+
+    def test_sample_is_limited(self):
+        """
+        Тест: подходящих слов больше лимита
+        Ожидается: случайная выборка из limit разных подходящих слов
+        """
+        generator = LessonGenerator(self.user)
+        words = generator.find_words_by_letters(['о', 'а', 'и'], limit=3)
+
+        self.assertEqual(len(set(words)), 3)
+        self.assertTrue(set(words) <= set(WORDS))
+
+    def test_invalidated_on_dictionary_change(self):
+        """
+        Тест: слово добавлено и удалено
+        Ожидается: индекс перестраивается и видит изменения
+        """
+        generator = LessonGenerator(self.user)
+        self.assertEqual(generator.find_words_by_bigrams(['ёж']), [])
+
+        word = create_word('ёжик')
+        self.assertEqual(generator.find_words_by_bigrams(['ёж']), ['ёжик'])
+
+        word.delete()
+        self.assertEqual(generator.find_words_by_bigrams(['ёж']), [])
@@ -0,0 +1,79 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from lessons.models import (
+    DictionaryWord,
+    DictionaryWordLetter,
+    DictionaryWordBigram
+)
+from lessons.services import LessonGenerator
+from lessons.tests.test_dictionary_index import WORDS, create_word
+from stats.tests.test_query_plans import get_plan
+
+User = get_user_model()
+
+
+@override_settings(DICTIONARY_INDEX_ENABLED=False)
+class DictionarySQLSearchTest(TestCase):
+    """Поиск слов по таблицам связей слово - буква/биграмма"""
+
+    def setUp(self):
+        for frequency, word in enumerate(WORDS, start=1):
+            create_word(word, frequency)
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.generator = LessonGenerator(self.user)
+
+    def test_keys_linked_on_save(self):
+        """
+        Тест: слово сохранено и изменено
+        Ожидается: связи с буквами и биграммами соответствуют слову
+        """
+        word = DictionaryWord.objects.get(word='нос')
+        self.assertEqual(
+            sorted(word.letter_keys.values_list('letter', flat=True)),
+            ['н', 'о', 'с']
+        )
+
+        word.word = 'нож'
+        word.save()
+        self.assertEqual(
+            sorted(word.bigram_keys.values_list('bigram', flat=True)),
+            ['но', 'ож']
+        )
+
+    def test_find_words(self):
+        """
+        Тест: поиск слов через таблицы связей
+        Ожидается: те же слова, что и по индексу в памяти
+        """
+        self.assertCountEqual(
+            self.generator.find_words_by_letters(['с']),
+            ['нос', 'стол', 'слово']
+        )
+        self.assertCountEqual(
+            self.generator.find_words_by_bigrams(['ос', 'ка']),
+            ['щука', 'каша', 'нос']
+        )
+
+    def test_letter_lookup_uses_index(self):
+        """
+        Тест: план запроса поиска по буквам
+        Ожидается: используется индекс (letter, word)
+        """
+        plan = get_plan(
+            DictionaryWordLetter.objects.filter(
+                letter__in=['а', 'о']
+            ).values('word_id')
+        )
+        self.assertIn('dict_letter_word_idx', plan)
+
+    def test_bigram_lookup_uses_index(self):
+        """
+        Тест: план запроса поиска по биграммам
+        Ожидается: используется индекс (bigram, word)
+        """
+        plan = get_plan(
+            DictionaryWordBigram.objects.filter(
+                bigram__in=['ст', 'ос']
+            ).values('word_id')
+        )
+        self.assertIn('dict_bigram_word_idx', plan)
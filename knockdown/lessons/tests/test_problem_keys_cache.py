@@ -0,0 +1,109 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+from lessons import problem_keys_cache
+from lessons.services import LessonGenerator
+from stats.models import UserLetterTotals
+from stats.services import AggregationQueue
+
+User = get_user_model()
+
+
+# Пул уроков отключён: его фоновое пополнение здесь не проверяется
+@override_settings(LESSON_POOL_SIZE=0)
+class ProblemKeysCacheTest(APITestCase):
+    """Тесты кэша проблемных клавиш"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        UserLetterTotals.objects.create(
+            user=self.user, letter='ы', total_occurrences=50, total_errors=25
+        )
+
+    def create_session(self):
+        self.client.force_authenticate(user=self.user)
+        return self.client.post('/api/stats/sessions/', {
+            'total_duration_seconds': 60,
+            'total_characters_typed': 100,
+            'total_errors': 5,
+            'average_speed_wpm': 120,
+            'accuracy_percentage': 95,
+            'started_at': '2024-01-01T10:00:00Z',
+            'finished_at': '2024-01-01T10:01:00Z',
+            'letter_stats': [{
+                'letter': 'щ', 'occurrences': 40, 'errors': 30,
+                'average_hit_time_ms': 200
+            }]
+        }, format='json')
+
+    def test_repeated_analysis_served_from_cache(self):
+        """
+        Тест: повторный анализ с теми же параметрами и с другими
+        Ожидается: повтор без запросов к БД, другие параметры - промах
+        """
+        generator = LessonGenerator(self.user)
+        self.assertEqual(generator.get_problem_letters(), ['ы'])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(generator.get_problem_letters(), ['ы'])
+
+        with self.assertNumQueries(2):
+            generator.get_problem_letters(error_threshold=60)
+
+        self.assertEqual(
+            problem_keys_cache.stats(),
+            {'hits': 1, 'misses': 2, 'hit_rate': 0.333}
+        )
+
+    def test_session_ingest_invalidates_cache(self):
+        """
+        Тест: после анализа сохраняется сессия с новой проблемной буквой
+        Ожидается: кэш сброшен после фиксации, новая буква найдена
+        """
+        generator = LessonGenerator(self.user)
+        self.assertEqual(generator.get_problem_letters(), ['ы'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.create_session()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(generator.get_problem_letters(), ['щ', 'ы'])
+
+    @override_settings(STATS_ASYNC_AGGREGATION=True)
+    def test_worker_invalidates_cache(self):
+        """
+        Тест: сессия в очереди агрегации
+        Ожидается: кэш не меняется до обработки очереди и сброшен после
+        """
+        generator = LessonGenerator(self.user)
+        generator.get_problem_letters()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_session()
+        self.assertEqual(generator.get_problem_letters(), ['ы'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            AggregationQueue.process()
+        self.assertEqual(generator.get_problem_letters(), ['щ', 'ы'])
+
+    def test_stats_endpoint_admin_only(self):
+        """
+        Тест: счётчики кэша для пользователя и администратора
+        Ожидается: 403 для пользователя, счётчики для администратора
+        """
+        LessonGenerator(self.user).get_problem_letters()
+        url = '/api/lessons/generate/cache-stats/'
+
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(
+            self.client.get(url).status_code, status.HTTP_403_FORBIDDEN
+        )
+
+        admin = User.objects.create_superuser(username='admin', password='12345')
+        self.client.force_authenticate(user=admin)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['misses'], 1)
@@ -0,0 +1,87 @@
+import random
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from lessons import dictionary_index
+from lessons.sampling import weighted_sample
+from lessons.services import LessonGenerator
+from lessons.tests.test_dictionary_index import create_word
+
+User = get_user_model()
+
+
+class WeightedSampleTest(SimpleTestCase):
+    """Модульные тесты взвешенной выборки из потока"""
+
+    def test_sample_size_and_uniqueness(self):
+        """
+        Тест: поток больше и меньше размера выборки
+        Ожидается: не более k разных элементов, нулевые веса пропущены
+        """
+        rng = random.Random(1)
+        items = [(i, 1 + i % 3) for i in range(1000)]
+
+        sample = weighted_sample(iter(items), 30, rng)
+        self.assertEqual(len(sample), 30)
+        self.assertEqual(len(set(sample)), 30)
+
+        sample = weighted_sample([('a', 1), ('b', 0), ('c', 2)], 30, rng)
+        self.assertCountEqual(sample, ['a', 'c'])
+
+    def test_inclusion_follows_weights(self):
+        """
+        Тест: выбор одного элемента из двух с весами 1 и 9
+        Ожидается: частоты выбора близки к 10% и 90%
+        """
+        rng = random.Random(2)
+        counts = Counter(
+            weighted_sample([('light', 1), ('heavy', 9)], 1, rng)[0]
+            for _ in range(5000)
+        )
+        self.assertAlmostEqual(counts['heavy'] / 5000, 0.9, delta=0.02)
+
+
+class WordSamplingBackendsTest(TestCase):
+    """Одинаковое распределение слов для индекса в памяти и для БД"""
+
+    def setUp(self):
+        dictionary_index.invalidate()
+        # 'стол' покрывает обе биграммы, 'сто' - одну, 'ол' - одну
+        create_word('стол', frequency=1)
+        create_word('сто', frequency=2)
+        create_word('пол', frequency=6)
+        create_word('мир', frequency=100)
+        self.user = User.objects.create_user(username='testuser', password='12345')
+
+    def tearDown(self):
+        dictionary_index.invalidate()
+
+    def pick_counts(self):
+        generator = LessonGenerator(self.user, rng=random.Random(3))
+        return Counter(
+            generator.find_words_by_bigrams(['ст', 'ол'], limit=1)[0]
+            for _ in range(3000)
+        )
+
+    def assertDistribution(self, counts):
+        # Веса: стол 1*2, сто 2*1, пол 6*1 - всего 10
+        self.assertNotIn('мир', counts)
+        self.assertAlmostEqual(counts['стол'] / 3000, 0.2, delta=0.03)
+        self.assertAlmostEqual(counts['сто'] / 3000, 0.2, delta=0.03)
+        self.assertAlmostEqual(counts['пол'] / 3000, 0.6, delta=0.03)
+
+    def test_index_distribution(self):
+        """
+        Тест: выборка по индексу в памяти
+        Ожидается: вероятность выбора пропорциональна весу слова
+        """
+        self.assertDistribution(self.pick_counts())
+
+    @override_settings(DICTIONARY_INDEX_ENABLED=False)
+    def test_db_distribution(self):
+        """
+        Тест: выборка запросом к БД
+        Ожидается: то же распределение, что и по индексу
+        """
+        self.assertDistribution(self.pick_counts())
@@ -0,0 +1,307 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from lessons import dictionary_index
+from lessons.models import Lesson, UserLessonProgress
+from lessons.serializers import LessonListSerializer
+from lessons.services import (
+    LessonGenerator,
+    LessonUnlockService,
+    _weigh_keys_from_db
+)
+from lessons.tests.test_dictionary_index import WORDS, create_word
+from stats.models import (
+    TrainingSession,
+    LetterStatistics,
+    DailyLetterStatistics,
+    DailyBigramStatistics,
+    UserLetterTotals
+)
+
+User = get_user_model()
+
+
+class ProblemKeysAnalysisTest(TestCase):
+    """Модульные тесты каскадного анализа проблемных клавиш"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.generator = LessonGenerator(self.user)
+        self.today = timezone.now().date()
+
+    def add_letter(self, days_ago, letter, occurrences, errors):
+        DailyLetterStatistics.objects.create(
+            user=self.user,
+            date=self.today - timedelta(days=days_ago),
+            letter=letter,
+            total_occurrences=occurrences,
+            total_errors=errors,
+            average_hit_time_ms=150
+        )
+
+    def test_recent_window_wins_in_one_query(self):
+        """
+        Тест: проблемные буквы есть за последнюю неделю и раньше
+        Ожидается: выбрано 7-дневное окно, выполнен один запрос
+        """
+        self.add_letter(1, 'а', 20, 10)
+        self.add_letter(2, 'б', 20, 1)
+        self.add_letter(20, 'б', 20, 19)
+
+        with self.assertNumQueries(1):
+            letters = self.generator.get_problem_letters()
+
+        self.assertEqual(letters, ['а'])
+
+    def test_cascade_to_wider_window(self):
+        """
+        Тест: за последние 14 дней ошибок мало
+        Ожидается: выбрано первое окно (30 дней) с проблемными буквами,
+        отсортированными по проценту ошибок
+        """
+        self.add_letter(3, 'а', 30, 1)
+        self.add_letter(20, 'б', 20, 5)
+        self.add_letter(25, 'в', 20, 10)
+
+        with self.assertNumQueries(1):
+            letters = self.generator.get_problem_letters()
+
+        self.assertEqual(letters, ['в', 'б'])
+
+    def test_all_time_totals_fallback(self):
+        """
+        Тест: за год проблем нет, но есть старая статистика
+        Ожидается: используются итоги за всё время (второй запрос)
+        """
+        self.add_letter(10, 'а', 30, 0)
+        UserLetterTotals.objects.create(
+            user=self.user, letter='ы',
+            total_occurrences=50, total_errors=25
+        )
+
+        with self.assertNumQueries(2):
+            letters = self.generator.get_problem_letters()
+
+        self.assertEqual(letters, ['ы'])
+
+    def test_missing_totals_rebuilt_from_sessions(self):
+        """
+        Тест: за год проблем нет, итогов нет, но есть старые сессии
+        (история до появления итогов)
+        Ожидается: итоги пересобираются из статистики сессий
+        """
+        finished_at = timezone.now() - timedelta(days=400)
+        session = TrainingSession.objects.create(
+            user=self.user, total_duration_seconds=60,
+            total_characters_typed=50, total_errors=25,
+            average_speed_wpm=200, accuracy_percentage=50,
+            started_at=finished_at, finished_at=finished_at
+        )
+        LetterStatistics.objects.create(
+            session=session, user=self.user, letter='ы',
+            occurrences=50, errors=25, average_hit_time_ms=150
+        )
+
+        self.assertEqual(self.generator.get_problem_letters(), ['ы'])
+        self.assertTrue(
+            UserLetterTotals.objects.filter(user=self.user).exists()
+        )
+
+    def test_defaults_without_statistics(self):
+        """
+        Тест: статистики нет
+        Ожидается: частотные буквы и биграммы русского языка
+        """
+        self.assertEqual(
+            self.generator.get_problem_letters(limit=3), ['а', 'о', 'е']
+        )
+        self.assertEqual(
+            self.generator.get_problem_bigrams(limit=2), ['ст', 'но']
+        )
+
+    def test_bigrams_use_same_cascade(self):
+        """
+        Тест: проблемные биграммы в 90-дневном окне
+        Ожидается: они найдены тем же одним запросом
+        """
+        DailyBigramStatistics.objects.create(
+            user=self.user,
+            date=self.today - timedelta(days=60),
+            bigram='щу',
+            total_occurrences=10,
+            total_errors=5,
+            average_transition_time_ms=200
+        )
+
+        with self.assertNumQueries(1):
+            bigrams = self.generator.get_problem_bigrams()
+
+        self.assertEqual(bigrams, ['щу'])
+
+
+class MixedLessonTest(TestCase):
+    """Модульные тесты смешанного урока (буквы и биграммы)"""
+
+    def setUp(self):
+        cache.clear()
+        dictionary_index.invalidate()
+        for frequency, word in enumerate(WORDS, start=1):
+            create_word(word, frequency)
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.generator = LessonGenerator(self.user)
+        self.today = timezone.now().date()
+
+    def tearDown(self):
+        dictionary_index.invalidate()
+
+    def test_problem_keys_in_one_query(self):
+        """
+        Тест: проблемные буквы и биграммы в разных окнах
+        Ожидается: оба набора с процентом ошибок найдены одним запросом
+        """
+        DailyLetterStatistics.objects.create(
+            user=self.user, date=self.today - timedelta(days=2),
+            letter='щ', total_occurrences=20, total_errors=10,
+            average_hit_time_ms=150
+        )
+        DailyBigramStatistics.objects.create(
+            user=self.user, date=self.today - timedelta(days=60),
+            bigram='ка', total_occurrences=10, total_errors=4,
+            average_transition_time_ms=200
+        )
+
+        with self.assertNumQueries(1):
+            letters, bigrams = self.generator.get_problem_keys()
+
+        self.assertEqual(letters, [('щ', 50.0)])
+        self.assertEqual(bigrams, [('ка', 40.0)])
+
+    def test_totals_fallback_in_one_query(self):
+        """
+        Тест: оконной статистики нет, есть итоги только по буквам
+        Ожидается: итоги обеих таблиц читаются вторым запросом,
+        для биграмм - частотные по умолчанию
+        """
+        UserLetterTotals.objects.create(
+            user=self.user, letter='ы', total_occurrences=50, total_errors=25
+        )
+
+        with self.assertNumQueries(2):
+            letters, bigrams = self.generator.get_problem_keys()
+
+        self.assertEqual(letters, [('ы', 50.0)])
+        self.assertEqual([key for key, _ in bigrams], ['ст', 'но', 'то'])
+
+    def test_db_weights_match_index(self):
+        """
+        Тест: веса слов по буквам и биграммам из индекса и из БД
+        Ожидается: одинаковые; слово с обеими клавишами весит больше
+        """
+        letters = {'щ': 50, 'р': 20}
+        bigrams = {'ка': 40, 'ст': 30}
+
+        from_index = dict(dictionary_index.get_index().weigh(letters, bigrams))
+        from_db = dict(_weigh_keys_from_db(letters, bigrams))
+
+        self.assertEqual(from_index, from_db)
+        # щука: частотность 5, покрыты 'щ' и 'ка'
+        self.assertEqual(from_db['щука'], 5 * (50 + 40))
+        self.assertNotIn('нос', from_db)
+
+    @override_settings(DICTIONARY_INDEX_ENABLED=False)
+    def test_generate_mixed_lesson(self):
+        """
+        Тест: генерация урока типа mixed
+        Ожидается: один пул слов по обоим наборам, без отдельных
+        генераторов букв и биграмм; текст нужной длины
+        """
+        with mock.patch.object(
+            LessonGenerator, 'generate_letter_lesson'
+        ) as letter_lesson, mock.patch.object(
+            LessonGenerator, 'generate_bigram_lesson'
+        ) as bigram_lesson:
+            lesson = self.generator.generate(
+                type='mixed', length=120,
+                target_letters=['щ'], target_bigrams=['ст']
+            )
+
+        letter_lesson.assert_not_called()
+        bigram_lesson.assert_not_called()
+        self.assertEqual(lesson['lesson_type'], 'mixed')
+        self.assertEqual(lesson['target'], ['щ', 'ст'])
+        self.assertEqual(len(lesson['content']), 120)
+        self.assertEqual(lesson['word_count'], 2)
+        for word in lesson['content'].split():
+            self.assertTrue('щ' in word or 'ст' in word, word)
+
+
+class LessonUnlockServiceTest(TestCase):
+    """Модульные тесты доступности уроков курса"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.other = User.objects.create_user(username='other', password='12345')
+        self.lessons = [
+            Lesson.objects.create(
+                title=f'Урок {index}', content='текст', order_index=index,
+                required_speed=100, required_accuracy=90
+            )
+            for index in range(1, 6)
+        ]
+        for lesson in self.lessons[0], self.lessons[2]:
+            UserLessonProgress.objects.create(
+                user=self.user, lesson=lesson, is_passed=True
+            )
+        UserLessonProgress.objects.create(
+            user=self.user, lesson=self.lessons[3], completion_count=1
+        )
+        # Прогресс другого пользователя не влияет на доступность
+        UserLessonProgress.objects.create(
+            user=self.other, lesson=self.lessons[1], is_passed=True
+        )
+
+    def test_course_unlock_vector_in_one_query(self):
+        """
+        Тест: пройдены уроки 1 и 3, урок 4 начат
+        Ожидается: доступны 1, 2 и 4; прогресс только у начатых уроков
+        """
+        with self.assertNumQueries(1):
+            state = LessonUnlockService.course_state(self.user)
+
+        self.assertEqual(
+            [state[lesson.id]['is_unlocked'] for lesson in self.lessons],
+            [True, True, False, True, False]
+        )
+        self.assertIsNone(state[self.lessons[1].id]['progress'])
+        self.assertEqual(
+            state[self.lessons[3].id]['progress'],
+            {'is_passed': False, 'best_speed': 0, 'completion_count': 1}
+        )
+
+    def test_list_serializer_reads_course_state_once(self):
+        """
+        Тест: сериализация списка уроков для пользователя
+        Ожидается: доступность и прогресс берутся из одного запроса
+        """
+        request = RequestFactory().get('/api/lessons/')
+        request.user = self.user
+
+        with self.assertNumQueries(1):
+            data = LessonListSerializer(
+                self.lessons, many=True, context={'request': request}
+            ).data
+
+        self.assertEqual(
+            [item['is_unlocked'] for item in data],
+            [True, True, False, True, False]
+        )
+        self.assertEqual(
+            data[2]['progress'],
+            {'is_passed': True, 'best_speed': 0, 'completion_count': 0}
+        )
+        self.assertIsNone(data[1]['progress'])
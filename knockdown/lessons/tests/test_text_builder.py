@@ -0,0 +1,82 @@
+import random
+
+from django.test import SimpleTestCase
+from lessons.text_builder import LessonTextBuilder
+
+WORDS = [
+    'стол', 'сто', 'пол', 'мир', 'щука', 'каша', 'слово', 'нос',
+    'привет', 'абажур', 'август', 'автощётка', 'ёж', 'пространство',
+]
+
+
+def density(text, letters):
+    return sum(char in letters for char in text) / len(text)
+
+
+class LessonTextBuilderTest(SimpleTestCase):
+    """Модульные тесты сборки текста урока"""
+
+    def test_exact_length_over_full_range(self):
+        """
+        Тест: все длины, допустимые GenerateLessonRequestSerializer
+        Ожидается: длина текста ровно равна запрошенной,
+        текст не начинается и не заканчивается пробелом
+        """
+        builder = LessonTextBuilder(
+            WORDS, letters=['о', 'а'], rng=random.Random(1)
+        )
+        for length in range(50, 501):
+            text = builder.build(length)
+            self.assertEqual(len(text), length)
+            self.assertEqual(text, text.strip())
+            self.assertNotIn('  ', text)
+
+    def test_target_density(self):
+        """
+        Тест: целевая плотность букв 30%
+        Ожидается: плотность в тексте не ниже целевой (с допуском на добор)
+        """
+        builder = LessonTextBuilder(
+            WORDS, letters=['о', 'а'], density=0.3, rng=random.Random(2)
+        )
+        for length in (100, 200, 500):
+            self.assertGreaterEqual(
+                density(builder.build(length), {'о', 'а'}), 0.28
+            )
+
+    def test_bigram_targets(self):
+        """
+        Тест: целевые биграммы
+        Ожидается: слова с биграммами встречаются чаще остальных
+        """
+        builder = LessonTextBuilder(
+            WORDS, bigrams=['ст'], density=0.3, rng=random.Random(3)
+        )
+        words = builder.build(500).split()
+        with_bigram = sum('ст' in word for word in words)
+        self.assertGreater(with_bigram, len(words) / 2)
+
+    def test_controlled_repetition(self):
+        """
+        Тест: кандидатов мало для длинного текста
+        Ожидается: слова повторяются, но не идут подряд
+        """
+        builder = LessonTextBuilder(
+            ['кот', 'лес', 'дом'], letters=['к'], density=0,
+            rng=random.Random(4)
+        )
+        words = builder.build(500).split()
+        # Последние слова - точный добор длины, их не проверяем
+        for first, second in zip(words[:-3], words[1:-3]):
+            self.assertNotEqual(first, second)
+
+    def test_without_candidates(self):
+        """
+        Тест: в словаре нет подходящих слов
+        Ожидается: текст из самих целевых клавиш нужной длины
+        """
+        builder = LessonTextBuilder(
+            [], bigrams=['щъ'], rng=random.Random(5)
+        )
+        self.assertEqual(len(builder.build(50)), 50)
+        self.assertEqual(LessonTextBuilder([]).build(50), '')
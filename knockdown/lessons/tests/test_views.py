@@ -0,0 +1,363 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils import timezone
+from django.utils.http import parse_http_date
+from rest_framework import status
+from rest_framework.test import APITestCase
+from lessons import catalog, dictionary_index
+from lessons.models import (
+    Lesson,
+    LessonPoolJob,
+    PooledLesson,
+    UserLessonProgress
+)
+from lessons.services import LessonGenerator, LessonPool
+from lessons.tests.test_dictionary_index import WORDS, create_word
+from stats.models import UserLetterTotals
+
+User = get_user_model()
+
+
+@override_settings(LESSON_POOL_SIZE=3)
+class LessonPoolAPITest(APITestCase):
+    """Интеграционные тесты пула заранее сгенерированных уроков"""
+
+    def setUp(self):
+        cache.clear()
+        dictionary_index.invalidate()
+        for frequency, word in enumerate(WORDS, start=1):
+            create_word(word, frequency)
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.client.force_authenticate(user=self.user)
+        self.url = '/api/lessons/generate/'
+
+    def tearDown(self):
+        dictionary_index.invalidate()
+
+    def generate(self, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def test_pool_filled_after_miss_and_served(self):
+        """
+        Тест: запросы генерации подряд и воркер между ними
+        Ожидается: промах генерирует один урок и ставит одну задачу
+        пополнения, воркер заполняет пул, следующие запросы получают
+        уроки из пула, после опустошения пула - снова промах и задача
+        """
+        with mock.patch.object(
+            LessonGenerator, 'generate', autospec=True,
+            side_effect=LessonGenerator.generate
+        ) as generate:
+            for _ in range(2):
+                response = self.generate(length=100)
+                self.assertEqual(response['X-Lesson-Pool'], 'miss')
+        self.assertEqual(generate.call_count, 2)
+        self.assertFalse(PooledLesson.objects.exists())
+        self.assertEqual(LessonPoolJob.objects.count(), 1)
+
+        self.assertEqual(LessonPool.process(), 1)
+        self.assertFalse(LessonPoolJob.objects.exists())
+        self.assertEqual(PooledLesson.objects.count(), 3)
+
+        pooled = PooledLesson.objects.first()
+        response = self.generate(length=100)
+        self.assertEqual(response['X-Lesson-Pool'], 'hit')
+        self.assertEqual(response.data['content'], pooled.data['content'])
+        self.assertEqual(len(response.data['content']), 100)
+        self.assertEqual(PooledLesson.objects.count(), 2)
+
+        for _ in range(2):
+            self.generate(length=100)
+        self.assertFalse(PooledLesson.objects.exists())
+        response = self.generate(length=100)
+        self.assertEqual(response['X-Lesson-Pool'], 'miss')
+        self.assertEqual(LessonPoolJob.objects.count(), 1)
+
+    def test_pool_expires_when_problem_keys_change(self):
+        """
+        Тест: после заполнения пула сохранена сессия с новой проблемной буквой
+        Ожидается: устаревшие уроки не выдаются, при промахе заменены
+        уроками на новую букву
+        """
+        self.generate()
+        LessonPool.process()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/stats/sessions/', {
+                'total_duration_seconds': 60,
+                'total_characters_typed': 100,
+                'total_errors': 5,
+                'average_speed_wpm': 120,
+                'accuracy_percentage': 95,
+                'started_at': '2024-01-01T10:00:00Z',
+                'finished_at': '2024-01-01T10:01:00Z',
+                'letter_stats': [{
+                    'letter': 'щ', 'occurrences': 40, 'errors': 30,
+                    'average_hit_time_ms': 200
+                }]
+            }, format='json')
+
+        # Сохранение сессии ставит задачу пополнения пула
+        self.assertEqual(LessonPoolJob.objects.count(), 1)
+        response = self.generate()
+        self.assertEqual(response['X-Lesson-Pool'], 'miss')
+        self.assertEqual(response.data['target'], ['щ'])
+
+        LessonPool.process()
+        self.assertEqual(PooledLesson.objects.count(), 3)
+        self.assertEqual(
+            PooledLesson.objects.values('keys_fingerprint').distinct().count(),
+            1
+        )
+
+        response = self.generate()
+        self.assertEqual(response['X-Lesson-Pool'], 'hit')
+        self.assertEqual(response.data['target'], ['щ'])
+
+    def test_stale_pool_falls_back_to_live_generation(self):
+        """
+        Тест: проблемные клавиши сменились, пул ещё не пополнен
+        Ожидается: урок генерируется в запросе по новым клавишам
+        """
+        self.generate()
+        LessonPool.process()
+        UserLetterTotals.objects.create(
+            user=self.user, letter='ы', total_occurrences=50, total_errors=25
+        )
+        cache.clear()
+
+        response = self.client.post(self.url, {}, format='json')
+
+        self.assertEqual(response['X-Lesson-Pool'], 'miss')
+        self.assertEqual(response.data['target'], ['ы'])
+
+    def test_explicit_targets_bypass_pool(self):
+        """
+        Тест: запрос с явными целевыми буквами
+        Ожидается: урок генерируется в запросе, пул не создаётся
+        """
+        response = self.generate(target_letters=['щ'])
+
+        self.assertEqual(response['X-Lesson-Pool'], 'miss')
+        self.assertFalse(PooledLesson.objects.exists())
+        self.assertFalse(LessonPoolJob.objects.exists())
+
+    def test_failed_refill_logged_and_dropped(self):
+        """
+        Тест: пополнение пула воркером падает
+        Ожидается: ошибка в логе, задача снята, пул пуст
+        """
+        self.generate()
+        with mock.patch.object(
+            LessonPool, 'refill', side_effect=RuntimeError('сбой')
+        ), self.assertLogs('lessons.services', 'ERROR'):
+            self.assertEqual(LessonPool.process(), 1)
+
+        self.assertFalse(LessonPoolJob.objects.exists())
+        self.assertFalse(PooledLesson.objects.exists())
+
+    def test_pool_size_bounded(self):
+        """
+        Тест: повторные пополнения пула
+        Ожидается: уроков не больше LESSON_POOL_SIZE на набор параметров
+        """
+        params = ('auto', 1, 200)
+        for _ in range(3):
+            LessonPool.refill(self.user, params)
+        PooledLesson.objects.bulk_create([
+            PooledLesson(
+                user=self.user, request_type='auto', difficulty=1,
+                length=200, keys_fingerprint='x', data={}
+            )
+        ])
+        LessonPool.refill(self.user)
+
+        self.assertEqual(PooledLesson.objects.count(), 3)
+
+
+class LessonListAPITest(APITestCase):
+    """Интеграционные тесты списка уроков"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.url = '/api/lessons/lessons/'
+
+    def create_lessons(self, count):
+        start = Lesson.objects.count() + 1
+        lessons = Lesson.objects.bulk_create([
+            Lesson(
+                title=f'Урок {index}',
+                content='текст',
+                order_index=index,
+                required_speed=100,
+                required_accuracy=90
+            )
+            for index in range(start, start + count)
+        ])
+        UserLessonProgress.objects.bulk_create([
+            UserLessonProgress(
+                user=self.user, lesson=lesson, best_speed=120,
+                completion_count=2, is_passed=True
+            )
+            for lesson in lessons[::2]
+        ])
+        # bulk_create не отправляет сигналы - версия каталога вручную
+        catalog.bump()
+        return lessons
+
+    def test_progress_queries_do_not_grow_with_lessons(self):
+        """
+        Тест: список из 3 и из 100 уроков с прогрессом пользователя
+        Ожидается: одинаковое число запросов (уроки + прогресс)
+        """
+        self.client.force_authenticate(user=self.user)
+        lessons = self.create_lessons(3)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data[0]['progress'], {
+            'is_passed': True, 'best_speed': 120, 'completion_count': 2
+        })
+        self.assertIsNone(response.data[1]['progress'])
+
+        self.create_lessons(97)
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.data), 100)
+        self.assertEqual(response.data[0]['id'], lessons[0].id)
+
+    def test_anonymous_list_without_progress_queries(self):
+        """
+        Тест: список уроков без авторизации
+        Ожидается: один запрос, прогресс пустой
+        """
+        self.create_lessons(5)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertTrue(all(item['progress'] is None for item in response.data))
+
+    def test_list_and_detail_unlock_state(self):
+        """
+        Тест: пройден каждый второй урок, запрос списка и деталей
+        Ожидается: is_unlocked в списке без лишних запросов,
+        в деталях - то же значение
+        """
+        self.client.force_authenticate(user=self.user)
+        lessons = self.create_lessons(4)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(
+            [item['is_unlocked'] for item in response.data],
+            [True, True, False, True]
+        )
+
+        response = self.client.get(f'{self.url}{lessons[2].id}/')
+        self.assertFalse(response.data['is_unlocked'])
+        response = self.client.get(f'{self.url}{lessons[3].id}/')
+        self.assertTrue(response.data['is_unlocked'])
+
+        self.client.force_authenticate(user=None)
+        response = self.client.get(f'{self.url}{lessons[1].id}/')
+        self.assertFalse(response.data['is_unlocked'])
+
+    def test_anonymous_conditional_request_without_db(self):
+        """
+        Тест: повторный анонимный запрос с If-None-Match / If-Modified-Since
+        Ожидается: 304 без запросов к БД
+        """
+        self.create_lessons(3)
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        last_modified = response['Last-Modified']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                self.url, HTTP_IF_MODIFIED_SINCE=last_modified
+            )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_deleted_lesson_moves_last_modified_forward(self):
+        """
+        Тест: удалён урок, изменённый позже остальных
+        Ожидается: Last-Modified списка не уходит назад,
+        If-Modified-Since с прежним значением получает новый список
+        """
+        lessons = self.create_lessons(3)
+        past = timezone.now() - timedelta(hours=1)
+        Lesson.objects.update(updated_at=past)
+        Lesson.objects.filter(pk=lessons[2].pk).update(
+            updated_at=past + timedelta(minutes=10)
+        )
+        cache.clear()
+        last_modified = self.client.get(self.url)['Last-Modified']
+
+        lessons[2].delete()
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+        self.assertGreater(
+            parse_http_date(response['Last-Modified']),
+            parse_http_date(last_modified)
+        )
+
+    def test_lesson_change_invalidates_catalog(self):
+        """
+        Тест: урок изменён после кэширования каталога и деталей
+        Ожидается: новый ETag и новые данные в списке и деталях
+        """
+        lesson = self.create_lessons(2)[1]
+        list_etag = self.client.get(self.url)['ETag']
+        detail_url = f'{self.url}{lesson.id}/'
+        detail_etag = self.client.get(detail_url)['ETag']
+
+        lesson.title = 'Новое название'
+        lesson.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[1]['title'], 'Новое название')
+
+        response = self.client.get(detail_url, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], detail_etag)
+
+        lesson.delete()
+        self.assertEqual(
+            self.client.get(detail_url).status_code,
+            status.HTTP_404_NOT_FOUND
+        )
+
+    def test_authenticated_etag_includes_progress(self):
+        """
+        Тест: прогресс пользователя изменился при неизменном каталоге
+        Ожидается: прогресс поверх кэша каталога, ETag изменился
+        """
+        lesson = self.create_lessons(2)[1]
+        self.client.force_authenticate(user=self.user)
+        etag = self.client.get(self.url)['ETag']
+
+        UserLessonProgress.objects.create(
+            user=self.user, lesson=lesson, best_speed=90
+        )
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[1]['progress']['best_speed'], 90)
@@ -0,0 +1,145 @@
+import random
+
+
+class LessonTextBuilder:
+    """
+    Сборка текста урока из слов-кандидатов:
+    - длина текста ровно равна запрошенной;
+    - доля символов, входящих в целевые буквы/биграммы, не ниже density
+      (если среди кандидатов есть достаточно «насыщенные» слова);
+    - слова повторяются равномерно (по кругу, с перемешиванием);
+    - время работы линейно по длине текста.
+    """
+
+    def __init__(self, words, letters=(), bigrams=(), density=0.25, rng=None):
+        self.rng = rng or random.Random()
+        self.density = density
+        self.letters = set(letters)
+        self.bigrams = set(bigrams)
+
+        words = list(dict.fromkeys(word for word in words if word))
+        if not words:
+            # Слов нет - тренируются сами целевые клавиши
+            words = list(dict.fromkeys([*bigrams, *letters]))
+
+        self.hits = {word: self._count_hits(word) for word in words}
+        self.rich = [
+            word for word in words
+            if self.hits[word] >= self.density * (len(word) + 1)
+        ]
+        self.poor = [word for word in words if word not in self.rich]
+
+        # Слова по длине - для точного добора в конце текста
+        self.by_length = {}
+        for word in sorted(words, key=lambda w: -self.hits[w]):
+            self.by_length.setdefault(len(word), word)
+        self.max_length = max((len(word) for word in words), default=0)
+
+    def _count_hits(self, word):
+        """Количество символов слова, входящих в целевые клавиши"""
+        covered = set()
+        for i, char in enumerate(word):
+            if char in self.letters:
+                covered.add(i)
+            if word[i:i+2] in self.bigrams:
+                covered.update((i, i + 1))
+        return len(covered)
+
+    def build(self, length):
+        if not self.hits or length <= 0:
+            return ''
+
+        rich = _RoundRobin(self.rich, self.rng)
+        poor = _RoundRobin(self.poor, self.rng)
+        parts = []
+        size = 0
+        hits = 0
+
+        # Основная часть: слова добавляются, пока остаётся место на
+        # точный добор (до двух самых длинных слов с пробелами)
+        while length - size > 2 * (self.max_length + 1):
+            # «Бедное» слово берётся, только если плотность после него
+            # не опустится ниже целевой
+            if poor.empty or (
+                not rich.empty
+                and hits < self.density * (size + 1 + len(poor.peek()))
+            ):
+                word = rich.next()
+            else:
+                word = poor.next()
+            size += len(word) + (1 if parts else 0)
+            hits += self.hits[word]
+            parts.append(word)
+
+        parts.extend(self._finish(length - size, first=not parts))
+        return ' '.join(parts)
+
+    def _finish(self, remaining, first):
+        """Слова, занимающие ровно remaining символов (с пробелами)"""
+        tail = []
+        while remaining > 0:
+            # Каждый шаг оставляет не меньше двух символов (пробел и буква),
+            # поэтому need всегда положительно
+            sep = 0 if first and not tail else 1
+            need = remaining - sep
+
+            word = self.by_length.get(need)
+            if word:
+                tail.append(word)
+                break
+
+            pair = self._find_pair(need)
+            if pair:
+                tail.extend(pair)
+                break
+
+            # Самое длинное слово, после которого остаётся хотя бы
+            # пробел и один символ
+            fitting = [
+                n for n in self.by_length if n + 2 <= need
+            ]
+            if fitting:
+                word = self.by_length[max(fitting)]
+            else:
+                # Подходящих слов нет - обрезается самое «насыщенное»
+                word = max(self.hits, key=self.hits.get)
+                word = (word * (need // len(word) + 1))[:need]
+            tail.append(word)
+            remaining -= sep + len(word)
+        return tail
+
+    def _find_pair(self, need):
+        """Два слова с пробелом между ними длиной ровно need"""
+        for first_length, first in self.by_length.items():
+            second = self.by_length.get(need - first_length - 1)
+            if second:
+                return [first, second]
+        return None
+
+
+class _RoundRobin:
+    """Бесконечный перебор слов по кругу с перемешиванием каждого круга"""
+
+    def __init__(self, words, rng):
+        self.words = list(words)
+        self.rng = rng
+        self.position = len(self.words)
+        self.last = None
+
+    @property
+    def empty(self):
+        return not self.words
+
+    def peek(self):
+        if self.position >= len(self.words):
+            self.rng.shuffle(self.words)
+            # Одно слово не повторяется подряд на границе кругов
+            if len(self.words) > 1 and self.words[0] == self.last:
+                self.words[0], self.words[-1] = self.words[-1], self.words[0]
+            self.position = 0
+        return self.words[self.position]
+
+    def next(self):
+        self.last = self.peek()
+        self.position += 1
+        return self.last
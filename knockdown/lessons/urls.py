@@ -4,7 +4,8 @@ from .views import (
     LessonViewSet,
     UserLessonProgressListAPIView,
     UserLessonProgressDetailAPIView,
-    GenerateLessonView
+    GenerateLessonView,
+    ProblemKeysCacheStatsView
 )
 
 router = DefaultRouter()
@@ -22,5 +23,6 @@ urlpatterns = [
     ),
 
     path('generate/', GenerateLessonView.as_view()),
+    path('generate/cache-stats/', ProblemKeysCacheStatsView.as_view()),
     # path('recommended/', views.RecommendedLessonsView.as_view()), # Доп. функционал
 ]
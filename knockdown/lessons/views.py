@@ -1,4 +1,11 @@
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers
+)
+from django.utils.http import http_date
 from rest_framework import viewsets, permissions, status
 from rest_framework.views import APIView
 from rest_framework.decorators import action
@@ -12,7 +19,8 @@ from .serializers import (
     GenerateLessonRequestSerializer,
     GeneratedLessonResponseSerializer
 )
-from .services import LessonGenerator
+from .services import LessonGenerator, LessonPool, LessonUnlockService
+from . import catalog, problem_keys_cache
 
 
 class LessonViewSet(viewsets.ModelViewSet):
@@ -26,6 +34,77 @@ class LessonViewSet(viewsets.ModelViewSet):
             return LessonDetailSerializer
         return LessonSerializer
 
+    def list(self, request, *args, **kwargs):
+        """Каталог из кэша, прогресс пользователя - поверх него"""
+        entry = catalog.get_list()
+
+        def merge(data):
+            course_state = LessonUnlockService.course_state(request.user)
+            for item in data:
+                lesson_state = course_state.get(item['id'])
+                if lesson_state:
+                    item['progress'] = lesson_state['progress']
+                    item['is_unlocked'] = lesson_state['is_unlocked']
+            return data
+
+        return self.catalog_response(request, entry, merge)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Урок из кэша каталога, прогресс пользователя - поверх него"""
+        try:
+            entry = catalog.get_detail(int(kwargs['pk']))
+        except ValueError:
+            entry = None
+        if entry is None:
+            raise Http404
+
+        def merge(data):
+            progress = UserLessonProgress.objects.filter(
+                user=request.user, lesson_id=data['id']
+            ).select_related('lesson').first()
+            data['user_progress'] = (
+                UserLessonProgressSerializer(progress).data
+                if progress else None
+            )
+            lesson_state = LessonUnlockService.course_state(
+                request.user
+            ).get(data['id'])
+            data['is_unlocked'] = bool(
+                lesson_state and lesson_state['is_unlocked']
+            )
+            return data
+
+        return self.catalog_response(request, entry, merge)
+
+    def catalog_response(self, request, entry, merge):
+        """
+        Ответ с ETag и Last-Modified. Анонимный запрос обслуживается
+        целиком из кэша, включая 304 на условный запрос; авторизованному
+        ETag считается по ответу с его прогрессом
+        """
+        if request.user.is_authenticated:
+            data = merge(entry['data'])
+            etag = catalog.etag(data)
+            last_modified = None
+        else:
+            data = entry['data']
+            etag = entry['etag']
+            last_modified = entry['last_modified']
+
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            response = Response(data)
+
+        response['ETag'] = etag
+        if timestamp:
+            response['Last-Modified'] = http_date(timestamp)
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ['Authorization'])
+        return response
+
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
             return [permissions.AllowAny()]
@@ -84,15 +163,37 @@ class GenerateLessonView(APIView):
         request_serializer = GenerateLessonRequestSerializer(data=request.data)
         request_serializer.is_valid(raise_exception=True)
 
-        generator = LessonGenerator(request.user)
-        lesson_data = generator.generate(**request_serializer.validated_data)
+        # Готовый урок из пула, иначе - генерация в запросе
+        params = LessonPool.params(request_serializer.validated_data)
+        lesson_data = LessonPool.pop(request.user, params) if params else None
+        from_pool = lesson_data is not None
+
+        if not from_pool:
+            generator = LessonGenerator(request.user)
+            lesson_data = generator.generate(
+                **request_serializer.validated_data
+            )
+            # Промах: пул пополнит воркер, этот запрос генерирует
+            # только свой урок
+            if params:
+                LessonPool.schedule_refill(request.user, params)
 
         response_serializer = GeneratedLessonResponseSerializer(
             data=lesson_data
         )
         response_serializer.is_valid(raise_exception=True)
 
-        return Response(response_serializer.data, status=status.HTTP_200_OK)
+        response = Response(response_serializer.data, status=status.HTTP_200_OK)
+        response['X-Lesson-Pool'] = 'hit' if from_pool else 'miss'
+        return response
+
+
+class ProblemKeysCacheStatsView(APIView):
+    """Счётчики попаданий и промахов кэша проблемных клавиш"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(problem_keys_cache.stats())
 
 
 # Доп. функционал
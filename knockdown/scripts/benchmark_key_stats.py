@@ -0,0 +1,90 @@
+"""
+Бенчмарк подсчёта статистики по клавишам из исходного ввода
+(stats.timeline): векторный проход NumPy против цикла по нажатиям.
+
+    python scripts/benchmark_key_stats.py [--keystrokes 2000] [--repeat 200]
+"""
+import argparse
+import random
+import sys
+import timeit
+from collections import defaultdict
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+
+from stats import timeline  # noqa: E402
+
+TEXT = 'съешь же ещё этих мягких французских булок да выпей чаю '
+
+
+def make_input(keystrokes, seed=0):
+    """Текст урока, набранный текст с 5% ошибок и моменты нажатий"""
+    rng = random.Random(seed)
+    text = (TEXT * (keystrokes // len(TEXT) + 1))[:keystrokes]
+    typed = ''.join(
+        char if rng.random() > 0.05 else rng.choice('фыва') for char in text
+    )
+    timestamps = []
+    moment = 0
+    for _ in text:
+        timestamps.append(moment)
+        moment += rng.randint(60, 400)
+    return text, typed, timestamps
+
+
+def loop_key_stats(text, typed, timestamps):
+    """Та же статистика обычным циклом по нажатиям"""
+    letters = defaultdict(lambda: [0, 0, 0, 0])
+    bigrams = defaultdict(lambda: [0, 0, 0, 0])
+    for i, typed_char in enumerate(typed):
+        char = text[i]
+        error = typed_char != char
+        interval = timestamps[i] - timestamps[i - 1] if i else 0
+        key = '\\s' if char == ' ' else char.lower()
+        row = letters[key]
+        row[0] += 1
+        row[1] += error
+        if interval:
+            row[2] += interval
+            row[3] += 1
+        if i and not char.isspace() and not text[i - 1].isspace():
+            row = bigrams[text[i - 1].lower() + char.lower()]
+            row[0] += 1
+            row[1] += error
+            if interval:
+                row[2] += interval
+                row[3] += 1
+    return letters, bigrams
+
+
+def vectorized_key_stats(text, typed, timestamps):
+    return timeline.key_stats(
+        timeline.from_raw_input(text, typed, timestamps)
+    )
+
+
+def best_ms(func, args, repeat):
+    """Лучшее время одного вызова, мс"""
+    return min(timeit.repeat(lambda: func(*args), number=1, repeat=repeat)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--keystrokes', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    raw = make_input(args.keystrokes)
+    vectorized = best_ms(vectorized_key_stats, raw, args.repeat)
+    loop = best_ms(loop_key_stats, raw, args.repeat)
+
+    print(f'Нажатий: {args.keystrokes}')
+    print(f'NumPy:  {vectorized:.3f} мс')
+    print(f'Цикл:   {loop:.3f} мс')
+    print(f'Ускорение: {loop / vectorized:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
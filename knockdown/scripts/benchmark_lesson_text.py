@@ -0,0 +1,55 @@
+"""
+Бенчмарк сборки текста урока (lessons.text_builder): тексты всех длин,
+допустимых GenerateLessonRequestSerializer (50..500 символов).
+
+    python scripts/benchmark_lesson_text.py [--words 600] [--repeat 20]
+"""
+import argparse
+import random
+import sys
+import timeit
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+
+from lessons.text_builder import LessonTextBuilder  # noqa: E402
+
+DICTIONARY = BASE_DIR / 'scripts' / 'russian_dict.txt'
+LENGTHS = range(50, 501)
+
+
+def load_words(count):
+    """Первые count слов словаря (без слов с дефисом)"""
+    with open(DICTIONARY, encoding='utf-8') as f:
+        words = [line.strip() for line in f if line.strip()]
+    return [word for word in words if '-' not in word][:count]
+
+
+def build_all(builder):
+    for length in LENGTHS:
+        builder.build(length)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--words', type=int, default=600)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    words = load_words(args.words)
+    builder = LessonTextBuilder(
+        words, letters=['о', 'а'], bigrams=['ст'], rng=random.Random(0)
+    )
+    best = min(
+        timeit.repeat(lambda: build_all(builder), number=1, repeat=args.repeat)
+    ) * 1000
+
+    print(f'Слов-кандидатов: {len(words)}')
+    print(f'Текстов: {len(LENGTHS)} ({LENGTHS.start}..{LENGTHS.stop - 1} символов)')
+    print(f'Все тексты: {best:.1f} мс')
+    print(f'Один текст: {best / len(LENGTHS):.3f} мс')
+
+
+if __name__ == '__main__':
+    main()
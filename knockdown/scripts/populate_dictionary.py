@@ -10,7 +10,11 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'knockdown.settings')
 django.setup()
 
 
-from lessons.models import DictionaryWord
+from lessons.models import (
+    DictionaryWord,
+    DictionaryWordLetter,
+    DictionaryWordBigram
+)
 
 
 def load_words_from_file(filename):
@@ -60,6 +64,36 @@ def save_words_to_db(words):
     return created_count, skipped_count
 
 
+def link_word_keys(batch_size=1000):
+    """
+    Заполнение таблиц связей слово - буква и слово - биграмма
+    (в том числе для слов, загруженных до их появления)
+    """
+    letters, bigrams = [], []
+    linked_count = 0
+
+    for word in DictionaryWord.objects.order_by('id').iterator(
+        chunk_size=batch_size
+    ):
+        word_letters, word_bigrams = word.build_keys()
+        letters.extend(word_letters)
+        bigrams.extend(word_bigrams)
+        linked_count += 1
+
+        if linked_count % batch_size == 0:
+            DictionaryWordLetter.objects.bulk_create(
+                letters, ignore_conflicts=True
+            )
+            DictionaryWordBigram.objects.bulk_create(
+                bigrams, ignore_conflicts=True
+            )
+            letters, bigrams = [], []
+
+    DictionaryWordLetter.objects.bulk_create(letters, ignore_conflicts=True)
+    DictionaryWordBigram.objects.bulk_create(bigrams, ignore_conflicts=True)
+    return linked_count
+
+
 if __name__ == '__main__':
     # print("Очищение словаря...")
     # clean_db()
@@ -68,7 +102,11 @@ if __name__ == '__main__':
     words = load_words_from_file('russian_dict.txt')
     created, skipped = save_words_to_db(words)
 
+    print("\nИндексация букв и биграмм...")
+    linked = link_word_keys()
+
     print("\nИтог заполнения:")
     print(f"   - Создано новых записей: {created}")
     print(f"   - Пропущено (уже были в БД): {skipped}")
     print(f"   - Всего в БД: {DictionaryWord.objects.count()}")
+    print(f"   - Проиндексировано слов: {linked}")
@@ -5,7 +5,11 @@ from .models import (
     LetterStatistics,
     DailyBigramStatistics,
     DailyLetterStatistics,
-    DailyStatistics
+    DailyStatistics,
+    AggregationJob,
+    UserLetterTotals,
+    UserBigramTotals,
+    UserStatsSummary
 )
 from django import forms
 
@@ -14,6 +18,10 @@ admin.site.register(LetterStatistics)
 admin.site.register(DailyBigramStatistics)
 admin.site.register(DailyLetterStatistics)
 admin.site.register(DailyStatistics)
+admin.site.register(AggregationJob)
+admin.site.register(UserLetterTotals)
+admin.site.register(UserBigramTotals)
+admin.site.register(UserStatsSummary)
 
 
 class BigramStatisticsForm(forms.ModelForm):
@@ -0,0 +1,128 @@
+import csv
+import json
+from collections import defaultdict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from .models import TrainingSession, LetterStatistics, BigramStatistics
+
+# Сессий в одной пачке (вместе с их статистикой по клавишам)
+CHUNK_SIZE = 200
+
+SESSION_FIELDS = [
+    'id', 'lesson_id', 'started_at', 'finished_at',
+    'total_duration_seconds', 'total_characters_typed', 'total_errors',
+    'average_speed_wpm', 'accuracy_percentage',
+]
+KEY_FIELDS = ['key', 'occurrences', 'errors', 'average_time_ms']
+
+CSV_HEADER = ['record', 'session_id', *SESSION_FIELDS[1:], *KEY_FIELDS]
+
+
+def iter_sessions(user, chunk_size=None):
+    """
+    Сессии пользователя (по порядку сохранения) вместе со статистикой
+    по буквам и биграммам: (сессия, буквы, биграммы).
+    Сессии читаются пачками по id (id > последнего прочитанного),
+    статистика - по id сессий пачки, поэтому память ограничена пачкой
+    на любой БД (в том числе без серверных курсоров)
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    last_id = 0
+    while True:
+        sessions = list(
+            TrainingSession.objects.filter(
+                user=user, id__gt=last_id
+            ).order_by('id').values_list(*SESSION_FIELDS)[:chunk_size]
+        )
+        if not sessions:
+            return
+
+        ids = [row[0] for row in sessions]
+        letters = _stats_by_session(
+            LetterStatistics, ids, 'letter', 'average_hit_time_ms'
+        )
+        bigrams = _stats_by_session(
+            BigramStatistics, ids, 'bigram', 'average_transition_time_ms'
+        )
+        for row in sessions:
+            session = dict(zip(SESSION_FIELDS, row))
+            yield (
+                session,
+                letters.get(session['id'], []),
+                bigrams.get(session['id'], [])
+            )
+
+        if len(sessions) < chunk_size:
+            return
+        last_id = ids[-1]
+
+
+def iter_ndjson(user, chunk_size=None):
+    """Одна строка JSON на сессию, статистика по клавишам вложена"""
+    for session, letters, bigrams in iter_sessions(user, chunk_size):
+        session['letter_stats'] = [
+            dict(zip(KEY_FIELDS, stat)) for stat in letters
+        ]
+        session['bigram_stats'] = [
+            dict(zip(KEY_FIELDS, stat)) for stat in bigrams
+        ]
+        yield json.dumps(
+            session, cls=DjangoJSONEncoder, ensure_ascii=False
+        ) + '\n'
+
+
+def iter_csv(user, chunk_size=None):
+    """
+    Плоский CSV: строка session, затем её строки letter и bigram
+    (у них заполнены только session_id и поля клавиши)
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+
+    empty_session = [''] * len(SESSION_FIELDS[1:])
+    empty_key = [''] * len(KEY_FIELDS)
+    for session, letters, bigrams in iter_sessions(user, chunk_size):
+        values = [_csv_value(session[field]) for field in SESSION_FIELDS]
+        lines = [writer.writerow(['session', *values, *empty_key])]
+        for record, stats in (('letter', letters), ('bigram', bigrams)):
+            lines.extend(
+                writer.writerow(
+                    [record, session['id'], *empty_session, *stat]
+                )
+                for stat in stats
+            )
+        yield ''.join(lines)
+
+
+# Формат выгрузки: (генератор строк, Content-Type, расширение файла)
+FORMATS = {
+    'csv': (iter_csv, 'text/csv; charset=utf-8', 'csv'),
+    'ndjson': (iter_ndjson, 'application/x-ndjson; charset=utf-8', 'ndjson'),
+}
+
+
+def _stats_by_session(model, session_ids, key_field, time_field):
+    """Строки статистики сессий пачки: {session_id: [(клавиша, ...)]}"""
+    stats = defaultdict(list)
+    for session_id, *stat in model.objects.filter(
+        session_id__in=session_ids
+    ).order_by('session_id', 'id').values_list(
+        'session_id', key_field, 'occurrences', 'errors', time_field
+    ):
+        stats[session_id].append(tuple(stat))
+    return stats
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: writerow возвращает строку"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from stats.services import KeyTotalsService
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполнение итогов по буквам и биграммам за всё время '
+        '(UserLetterTotals, UserBigramTotals) из статистики сессий'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            help='Имя пользователя (по умолчанию - все пользователи)'
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['user']:
+            users = users.filter(username=options['user'])
+            if not users.exists():
+                raise CommandError(
+                    f"Пользователь {options['user']} не найден"
+                )
+
+        count = 0
+        for user in users.iterator():
+            KeyTotalsService.rebuild(user)
+            count += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Пересобрано пользователей: {count}')
+        )
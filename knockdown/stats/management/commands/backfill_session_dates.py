@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import TruncDate
+
+from stats.models import TrainingSession, LetterStatistics, BigramStatistics
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполнение session_date в статистике сессий по буквам и биграммам '
+        '(записи, сохранённые до появления поля)'
+    )
+
+    def handle(self, *args, **options):
+        # TruncDate - в часовом поясе проекта, как session_day()
+        session_date = Subquery(
+            TrainingSession.objects.filter(
+                pk=OuterRef('session_id')
+            ).annotate(
+                day=TruncDate('finished_at')
+            ).values('day')[:1]
+        )
+
+        for model in LetterStatistics, BigramStatistics:
+            count = model.objects.filter(
+                session_date__isnull=True
+            ).update(session_date=session_date)
+            self.stdout.write(
+                self.style.SUCCESS(f'{model.__name__}: заполнено {count}')
+            )
@@ -0,0 +1,56 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from stats.services import KeyTotalsService
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверка итогов по буквам и биграммам за всё время '
+        'со статистикой сессий'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            help='Имя пользователя (по умолчанию - все пользователи)'
+        )
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Пересобрать итоги пользователей с расхождениями'
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['user']:
+            users = users.filter(username=options['user'])
+            if not users.exists():
+                raise CommandError(
+                    f"Пользователь {options['user']} не найден"
+                )
+
+        broken = 0
+        for user in users.iterator():
+            mismatches = KeyTotalsService.find_mismatches(user)
+            if not mismatches:
+                continue
+
+            broken += 1
+            for key, field, actual, expected in mismatches:
+                self.stdout.write(
+                    f"{user.username}: '{key}' {field} = {actual}, "
+                    f"в статистике сессий {expected}"
+                )
+            if options['fix']:
+                KeyTotalsService.rebuild(user)
+
+        if broken and not options['fix']:
+            raise CommandError(f'Расхождения у пользователей: {broken}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено пользователей: {broken}' if broken
+            else 'Расхождений нет'
+        ))
@@ -0,0 +1,46 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from stats import export
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгрузка всей истории сессий пользователя со статистикой '
+        'по буквам и биграммам (CSV или NDJSON)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='Имя пользователя')
+        parser.add_argument(
+            '--export-format',
+            choices=list(export.FORMATS),
+            default='csv'
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для выгрузки (по умолчанию - стандартный вывод)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=export.CHUNK_SIZE,
+            help='Сессий, читаемых из БД за один раз'
+        )
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['user']).first()
+        if user is None:
+            raise CommandError(f"Пользователь {options['user']} не найден")
+
+        rows = export.FORMATS[options['export_format']][0](
+            user, options['chunk_size']
+        )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                f.writelines(rows)
+        else:
+            for chunk in rows:
+                self.stdout.write(chunk, ending='')
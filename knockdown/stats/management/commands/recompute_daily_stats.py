@@ -0,0 +1,76 @@
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models.functions import TruncDate
+
+from stats.models import (
+    TrainingSession,
+    DailyStatistics,
+    DailyLetterStatistics,
+    DailyBigramStatistics
+)
+from stats.services import DailyStatsService
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Полный пересчёт дневной статистики по сырым данным сессий '
+        '(восстановление после сбоев инкрементального обновления)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            help='Имя пользователя (по умолчанию - все пользователи)'
+        )
+        parser.add_argument(
+            '--date',
+            type=date.fromisoformat,
+            help='День в формате YYYY-MM-DD (по умолчанию - все дни)'
+        )
+
+    def handle(self, *args, **options):
+        filters = {}
+        if options['user']:
+            try:
+                filters['user'] = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(
+                    f"Пользователь {options['user']} не найден"
+                )
+
+        # Дни с сессиями и дни, где остались дневные записи (в том числе
+        # все сессии которых удалены - пересчёт удалит эти записи)
+        queries = [
+            TrainingSession.objects.filter(**filters).annotate(
+                day=TruncDate('finished_at')
+            ).values_list('user_id', 'day')
+        ] + [
+            model.objects.filter(**filters).values_list('user_id', 'date')
+            for model in (
+                DailyStatistics, DailyLetterStatistics, DailyBigramStatistics
+            )
+        ]
+        days = set()
+        for query in queries:
+            days.update(query.distinct().order_by())
+        if options['date']:
+            days = {
+                (user_id, day) for user_id, day in days
+                if day == options['date']
+            }
+
+        users = {}
+        count = 0
+        for user_id, day in sorted(days):
+            if user_id not in users:
+                users[user_id] = User.objects.get(pk=user_id)
+            DailyStatsService.recompute_day(users[user_id], day)
+            count += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Пересчитано дней: {count}')
+        )
@@ -0,0 +1,81 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from stats.models import AggregationJob
+from lessons.services import LessonPool
+from stats.services import AggregationQueue
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        'Воркер очереди агрегации: обновляет прогресс по урокам и дневную '
+        'статистику для сессий, сохранённых с STATS_ASYNC_AGGREGATION=true, '
+        'и пополняет пулы уроков (LessonPoolJob)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Разобрать очередь и завершиться'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Количество задач за одну транзакцию'
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=1.0,
+            help='Пауза в секундах, когда очередь пуста'
+        )
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='Вернуть в очередь задачи, помеченные failed'
+        )
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            retried = AggregationJob.objects.filter(failed=True).update(
+                failed=False, attempts=0
+            )
+            self.stdout.write(f'Возвращено в очередь задач: {retried}')
+
+        total = 0
+        try:
+            while True:
+                try:
+                    processed = AggregationQueue.process(
+                        options['batch_size']
+                    ) + LessonPool.process()
+                except Exception as error:
+                    # Ошибки групп учитываются в process; сюда доходят
+                    # сбои самой очереди (например, потеря соединения с БД)
+                    if options['once']:
+                        raise CommandError(
+                            f'Ошибка очереди агрегации: {error}'
+                        ) from error
+                    logger.exception('Ошибка очереди агрегации')
+                    close_old_connections()
+                    time.sleep(options['sleep'])
+                    continue
+                total += processed
+                if processed:
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Обработано задач: {total}')
+        )
@@ -1,4 +1,13 @@
 from django.db import models
+from django.utils import timezone
+
+
+def session_day(finished_at):
+    """
+    День сессии в часовом поясе проекта (как у finished_at__date):
+    дата дневной статистики и session_date статистики сессии
+    """
+    return timezone.localdate(finished_at)
 
 
 class TrainingSession(models.Model):
@@ -17,6 +26,10 @@ class TrainingSession(models.Model):
     average_speed_wpm = models.FloatField()
     accuracy_percentage = models.FloatField()
 
+    # Запись нажатий в компактном формате (stats.timeline), если клиент
+    # её прислал; статистика по клавишам тогда считается по ней
+    keystrokes = models.BinaryField(null=True, blank=True)
+
     # Мета
     started_at = models.DateTimeField()
     finished_at = models.DateTimeField()
@@ -24,6 +37,14 @@ class TrainingSession(models.Model):
 
     class Meta:
         ordering = ['-finished_at']
+        indexes = [
+            # История сессий (-finished_at) и выборка сессий за день
+            # диапазоном по finished_at
+            models.Index(
+                fields=['user', '-finished_at'],
+                name='session_user_finished_idx'
+            ),
+        ]
 
     def __str__(self):
         if self.lesson:
@@ -65,13 +86,25 @@ class LetterStatistics(models.Model):
     occurrences = models.IntegerField(default=0)
     errors = models.IntegerField(default=0)
     average_hit_time_ms = models.FloatField()
+    # День сессии (session_day(session.finished_at)) - пересчёт дня
+    # без JOIN с сессиями
+    session_date = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         indexes = [
             models.Index(fields=['user', 'letter']),
+            models.Index(
+                fields=['user', 'session_date', 'letter'],
+                name='letter_stats_user_day_idx'
+            ),
         ]
 
+    def save(self, *args, **kwargs):
+        if self.session_date is None:
+            self.session_date = session_day(self.session.finished_at)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         if self.session and self.session.lesson:
             info = (
@@ -110,13 +143,23 @@ class BigramStatistics(models.Model):
     occurrences = models.IntegerField(default=0)
     errors = models.IntegerField(default=0)
     average_transition_time_ms = models.FloatField()
+    session_date = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         indexes = [
             models.Index(fields=['user', 'bigram']),
+            models.Index(
+                fields=['user', 'session_date', 'bigram'],
+                name='bigram_stats_user_day_idx'
+            ),
         ]
 
+    def save(self, *args, **kwargs):
+        if self.session_date is None:
+            self.session_date = session_day(self.session.finished_at)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         if self.session and self.session.lesson:
             info = (
@@ -144,3 +187,85 @@ class DailyBigramStatistics(models.Model):
         return (
             f"{self.date} - {self.user.username}: '{self.bigram}'"
         )
+
+
+class UserLetterTotals(models.Model):
+    """Статистика пользователя по букве за всё время"""
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE)
+    letter = models.CharField(max_length=3)
+    total_occurrences = models.IntegerField(default=0)
+    total_errors = models.IntegerField(default=0)
+    # Для среднего времени: нажатия с известным временем и их сумма
+    timed_occurrences = models.IntegerField(default=0)
+    total_time_ms = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ['user', 'letter']
+
+    def __str__(self):
+        return f"{self.user.username}: '{self.letter}'"
+
+
+class UserBigramTotals(models.Model):
+    """Статистика пользователя по биграмме за всё время"""
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE)
+    bigram = models.CharField(max_length=6)
+    total_occurrences = models.IntegerField(default=0)
+    total_errors = models.IntegerField(default=0)
+    timed_occurrences = models.IntegerField(default=0)
+    total_time_ms = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ['user', 'bigram']
+
+    def __str__(self):
+        return f"{self.user.username}: '{self.bigram}'"
+
+
+class UserStatsSummary(models.Model):
+    """
+    Итоги пользователя для профиля - материализованный агрегат сессий,
+    обновляется при сохранении и удалении сессии
+    """
+    user = models.OneToOneField(
+        'users.User',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats_summary'
+    )
+    total_sessions = models.IntegerField(default=0)
+    total_time_seconds = models.IntegerField(default=0)
+    # Суммы для средних значений
+    speed_sum = models.FloatField(default=0)
+    accuracy_sum = models.FloatField(default=0)
+    best_speed = models.FloatField(default=0)
+
+    def __str__(self):
+        return f"{self.user.username}: {self.total_sessions} сессий"
+
+
+class AggregationJob(models.Model):
+    """Отложенная агрегация статистики после сохранения сессии"""
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE)
+    date = models.DateField()
+    session = models.ForeignKey(
+        TrainingSession,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True
+    )
+    # Неудачные попытки обработки; после STATS_AGGREGATION_MAX_ATTEMPTS
+    # задача помечается failed и воркер её больше не берёт
+    attempts = models.IntegerField(default=0)
+    failed = models.BooleanField(default=False)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['user', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.user.username}"
@@ -0,0 +1,12 @@
+from rest_framework.pagination import CursorPagination
+
+
+class SessionCursorPagination(CursorPagination):
+    """
+    Keyset-пагинация истории сессий: страница читается по индексу
+    (user, finished_at) без OFFSET, от новых сессий к старым
+    """
+    ordering = ('-finished_at', 'id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
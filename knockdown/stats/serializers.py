@@ -1,12 +1,26 @@
+import base64
+import binascii
+
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
 from .models import (
     TrainingSession,
     LetterStatistics,
     BigramStatistics,
-    DailyStatistics
+    DailyStatistics,
+    session_day
 )
+from . import timeline
+from lessons import problem_keys_cache
 from lessons.serializers import UserLessonProgressSerializer
-from .services import DailyStatsService
+from lessons.services import LessonPool
+from .services import (
+    DailyStatsService,
+    KeyTotalsService,
+    StatsSummaryService,
+    AggregationQueue
+)
 
 
 class LetterStatsSerializer(serializers.ModelSerializer):
@@ -14,14 +28,6 @@ class LetterStatsSerializer(serializers.ModelSerializer):
         model = LetterStatistics
         fields = ['letter', 'occurrences', 'errors', 'average_hit_time_ms']
 
-    def create(self, validated_data):
-        session = self.context['session']
-        return LetterStatistics.objects.create(
-            session=session,
-            user=session.user,
-            **validated_data
-        )
-
 
 class BigramStatsSerializer(serializers.ModelSerializer):
     class Meta:
@@ -31,13 +37,35 @@ class BigramStatsSerializer(serializers.ModelSerializer):
             'average_transition_time_ms'
         ]
 
-    def create(self, validated_data):
-        session = self.context['session']
-        return BigramStatistics.objects.create(
-            session=session,
-            user=session.user,
-            **validated_data
-        )
+
+class RawInputSerializer(serializers.Serializer):
+    """
+    Исходный ввод сессии: текст урока, набранный текст
+    и моменты нажатий в мс (по одному на набранный символ)
+    """
+    # Длины ограничены до разбора: запись нажатий не длиннее MAX_KEYSTROKES
+    text = serializers.CharField(
+        trim_whitespace=False,
+        max_length=timeline.MAX_KEYSTROKES
+    )
+    typed = serializers.CharField(
+        trim_whitespace=False,
+        allow_blank=True,
+        max_length=timeline.MAX_KEYSTROKES
+    )
+    timestamps = serializers.ListField(
+        child=serializers.IntegerField(min_value=0),
+        allow_empty=True,
+        max_length=timeline.MAX_KEYSTROKES
+    )
+
+    def validate(self, data):
+        try:
+            return timeline.from_raw_input(
+                data['text'], data['typed'], data['timestamps']
+            )
+        except ValueError as error:
+            raise serializers.ValidationError(str(error))
 
 
 class TrainingSessionSerializer(serializers.ModelSerializer):
@@ -53,6 +81,12 @@ class TrainingSessionSerializer(serializers.ModelSerializer):
         write_only=True,
         required=False
     )
+    # Запись нажатий (stats.timeline) в base64: если есть, letter_stats
+    # и bigram_stats считаются по ней, присланные клиентом не используются
+    keystrokes = serializers.CharField(write_only=True, required=False)
+    # Исходный ввод: статистика считается на сервере, запись нажатий
+    # сохраняется так же, как при keystrokes
+    raw_input = RawInputSerializer(write_only=True, required=False)
 
     # Поля для отображения
     lesson_title = serializers.CharField(
@@ -71,13 +105,37 @@ class TrainingSessionSerializer(serializers.ModelSerializer):
             'total_duration_seconds', 'total_characters_typed', 'total_errors',
             'average_speed_wpm', 'accuracy_percentage',
             'started_at', 'finished_at', 'created_at',
-            'letter_stats', 'bigram_stats'  # только для записи
+            # только для записи
+            'letter_stats', 'bigram_stats', 'keystrokes', 'raw_input'
         ]
         read_only_fields = [
             'id', 'user', 'created_at',
             'lesson_title', 'lesson_order'
         ]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Выборка полей для чтения: ?fields=average_speed_wpm,finished_at
+        request = self.context.get('request')
+        if not request or request.method != 'GET':
+            return
+        fields = request.query_params.get('fields')
+        if not fields:
+            return
+
+        requested = {name.strip() for name in fields.split(',') if name.strip()}
+        readable = {
+            name for name, field in self.fields.items() if not field.write_only
+        }
+        unknown = requested - readable
+        if unknown:
+            raise serializers.ValidationError({
+                'fields': f'Неизвестные поля: {", ".join(sorted(unknown))}'
+            })
+        for name in readable - requested:
+            self.fields.pop(name)
+
     def validate_accuracy_percentage(self, value):
         if value < 0 or value > 100:
             raise serializers.ValidationError(
@@ -92,6 +150,14 @@ class TrainingSessionSerializer(serializers.ModelSerializer):
             )
         return value
 
+    def validate_keystrokes(self, value):
+        try:
+            return timeline.decode(base64.b64decode(value, validate=True))
+        except (binascii.Error, ValueError) as error:
+            raise serializers.ValidationError(
+                f"Неверная запись нажатий: {error}"
+            )
+
     def validate(self, data):
         """Дополнительные проверки"""
         if data.get('started_at') and data.get('finished_at'):
@@ -115,34 +181,68 @@ class TrainingSessionSerializer(serializers.ModelSerializer):
                     'Длительность не соответствует времени начала/окончания'
                 })
 
+        raw_input = data.pop('raw_input', None)
+        if raw_input is not None:
+            if data.get('keystrokes') is not None:
+                raise serializers.ValidationError({
+                    'raw_input': 'Передаётся либо raw_input, либо keystrokes'
+                })
+            data['keystrokes'] = raw_input
+
+        if data.get('keystrokes') is not None:
+            keys = data['keystrokes']
+            field = 'keystrokes' if raw_input is None else 'raw_input'
+            try:
+                data['letter_stats'], data['bigram_stats'] = (
+                    timeline.key_stats(keys)
+                )
+                data['keystrokes'] = timeline.encode(keys)
+            except ValueError as error:
+                raise serializers.ValidationError({field: str(error)})
+
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
+        # Вложенные списки уже провалидированы в is_valid(),
+        # поэтому статистика пишется пачкой, без повторной валидации
         letter_stats_data = validated_data.pop('letter_stats', [])
         bigram_stats_data = validated_data.pop('bigram_stats', [])
 
         session = super().create(validated_data)
 
-        if session.lesson:
-            UserLessonProgressSerializer().update_from_session(session)
-
-        for data in letter_stats_data:
-            letter_serializer = LetterStatsSerializer(
-                data=data,
-                context={'session': session}
+        session_date = session_day(session.finished_at)
+        letter_stats = LetterStatistics.objects.bulk_create([
+            LetterStatistics(
+                session=session, user=session.user,
+                session_date=session_date, **data
             )
-            letter_serializer.is_valid(raise_exception=True)
-            letter_serializer.save()
-
-        for data in bigram_stats_data:
-            bigram_serializer = BigramStatsSerializer(
-                data=data,
-                context={'session': session}
+            for data in letter_stats_data
+        ])
+        bigram_stats = BigramStatistics.objects.bulk_create([
+            BigramStatistics(
+                session=session, user=session.user,
+                session_date=session_date, **data
             )
-            bigram_serializer.is_valid(raise_exception=True)
-            bigram_serializer.save()
+            for data in bigram_stats_data
+        ])
+
+        # Итоги профиля - всегда сразу (одно обновление строки)
+        StatsSummaryService.add_session(session)
+
+        if settings.STATS_ASYNC_AGGREGATION:
+            AggregationQueue.enqueue(session)
+            return session
+
+        if session.lesson:
+            UserLessonProgressSerializer().update_from_session(session)
 
-        DailyStatsService.update_all(session)
+        DailyStatsService.apply_session(session, letter_stats, bigram_stats)
+        KeyTotalsService.apply_session(session, letter_stats, bigram_stats)
+        # Уроки пула с прежними проблемными клавишами больше не выдаются,
+        # воркер пополнит пул уроками на новые клавиши
+        problem_keys_cache.invalidate_on_commit(session.user_id)
+        LessonPool.schedule_refill(session.user)
 
         return session
 
@@ -154,6 +254,7 @@ class DashboardStatsSerializer(serializers.Serializer):
     avg_speed = serializers.IntegerField()
     best_speed = serializers.IntegerField()
     avg_accuracy = serializers.IntegerField()
+    aggregates_pending = serializers.BooleanField()
 
 
 class DailyStatisticsSerializer(serializers.ModelSerializer):
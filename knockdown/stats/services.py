@@ -1,109 +1,1101 @@
-from django.db.models import Sum, Avg
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Sum, Avg, Max, Min, Count, Value
+from django.db.models.functions import Coalesce, Greatest, NullIf, Round
+from django.utils import timezone
+from lessons import problem_keys_cache
+from lessons.models import UserLessonProgress
+from lessons.serializers import UserLessonProgressSerializer
+from lessons.services import LessonPool
 from .models import (
+    AggregationJob,
     TrainingSession,
     DailyStatistics,
     DailyLetterStatistics,
     DailyBigramStatistics,
     LetterStatistics,
-    BigramStatistics
+    BigramStatistics,
+    UserLetterTotals,
+    UserBigramTotals,
+    UserStatsSummary,
+    session_day
 )
 
+logger = logging.getLogger(__name__)
+
 
 class DailyStatsService:
     """Обновляет агрегированную статистику за день"""
 
     @staticmethod
-    def update_all(session):
-        """Обновление всех видов дневной статистики после сессии"""
-        date = session.finished_at.date()
+    def apply_session(session, letter_stats=None, bigram_stats=None):
+        """
+        Инкрементальное обновление: к дневной статистике добавляется
+        только вклад новой сессии (без перечитывания всего дня)
+        """
+        date = session_day(session.finished_at)
+
+        if letter_stats is None:
+            letter_stats = LetterStatistics.objects.filter(session=session)
+        if bigram_stats is None:
+            bigram_stats = BigramStatistics.objects.filter(session=session)
+
+        with transaction.atomic():
+            DailyStatsService.apply_general_stats(session.user, date, session)
 
-        DailyStatsService.update_general_stats(session.user, date, session)
-        DailyStatsService.update_letter_stats(session.user, date)
-        DailyStatsService.update_bigram_stats(session.user, date)
+            DailyStatsService._fold_key_stats(
+                DailyLetterStatistics, 'letter', 'average_hit_time_ms',
+                session.user, date,
+                [
+                    (stat.letter, stat.occurrences, stat.errors,
+                     stat.average_hit_time_ms)
+                    for stat in letter_stats
+                ]
+            )
+            DailyStatsService._fold_key_stats(
+                DailyBigramStatistics, 'bigram', 'average_transition_time_ms',
+                session.user, date,
+                [
+                    (stat.bigram, stat.occurrences, stat.errors,
+                     stat.average_transition_time_ms)
+                    for stat in bigram_stats
+                ]
+            )
 
     @staticmethod
-    def update_general_stats(user, date, session):
-        """Обновление общей дневной статистики"""
-        daily, _ = DailyStatistics.objects.get_or_create(
+    def apply_general_stats(user, date, session):
+        """Добавление одной сессии к общей дневной статистике"""
+        speed = session.average_speed_wpm
+        accuracy = session.accuracy_percentage
+
+        daily, created = DailyStatistics.objects.get_or_create(
             user=user,
             date=date,
             defaults={
-                'total_training_time_seconds': 0,
-                'total_sessions': 0,
-                'best_speed_wpm': 0,
-                'average_speed_wpm': 0,
-                'average_accuracy_percentage': 0
+                'total_training_time_seconds': session.total_duration_seconds,
+                'total_sessions': 1,
+                'best_speed_wpm': speed,
+                'average_speed_wpm': speed,
+                'average_accuracy_percentage': accuracy
             }
         )
+        if created:
+            return
+
+        # Все выражения в SET вычисляются по старым значениям строки
+        DailyStatistics.objects.filter(pk=daily.pk).update(
+            total_training_time_seconds=(
+                F('total_training_time_seconds')
+                + session.total_duration_seconds
+            ),
+            total_sessions=F('total_sessions') + 1,
+            best_speed_wpm=Greatest(F('best_speed_wpm'), Value(speed)),
+            average_speed_wpm=(
+                (F('average_speed_wpm') * F('total_sessions') + speed)
+                / (F('total_sessions') + 1)
+            ),
+            average_accuracy_percentage=(
+                (F('average_accuracy_percentage') * F('total_sessions')
+                 + accuracy)
+                / (F('total_sessions') + 1)
+            )
+        )
+
+    @staticmethod
+    def _fold_key_stats(
+            model, key_field, time_field, user, date, rows, sign=1
+    ):
+        """
+        Добавление (sign=1) или вычитание (sign=-1) статистики сессий
+        в дневных записях по клавишам.
+        rows - список (клавиша, нажатия, ошибки, среднее время).
+        Среднее время пересчитывается как взвешенное по количеству нажатий.
+        Записи, у которых не осталось нажатий, удаляются.
+        """
+        sums = _sum_rows(rows)
+        if not sums:
+            return
 
-        sessions = TrainingSession.objects.filter(
+        if sign > 0:
+            # Недостающие строки создаются пустыми, поэтому параллельные
+            # сессии не сталкиваются на unique_together при вставке
+            model.objects.bulk_create(
+                [
+                    model(
+                        user=user, date=date,
+                        **{key_field: key, time_field: 0}
+                    )
+                    for key in sums
+                ],
+                ignore_conflicts=True
+            )
+        existing = {
+            getattr(obj, key_field): obj
+            for obj in model.objects.select_for_update().filter(
+                user=user, date=date, **{f'{key_field}__in': list(sums)}
+            ).order_by(key_field)
+        }
+
+        merged = []
+        emptied = []
+        for key, (occurrences, errors, _, total_time) in sums.items():
+            obj = existing.get(key)
+            if obj is None:
+                continue
+            total = obj.total_occurrences + sign * occurrences
+            if total <= 0 and sign < 0:
+                emptied.append(key)
+                continue
+            time = getattr(obj, time_field)
+            if total:
+                time = (
+                    time * obj.total_occurrences + sign * total_time
+                ) / total
+            merged.append(model(
+                user=user,
+                date=date,
+                total_occurrences=total,
+                total_errors=max(obj.total_errors + sign * errors, 0),
+                **{key_field: key, time_field: time}
+            ))
+
+        _upsert_key_stats(
+            model, ['user', 'date', key_field],
+            ['total_occurrences', 'total_errors', time_field], merged
+        )
+        if emptied:
+            model.objects.filter(
+                user=user, date=date, **{f'{key_field}__in': emptied}
+            ).delete()
+
+    @staticmethod
+    def recompute_day(user, date):
+        """
+        Полный пересчёт всех видов дневной статистики по сырым данным.
+        Используется для восстановления (команда recompute_daily_stats)
+        """
+        with transaction.atomic():
+            DailyStatsService.update_general_stats(user, date)
+            DailyStatsService.update_letter_stats(user, date)
+            DailyStatsService.update_bigram_stats(user, date)
+
+    @staticmethod
+    def update_general_stats(user, date):
+        """Обновление общей дневной статистики"""
+        # Диапазон вместо finished_at__date - по индексу (user, finished_at)
+        start, end = _day_bounds(date)
+        stats = TrainingSession.objects.filter(
             user=user,
-            finished_at__date=date
+            finished_at__gte=start,
+            finished_at__lt=end
+        ).aggregate(
+            total_time=Sum('total_duration_seconds'),
+            total_sessions=Count('id'),
+            best_speed=Max('average_speed_wpm'),
+            avg_speed=Avg('average_speed_wpm'),
+            avg_accuracy=Avg('accuracy_percentage')
         )
 
-        total_time = sum(s.total_duration_seconds for s in sessions)
-        total_sessions = sessions.count()
-        best_speed = max(s.average_speed_wpm for s in sessions)
-        avg_speed = sum(s.average_speed_wpm for s in sessions) / total_sessions
-        avg_accuracy = sum(
-            s.accuracy_percentage for s in sessions
-        ) / total_sessions
+        if not stats['total_sessions']:
+            DailyStatistics.objects.filter(user=user, date=date).delete()
+            return
 
-        daily.total_training_time_seconds = total_time
-        daily.total_sessions = total_sessions
-        daily.best_speed_wpm = best_speed
-        daily.average_speed_wpm = avg_speed
-        daily.average_accuracy_percentage = avg_accuracy
-        daily.save()
+        DailyStatistics.objects.update_or_create(
+            user=user,
+            date=date,
+            defaults={
+                'total_training_time_seconds': stats['total_time'],
+                'total_sessions': stats['total_sessions'],
+                'best_speed_wpm': stats['best_speed'],
+                'average_speed_wpm': stats['avg_speed'],
+                'average_accuracy_percentage': stats['avg_accuracy']
+            }
+        )
 
     @staticmethod
     def update_letter_stats(user, date):
         """Обновление дневной статистики по буквам"""
-        letter_stats = LetterStatistics.objects.filter(
-            user=user,
-            session__finished_at__date=date
-        )
+        letter_stats = _day_key_stats(LetterStatistics, user, date)
 
         aggregated = letter_stats.values('letter').annotate(
             total_occurrences=Sum('occurrences'),
             total_errors=Sum('errors'),
-            avg_time=Avg('average_hit_time_ms')
+            total_time=Sum(F('average_hit_time_ms') * F('occurrences'))
         )
 
-        for stat in aggregated:
-            DailyLetterStatistics.objects.update_or_create(
-                user=user,
-                date=date,
-                letter=stat['letter'],
-                defaults={
-                    'total_occurrences': stat['total_occurrences'],
-                    'total_errors': stat['total_errors'],
-                    'average_hit_time_ms': stat['avg_time'] or 0
-                }
-            )
+        letters = [stat['letter'] for stat in aggregated]
+        _upsert_key_stats(
+            DailyLetterStatistics, ['user', 'date', 'letter'],
+            ['total_occurrences', 'total_errors', 'average_hit_time_ms'],
+            [
+                DailyLetterStatistics(
+                    user=user,
+                    date=date,
+                    letter=stat['letter'],
+                    total_occurrences=stat['total_occurrences'],
+                    total_errors=stat['total_errors'],
+                    average_hit_time_ms=_weighted_time(stat)
+                )
+                for stat in aggregated
+            ]
+        )
+
+        DailyLetterStatistics.objects.filter(
+            user=user, date=date
+        ).exclude(letter__in=letters).delete()
 
     @staticmethod
     def update_bigram_stats(user, date):
         """Обновление дневной статистики по биграммам"""
-        bigram_stats = BigramStatistics.objects.filter(
-            user=user,
-            session__finished_at__date=date
-        )
+        bigram_stats = _day_key_stats(BigramStatistics, user, date)
 
         aggregated = bigram_stats.values('bigram').annotate(
             total_occurrences=Sum('occurrences'),
             total_errors=Sum('errors'),
-            avg_time=Avg('average_transition_time_ms')
+            total_time=Sum(
+                F('average_transition_time_ms') * F('occurrences')
+            )
         )
 
-        for stat in aggregated:
-            DailyBigramStatistics.objects.update_or_create(
-                user=user,
-                date=date,
-                bigram=stat['bigram'],
-                defaults={
-                    'total_occurrences': stat['total_occurrences'],
-                    'total_errors': stat['total_errors'],
-                    'average_transition_time_ms': stat['avg_time'] or 0
-                }
+        bigrams = [stat['bigram'] for stat in aggregated]
+        _upsert_key_stats(
+            DailyBigramStatistics, ['user', 'date', 'bigram'],
+            ['total_occurrences', 'total_errors', 'average_transition_time_ms'],
+            [
+                DailyBigramStatistics(
+                    user=user,
+                    date=date,
+                    bigram=stat['bigram'],
+                    total_occurrences=stat['total_occurrences'],
+                    total_errors=stat['total_errors'],
+                    average_transition_time_ms=_weighted_time(stat)
+                )
+                for stat in aggregated
+            ]
+        )
+
+        DailyBigramStatistics.objects.filter(
+            user=user, date=date
+        ).exclude(bigram__in=bigrams).delete()
+
+
+class KeyTotalsService:
+    """
+    Статистика по клавишам за всё время (UserLetterTotals, UserBigramTotals).
+    Обновляется при сохранении сессии, пересобирается из статистики сессий.
+    timed_occurrences - нажатия в строках сессий с ненулевым средним
+    временем, total_time_ms - сумма их времени
+    """
+
+    # (модель итогов, модель статистики сессии, поле клавиши, поле времени)
+    TABLES = [
+        (UserLetterTotals, LetterStatistics,
+         'letter', 'average_hit_time_ms'),
+        (UserBigramTotals, BigramStatistics,
+         'bigram', 'average_transition_time_ms'),
+    ]
+
+    @staticmethod
+    def apply_session(session, letter_stats=None, bigram_stats=None):
+        """Добавление вклада сессии к итогам пользователя"""
+        if letter_stats is None:
+            letter_stats = LetterStatistics.objects.filter(session=session)
+        if bigram_stats is None:
+            bigram_stats = BigramStatistics.objects.filter(session=session)
+        KeyTotalsService.apply_stats(session.user, letter_stats, bigram_stats)
+
+    @staticmethod
+    def apply_stats(user, letter_stats, bigram_stats):
+        """
+        Добавление строк статистики (одной или нескольких сессий).
+        Итогов ещё нет (история до их появления) - сначала они
+        пересобираются без этих сессий, иначе первая новая сессия
+        создала бы итоги только из себя
+        """
+        letter_stats = list(letter_stats)
+        bigram_stats = list(bigram_stats)
+        with transaction.atomic():
+            if not KeyTotalsService.exist(user):
+                KeyTotalsService.rebuild(user, exclude_sessions={
+                    stat.session_id for stat in letter_stats + bigram_stats
+                })
+            _add_key_totals(
+                UserLetterTotals, 'letter', user,
+                [
+                    (stat.letter, stat.occurrences, stat.errors,
+                     stat.average_hit_time_ms)
+                    for stat in letter_stats
+                ]
+            )
+            _add_key_totals(
+                UserBigramTotals, 'bigram', user,
+                [
+                    (stat.bigram, stat.occurrences, stat.errors,
+                     stat.average_transition_time_ms)
+                    for stat in bigram_stats
+                ]
+            )
+
+    @staticmethod
+    def rebuild(user, exclude_sessions=()):
+        """
+        Пересборка итогов пользователя из статистики сессий
+        (кроме exclude_sessions и сессий в очереди агрегации)
+        """
+        with transaction.atomic():
+            for model, stats_model, key_field, time_field in (
+                KeyTotalsService.TABLES
+            ):
+                model.objects.filter(user=user).delete()
+                model.objects.bulk_create([
+                    model(user=user, **row)
+                    for row in _session_totals(
+                        stats_model, key_field, time_field, user,
+                        exclude_sessions
+                    )
+                ])
+
+    @staticmethod
+    def exist(user):
+        """Есть ли у пользователя итоги по клавишам"""
+        return (
+            UserLetterTotals.objects.filter(user=user).exists()
+            or UserBigramTotals.objects.filter(user=user).exists()
+        )
+
+    @staticmethod
+    def ensure(user):
+        """
+        Пересборка итогов, если их нет, а статистика сессий есть
+        (история до появления итогов). True - пересобраны
+        """
+        if KeyTotalsService.exist(user):
+            return False
+        if not (
+            LetterStatistics.objects.filter(user=user).exists()
+            or BigramStatistics.objects.filter(user=user).exists()
+        ):
+            return False
+        KeyTotalsService.rebuild(user)
+        return True
+
+    @staticmethod
+    def find_mismatches(user):
+        """
+        Сверка итогов со статистикой сессий.
+        Возвращает список (клавиша, поле, значение в итогах, в сессиях)
+        """
+        fields = [
+            'total_occurrences', 'total_errors',
+            'timed_occurrences', 'total_time_ms'
+        ]
+        mismatches = []
+
+        for model, stats_model, key_field, time_field in (
+            KeyTotalsService.TABLES
+        ):
+            expected = {
+                row[key_field]: row
+                for row in _session_totals(
+                    stats_model, key_field, time_field, user
+                )
+            }
+            actual = {
+                row[key_field]: row
+                for row in model.objects.filter(user=user).values(
+                    key_field, *fields
+                )
+            }
+            for key in expected.keys() | actual.keys():
+                for field in fields:
+                    first = actual.get(key, {}).get(field, 0)
+                    second = expected.get(key, {}).get(field, 0)
+                    if abs(first - second) > 1e-6 * max(1, abs(second)):
+                        mismatches.append((key, field, first, second))
+
+        return mismatches
+
+
+def _add_key_totals(model, key_field, user, rows, sign=1):
+    """
+    Прибавление (sign=1) или вычитание (sign=-1) строк
+    (клавиша, нажатия, ошибки, время) в итогах
+    """
+    sums = _sum_rows(rows)
+    if not sums:
+        return
+
+    if sign > 0:
+        model.objects.bulk_create(
+            [model(user=user, **{key_field: key}) for key in sums],
+            ignore_conflicts=True
+        )
+    existing = {
+        getattr(obj, key_field): obj
+        for obj in model.objects.select_for_update().filter(
+            user=user, **{f'{key_field}__in': list(sums)}
+        ).order_by(key_field)
+    }
+
+    merged = []
+    emptied = []
+    for key, (occurrences, errors, timed, total_time) in sums.items():
+        obj = existing.get(key)
+        if obj is None:
+            continue
+        total = obj.total_occurrences + sign * occurrences
+        if total <= 0 and sign < 0:
+            emptied.append(key)
+            continue
+        merged.append(model(
+            user=user,
+            total_occurrences=total,
+            total_errors=max(obj.total_errors + sign * errors, 0),
+            timed_occurrences=max(obj.timed_occurrences + sign * timed, 0),
+            total_time_ms=max(obj.total_time_ms + sign * total_time, 0.0),
+            **{key_field: key}
+        ))
+
+    _upsert_key_stats(
+        model, ['user', key_field],
+        [
+            'total_occurrences', 'total_errors',
+            'timed_occurrences', 'total_time_ms'
+        ],
+        merged
+    )
+    if emptied:
+        model.objects.filter(
+            user=user, **{f'{key_field}__in': emptied}
+        ).delete()
+
+
+def _session_totals(
+        stats_model, key_field, time_field, user, exclude_sessions=()
+):
+    """
+    Итоги по клавишам, собранные из статистики сессий.
+    Нажатия с временем считаются так же, как в _sum_rows.
+    Сессии из очереди агрегации не учитываются - их добавит воркер
+    """
+    timed = ~Q(**{time_field: 0})
+    pending = AggregationJob.objects.filter(
+        user=user, session__isnull=False
+    ).values('session_id')
+
+    return stats_model.objects.filter(user=user).exclude(
+        session_id__in=list(exclude_sessions)
+    ).exclude(session_id__in=pending).values(
+        key_field
+    ).annotate(
+        total_occurrences=Sum('occurrences'),
+        total_errors=Sum('errors'),
+        timed_occurrences=Coalesce(Sum('occurrences', filter=timed), 0),
+        total_time_ms=Coalesce(
+            Sum(F(time_field) * F('occurrences'), filter=timed), 0.0
+        ),
+    ).order_by(key_field)
+
+
+class StatsSummaryService:
+    """Итоги пользователя для профиля (UserStatsSummary)"""
+
+    @staticmethod
+    def get(user):
+        """Итоги одним чтением по первичному ключу; нет строки - пересборка"""
+        summary = UserStatsSummary.objects.filter(pk=user.pk).first()
+        return summary or StatsSummaryService.rebuild(user)
+
+    @staticmethod
+    def add_session(session):
+        """Добавление сохранённой сессии к итогам"""
+        StatsSummaryService.add_sessions(session.user, [session])
+
+    @staticmethod
+    def add_sessions(user, sessions):
+        """Добавление сохранённых сессий к итогам одним обновлением"""
+        updated = UserStatsSummary.objects.filter(pk=user.pk).update(
+            total_sessions=F('total_sessions') + len(sessions),
+            total_time_seconds=F('total_time_seconds') + sum(
+                session.total_duration_seconds for session in sessions
+            ),
+            speed_sum=F('speed_sum') + sum(
+                session.average_speed_wpm for session in sessions
+            ),
+            accuracy_sum=F('accuracy_sum') + sum(
+                session.accuracy_percentage for session in sessions
+            ),
+            best_speed=Greatest('best_speed', Value(max(
+                session.average_speed_wpm for session in sessions
+            )))
+        )
+        if not updated:
+            # Первая сессия или итогов ещё нет (история до их появления)
+            StatsSummaryService.rebuild(user)
+
+    @staticmethod
+    def remove_sessions(user, sessions):
+        """
+        Вычитание уже удалённых сессий из итогов. Лучшая скорость
+        пересчитывается, только если удалена сессия с максимумом
+        """
+        summary = UserStatsSummary.objects.select_for_update().filter(
+            pk=user.pk
+        ).first()
+        if summary is None:
+            StatsSummaryService.rebuild(user)
+            return
+
+        fields = {
+            'total_sessions': F('total_sessions') - len(sessions),
+            'total_time_seconds': F('total_time_seconds') - sum(
+                session.total_duration_seconds for session in sessions
+            ),
+            'speed_sum': F('speed_sum') - sum(
+                session.average_speed_wpm for session in sessions
+            ),
+            'accuracy_sum': F('accuracy_sum') - sum(
+                session.accuracy_percentage for session in sessions
+            ),
+        }
+        if any(
+            session.average_speed_wpm >= summary.best_speed
+            for session in sessions
+        ):
+            fields['best_speed'] = TrainingSession.objects.filter(
+                user=user
+            ).aggregate(
+                best=Coalesce(Max('average_speed_wpm'), 0.0)
+            )['best']
+
+        UserStatsSummary.objects.filter(pk=user.pk).update(**fields)
+
+    @staticmethod
+    def rebuild(user):
+        """Пересборка итогов по всем сессиям пользователя"""
+        stats = TrainingSession.objects.filter(user=user).aggregate(
+            total_sessions=Count('id'),
+            total_time_seconds=Coalesce(Sum('total_duration_seconds'), 0),
+            speed_sum=Coalesce(Sum('average_speed_wpm'), 0.0),
+            accuracy_sum=Coalesce(Sum('accuracy_percentage'), 0.0),
+            best_speed=Coalesce(Max('average_speed_wpm'), 0.0)
+        )
+        summary = UserStatsSummary(user=user, **stats)
+        UserStatsSummary.objects.bulk_create(
+            [summary],
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=list(stats)
+        )
+        return summary
+
+
+class SessionImportService:
+    """
+    Импорт пачки сессий (офлайн-клиенты): вставка пачками и обновление
+    агрегатов один раз на день и на урок, а не на каждую сессию
+    """
+
+    @staticmethod
+    def import_sessions(user, items):
+        """
+        Сохранение провалидированных данных TrainingSessionSerializer.
+        Возвращает созданные сессии в порядке items
+        """
+        if not items:
+            return []
+
+        with transaction.atomic():
+            sessions = TrainingSession.objects.bulk_create([
+                TrainingSession(user=user, **{
+                    field: value for field, value in item.items()
+                    if field not in ('letter_stats', 'bigram_stats')
+                })
+                for item in items
+            ])
+
+            letter_stats = LetterStatistics.objects.bulk_create([
+                LetterStatistics(
+                    session=session, user=user,
+                    session_date=session_day(session.finished_at), **data
+                )
+                for session, item in zip(sessions, items)
+                for data in item.get('letter_stats', [])
+            ])
+            bigram_stats = BigramStatistics.objects.bulk_create([
+                BigramStatistics(
+                    session=session, user=user,
+                    session_date=session_day(session.finished_at), **data
+                )
+                for session, item in zip(sessions, items)
+                for data in item.get('bigram_stats', [])
+            ])
+
+            StatsSummaryService.add_sessions(user, sessions)
+
+            if settings.STATS_ASYNC_AGGREGATION:
+                AggregationQueue.enqueue_many(sessions)
+                return sessions
+
+            by_lesson = defaultdict(list)
+            for session in sessions:
+                if session.lesson:
+                    by_lesson[session.lesson_id].append(session)
+            for lesson_sessions in by_lesson.values():
+                UserLessonProgressSerializer.update_from_sessions(
+                    lesson_sessions
+                )
+
+            for date in sorted({
+                session_day(session.finished_at) for session in sessions
+            }):
+                DailyStatsService.recompute_day(user, date)
+            KeyTotalsService.apply_stats(user, letter_stats, bigram_stats)
+
+            problem_keys_cache.invalidate_on_commit(user.pk)
+            LessonPool.schedule_refill(user)
+
+        return sessions
+
+
+class SessionRollbackService:
+    """
+    Удаление сессий с вычитанием их вклада из агрегатов (дневная
+    статистика, итоги по клавишам, прогресс по урокам, итоги профиля)
+    без полного пересчёта
+    """
+
+    @staticmethod
+    def delete_sessions(user, sessions):
+        """Удаление сессий пользователя одной транзакцией"""
+        sessions = list(sessions)
+        if not sessions:
+            return 0
+
+        ids = [session.pk for session in sessions]
+        with transaction.atomic():
+            # Сессии из очереди агрегации ещё не учтены в дневной
+            # статистике и прогрессе - их учтёт (не учтёт) воркер
+            pending = set(AggregationJob.objects.filter(
+                session_id__in=ids
+            ).values_list('session_id', flat=True))
+            applied = [s for s in sessions if s.pk not in pending]
+            applied_ids = [session.pk for session in applied]
+
+            letter_stats = list(LetterStatistics.objects.filter(
+                session_id__in=applied_ids
+            ))
+            bigram_stats = list(BigramStatistics.objects.filter(
+                session_id__in=applied_ids
+            ))
+
+            TrainingSession.objects.filter(pk__in=ids).delete()
+
+            SessionRollbackService._rollback_daily(
+                user, applied, letter_stats, bigram_stats
+            )
+            _add_key_totals(
+                UserLetterTotals, 'letter', user,
+                [
+                    (stat.letter, stat.occurrences, stat.errors,
+                     stat.average_hit_time_ms)
+                    for stat in letter_stats
+                ],
+                sign=-1
+            )
+            _add_key_totals(
+                UserBigramTotals, 'bigram', user,
+                [
+                    (stat.bigram, stat.occurrences, stat.errors,
+                     stat.average_transition_time_ms)
+                    for stat in bigram_stats
+                ],
+                sign=-1
+            )
+            SessionRollbackService._rollback_progress(user, applied)
+            StatsSummaryService.remove_sessions(user, sessions)
+
+            problem_keys_cache.invalidate_on_commit(user.pk)
+            LessonPool.schedule_refill(user)
+
+        return len(sessions)
+
+    @staticmethod
+    def _rollback_daily(user, sessions, letter_stats, bigram_stats):
+        """Вычитание сессий из дневной статистики - по одному разу на день"""
+        by_date = defaultdict(list)
+        session_dates = {}
+        for session in sessions:
+            session_dates[session.pk] = session_day(session.finished_at)
+            by_date[session_dates[session.pk]].append(session)
+
+        # День строки - по её сессии (session_date может быть не заполнен)
+        letters_by_date = defaultdict(list)
+        for stat in letter_stats:
+            letters_by_date[session_dates[stat.session_id]].append(
+                (stat.letter, stat.occurrences, stat.errors,
+                 stat.average_hit_time_ms)
+            )
+        bigrams_by_date = defaultdict(list)
+        for stat in bigram_stats:
+            bigrams_by_date[session_dates[stat.session_id]].append(
+                (stat.bigram, stat.occurrences, stat.errors,
+                 stat.average_transition_time_ms)
+            )
+
+        for date, day_sessions in by_date.items():
+            SessionRollbackService._rollback_general(user, date, day_sessions)
+            DailyStatsService._fold_key_stats(
+                DailyLetterStatistics, 'letter', 'average_hit_time_ms',
+                user, date, letters_by_date[date], sign=-1
+            )
+            DailyStatsService._fold_key_stats(
+                DailyBigramStatistics, 'bigram', 'average_transition_time_ms',
+                user, date, bigrams_by_date[date], sign=-1
+            )
+
+    @staticmethod
+    def _rollback_general(user, date, sessions):
+        """
+        Вычитание сессий из общей дневной статистики. Лучшая скорость
+        дня перечитывается, только если удалена сессия с максимумом
+        """
+        daily = DailyStatistics.objects.select_for_update().filter(
+            user=user, date=date
+        ).first()
+        if daily is None:
+            return
+
+        remaining = daily.total_sessions - len(sessions)
+        if remaining <= 0:
+            daily.delete()
+            return
+
+        speed_sum = sum(session.average_speed_wpm for session in sessions)
+        accuracy_sum = sum(session.accuracy_percentage for session in sessions)
+        daily.average_speed_wpm = (
+            daily.average_speed_wpm * daily.total_sessions - speed_sum
+        ) / remaining
+        daily.average_accuracy_percentage = (
+            daily.average_accuracy_percentage * daily.total_sessions
+            - accuracy_sum
+        ) / remaining
+        daily.total_training_time_seconds -= sum(
+            session.total_duration_seconds for session in sessions
+        )
+        daily.total_sessions = remaining
+
+        if any(
+            session.average_speed_wpm >= daily.best_speed_wpm
+            for session in sessions
+        ):
+            start, end = _day_bounds(date)
+            daily.best_speed_wpm = TrainingSession.objects.filter(
+                user=user, finished_at__gte=start, finished_at__lt=end
+            ).aggregate(
+                best=Coalesce(Max('average_speed_wpm'), 0.0)
+            )['best']
+
+        daily.save(update_fields=[
+            'total_training_time_seconds', 'total_sessions',
+            'best_speed_wpm', 'average_speed_wpm',
+            'average_accuracy_percentage'
+        ])
+
+    @staticmethod
+    def _rollback_progress(user, sessions):
+        """
+        Вычитание сессий из прогресса по урокам. Лучшие результаты
+        и прохождение перечитываются, только если их дала удалённая сессия
+        """
+        by_lesson = defaultdict(list)
+        for session in sessions:
+            if session.lesson_id:
+                by_lesson[session.lesson_id].append(session)
+        if not by_lesson:
+            return
+
+        progresses = UserLessonProgress.objects.select_for_update().filter(
+            user=user, lesson_id__in=list(by_lesson)
+        ).select_related('lesson')
+
+        for progress in progresses:
+            removed = by_lesson[progress.lesson_id]
+            progress.completion_count -= len(removed)
+            if progress.completion_count <= 0:
+                progress.delete()
+                continue
+
+            lesson = progress.lesson
+            if any(
+                session.average_speed_wpm >= progress.best_speed
+                or session.accuracy_percentage >= progress.best_accuracy
+                or session.finished_at >= progress.last_completed_at
+                or (
+                    progress.is_passed
+                    and session.average_speed_wpm >= lesson.required_speed
+                    and session.accuracy_percentage
+                    >= lesson.required_accuracy
+                )
+                for session in removed
+            ):
+                SessionRollbackService._recompute_progress(progress)
+            progress.save()
+
+    @staticmethod
+    def _recompute_progress(progress):
+        """Лучшие результаты и прохождение урока по оставшимся сессиям"""
+        lesson = progress.lesson
+        passed = Q(
+            average_speed_wpm__gte=lesson.required_speed,
+            accuracy_percentage__gte=lesson.required_accuracy
+        )
+        # Сессии из очереди агрегации в прогрессе ещё не учтены
+        stats = TrainingSession.objects.filter(
+            user=progress.user_id, lesson=lesson,
+            aggregationjob__isnull=True
+        ).aggregate(
+            best_speed=Max('average_speed_wpm'),
+            best_accuracy=Max('accuracy_percentage'),
+            last_completed_at=Max('finished_at'),
+            passed_at=Min('finished_at', filter=passed)
+        )
+        progress.best_speed = stats['best_speed'] or 0
+        progress.best_accuracy = stats['best_accuracy'] or 0
+        progress.last_completed_at = stats['last_completed_at']
+        progress.is_passed = stats['passed_at'] is not None
+        progress.passed_at = stats['passed_at']
+
+
+class ProblemKeysService:
+    """Проблемные буквы и биграммы пользователя за всё время"""
+
+    @staticmethod
+    def letters(user, limit=15):
+        """Буквы (> 5 нажатий) по убыванию процента ошибок и времени"""
+        return _problem_keys(
+            UserLetterTotals, 'letter', user,
+            min_occurrences=5,
+            ordering=['-error_percent', '-avg_time', 'letter'],
+            limit=limit
+        )
+
+    @staticmethod
+    def bigrams(user, limit=15):
+        """Биграммы (> 3 нажатий) по убыванию процента ошибок"""
+        return _problem_keys(
+            UserBigramTotals, 'bigram', user,
+            min_occurrences=3,
+            ordering=['-error_percent', 'bigram'],
+            limit=limit
+        )
+
+
+def _problem_keys(model, key_field, user, min_occurrences, ordering, limit):
+    """
+    Чтение итогов по клавишам одним индексированным запросом:
+    процент ошибок, среднее время, фильтр, сортировка и ограничение
+    выполняются в БД. Пустой результат без итогов - пересборка
+    и повторное чтение (как StatsSummaryService.get)
+    """
+    keys = list(
+        model.objects.filter(
+            user=user,
+            total_occurrences__gt=min_occurrences
+        ).values(
+            key_field,
+            occurrences=F('total_occurrences'),
+            errors=F('total_errors'),
+        ).annotate(
+            error_percent=Round(
+                F('total_errors') * 100.0 / F('total_occurrences'), 1
+            ),
+            avg_time=Coalesce(
+                Round(
+                    F('total_time_ms') / NullIf(F('timed_occurrences'), 0), 1
+                ),
+                0.0
+            ),
+        ).order_by(*ordering)[:limit]
+    )
+    if not keys and KeyTotalsService.ensure(user):
+        return _problem_keys(
+            model, key_field, user, min_occurrences, ordering, limit
+        )
+    return keys
+
+
+class AggregationQueue:
+    """
+    Очередь отложенной агрегации (таблица AggregationJob).
+    Задачи разбирает воркер: python manage.py run_aggregation_worker
+    """
+
+    @staticmethod
+    def enqueue(session):
+        """Постановка сессии в очередь на агрегацию"""
+        return AggregationJob.objects.create(
+            user=session.user,
+            date=session_day(session.finished_at),
+            session=session
+        )
+
+    @staticmethod
+    def enqueue_many(sessions):
+        """Постановка нескольких сессий в очередь одной вставкой"""
+        return AggregationJob.objects.bulk_create([
+            AggregationJob(
+                user=session.user,
+                date=session_day(session.finished_at),
+                session=session
+            )
+            for session in sessions
+        ])
+
+    @staticmethod
+    def is_pending(user):
+        """Есть ли у пользователя необработанные сессии"""
+        return AggregationJob.objects.filter(user=user).exists()
+
+    @staticmethod
+    def process(limit=100):
+        """
+        Обработка пачки задач. Несколько сессий одного пользователя
+        за один день объединяются в один пересчёт дня.
+        Каждая группа (пользователь, день) обрабатывается в своей точке
+        сохранения: ошибка откатывает только её, задачи группы получают
+        попытку и остаются в очереди (после STATS_AGGREGATION_MAX_ATTEMPTS
+        помечаются failed).
+        Возвращает количество успешно обработанных задач.
+        """
+        with transaction.atomic():
+            jobs = list(
+                AggregationJob.objects.select_for_update(
+                    skip_locked=True, of=('self',)
+                ).filter(failed=False).select_related(
+                    'user', 'session__lesson'
+                ).order_by('id')[:limit]
             )
+            if not jobs:
+                return 0
+
+            groups = defaultdict(list)
+            for job in jobs:
+                groups[(job.user_id, job.date)].append(job)
+
+            done = []
+            for (user_id, date), group in groups.items():
+                try:
+                    with transaction.atomic():
+                        _aggregate_group(group)
+                except Exception as error:
+                    logger.exception(
+                        'Ошибка агрегации: пользователь %s, день %s',
+                        user_id, date
+                    )
+                    _record_failure(group, error)
+                else:
+                    done.extend(group)
+
+            users = {job.user_id: job.user for job in done}
+            for user_id, user in users.items():
+                problem_keys_cache.invalidate_on_commit(user_id)
+                LessonPool.schedule_refill(user)
+
+            AggregationJob.objects.filter(
+                pk__in=[job.pk for job in done]
+            ).delete()
+
+        return len(done)
+
+
+def _aggregate_group(group):
+    """Задачи одного пользователя за один день: сессии и пересчёт дня"""
+    for job in group:
+        # Сессия могла быть удалена, пока ждала в очереди
+        if not job.session:
+            continue
+        if job.session.lesson:
+            UserLessonProgressSerializer.update_from_session(job.session)
+        KeyTotalsService.apply_session(job.session)
+    DailyStatsService.recompute_day(group[0].user, group[0].date)
+
+
+def _record_failure(group, error):
+    """Неудачная попытка для задач группы; исчерпавшие попытки - failed"""
+    max_attempts = settings.STATS_AGGREGATION_MAX_ATTEMPTS
+    for job in group:
+        job.attempts += 1
+        job.failed = job.attempts >= max_attempts
+        job.last_error = f'{type(error).__name__}: {error}'
+    AggregationJob.objects.bulk_update(
+        group, ['attempts', 'failed', 'last_error']
+    )
+
+
+def _day_key_stats(model, user, date):
+    """
+    Статистика сессий по клавишам за день. Записи без session_date
+    (до backfill_session_dates) отбираются по времени окончания сессии,
+    иначе пересчёт дня удалил бы их вклад из дневной статистики
+    """
+    start, end = _day_bounds(date)
+    return model.objects.filter(user=user).filter(
+        Q(session_date=date)
+        | Q(
+            session_date__isnull=True,
+            session__finished_at__gte=start,
+            session__finished_at__lt=end
+        )
+    )
+
+
+def _day_bounds(date):
+    """Начало дня date и следующего дня в часовом поясе проекта"""
+    start = timezone.make_aware(datetime.combine(date, datetime.min.time()))
+    end = timezone.make_aware(
+        datetime.combine(date + timedelta(days=1), datetime.min.time())
+    )
+    return start, end
+
+
+def _upsert_key_stats(model, unique_fields, update_fields, objs):
+    """
+    Запись статистики по клавишам одним INSERT ... ON CONFLICT
+    (работает и в SQLite, и в PostgreSQL)
+    """
+    model.objects.bulk_create(
+        list(objs),
+        update_conflicts=True,
+        unique_fields=unique_fields,
+        update_fields=update_fields
+    )
+
+
+def _sum_rows(rows):
+    """
+    Суммирование строк (клавиша, нажатия, ошибки, среднее время) по клавише:
+    {клавиша: [нажатия, ошибки, нажатия с временем, сумма времени]}.
+    Повторы одной клавиши в сессии объединяются. Клавиши упорядочены:
+    строки вставляются и блокируются в одном порядке во всех
+    транзакциях, поэтому параллельные сессии не ждут друг друга по кругу
+    """
+    sums = {}
+    for key, occurrences, errors, average_time in rows:
+        item = sums.setdefault(key, [0, 0, 0, 0.0])
+        item[0] += occurrences
+        item[1] += errors
+        if average_time:
+            item[2] += occurrences
+            item[3] += average_time * occurrences
+    return dict(sorted(sums.items()))
+
+
+def _weighted_time(stat):
+    """Среднее время, взвешенное по количеству нажатий"""
+    if not stat['total_occurrences']:
+        return 0
+    return (stat['total_time'] or 0) / stat['total_occurrences']
@@ -0,0 +1,112 @@
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F, Sum
+from django.test import TestCase
+from django.utils import timezone
+from stats.models import TrainingSession, LetterStatistics, BigramStatistics
+from stats.services import _day_bounds
+from stats.tests.test_services import create_session
+
+User = get_user_model()
+
+
+def get_plan(queryset):
+    """План запроса (EXPLAIN) с использованием индексов, где они есть"""
+    if connection.vendor == 'postgresql':
+        # На маленьких таблицах планировщик предпочитает seq scan
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+    return queryset.explain()
+
+
+class QueryPlanTest(TestCase):
+    """
+    Планы запросов статистики используют составные индексы
+    (SQLite и PostgreSQL)
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.day = timezone.make_aware(datetime(2024, 1, 1, 12, 0))
+        for offset in range(20):
+            create_session(
+                self.user, self.day + timedelta(hours=offset * 7), 200,
+                [('а', 10, 1, 150)], [('аб', 3, 1, 200)]
+            )
+
+    def test_session_history_uses_index(self):
+        """
+        Тест: план запроса истории сессий (сортировка -finished_at)
+        Ожидается: используется индекс (user, -finished_at)
+        """
+        plan = get_plan(
+            TrainingSession.objects.filter(
+                user=self.user
+            ).order_by('-finished_at', 'id')[:50]
+        )
+        self.assertIn('session_user_finished_idx', plan)
+
+    def test_day_sessions_use_index(self):
+        """
+        Тест: план запроса сессий за день (диапазон по finished_at)
+        Ожидается: используется индекс (user, -finished_at)
+        """
+        start, end = _day_bounds(self.day.date())
+        plan = get_plan(
+            TrainingSession.objects.filter(
+                user=self.user, finished_at__gte=start, finished_at__lt=end
+            ).values('id')
+        )
+        self.assertIn('session_user_finished_idx', plan)
+
+    def test_daily_key_recompute_uses_index(self):
+        """
+        Тест: планы пересчёта дня по буквам и биграммам
+        Ожидается: индексы (user, session_date, клавиша) без JOIN с сессиями
+        """
+        for model, key_field, time_field, index in (
+            (LetterStatistics, 'letter', 'average_hit_time_ms',
+             'letter_stats_user_day_idx'),
+            (BigramStatistics, 'bigram', 'average_transition_time_ms',
+             'bigram_stats_user_day_idx'),
+        ):
+            queryset = model.objects.filter(
+                user=self.user, session_date=self.day.date()
+            ).values(key_field).annotate(
+                total_occurrences=Sum('occurrences'),
+                total_time=Sum(F(time_field) * F('occurrences'))
+            )
+            self.assertNotIn('stats_trainingsession', str(queryset.query))
+            self.assertIn(index, get_plan(queryset))
+
+    def test_session_date_in_project_timezone(self):
+        """
+        Тест: сессия поздно вечером по UTC, статистика сохранена через save()
+        Ожидается: session_date - день по часовому поясу проекта;
+        команда backfill_session_dates заполняет пустые даты так же
+        """
+        finished_at = datetime(2024, 3, 1, 22, 30, tzinfo=dt_timezone.utc)
+        session = TrainingSession.objects.create(
+            user=self.user, total_duration_seconds=60,
+            total_characters_typed=100, total_errors=0,
+            average_speed_wpm=200, accuracy_percentage=100,
+            started_at=finished_at - timedelta(seconds=60),
+            finished_at=finished_at
+        )
+        stat = LetterStatistics.objects.create(
+            session=session, user=self.user, letter='я',
+            occurrences=1, average_hit_time_ms=100
+        )
+        self.assertEqual(stat.session_date, date(2024, 3, 2))
+
+        LetterStatistics.objects.update(session_date=None)
+        call_command('backfill_session_dates', stdout=StringIO())
+        stat.refresh_from_db()
+        self.assertEqual(stat.session_date, date(2024, 3, 2))
+        self.assertFalse(
+            LetterStatistics.objects.filter(session_date__isnull=True).exists()
+        )
@@ -0,0 +1,816 @@
+import json
+import random
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Count, Max, Sum
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from lessons.models import Lesson, UserLessonProgress
+from lessons.serializers import UserLessonProgressSerializer
+from stats.models import (
+    AggregationJob,
+    TrainingSession,
+    LetterStatistics,
+    BigramStatistics,
+    DailyStatistics,
+    DailyLetterStatistics,
+    DailyBigramStatistics,
+    UserLetterTotals,
+    UserBigramTotals,
+    UserStatsSummary,
+    session_day
+)
+from stats.services import (
+    DailyStatsService,
+    KeyTotalsService,
+    SessionRollbackService,
+    StatsSummaryService,
+    AggregationQueue
+)
+
+User = get_user_model()
+
+
+def create_session(user, finished_at, speed, letters=(), bigrams=()):
+    """Сессия с вложенной статистикой, как после сериализатора"""
+    session = TrainingSession.objects.create(
+        user=user,
+        total_duration_seconds=60,
+        total_characters_typed=100,
+        total_errors=5,
+        average_speed_wpm=speed,
+        accuracy_percentage=speed / 4,
+        started_at=finished_at - timedelta(seconds=60),
+        finished_at=finished_at
+    )
+    letter_stats = LetterStatistics.objects.bulk_create([
+        LetterStatistics(
+            session=session, user=user, letter=letter,
+            session_date=session_day(finished_at),
+            occurrences=occ, errors=err, average_hit_time_ms=time
+        )
+        for letter, occ, err, time in letters
+    ])
+    bigram_stats = BigramStatistics.objects.bulk_create([
+        BigramStatistics(
+            session=session, user=user, bigram=bigram,
+            session_date=session_day(finished_at),
+            occurrences=occ, errors=err, average_transition_time_ms=time
+        )
+        for bigram, occ, err, time in bigrams
+    ])
+    return session, letter_stats, bigram_stats
+
+
+def totals_snapshot(user):
+    """Итоги пользователя по клавишам для сравнения"""
+    letters = list(UserLetterTotals.objects.filter(user=user).values_list(
+        'letter', 'total_occurrences', 'total_errors',
+        'timed_occurrences', 'total_time_ms'
+    ).order_by('letter'))
+    bigrams = list(UserBigramTotals.objects.filter(user=user).values_list(
+        'bigram', 'total_occurrences', 'total_errors',
+        'timed_occurrences', 'total_time_ms'
+    ).order_by('bigram'))
+    return letters, bigrams
+
+
+def snapshot(user):
+    """Содержимое дневных таблиц пользователя для сравнения"""
+    general = list(DailyStatistics.objects.filter(user=user).values_list(
+        'date', 'total_training_time_seconds', 'total_sessions',
+        'best_speed_wpm', 'average_speed_wpm', 'average_accuracy_percentage'
+    ).order_by('date'))
+    letters = list(DailyLetterStatistics.objects.filter(
+        user=user
+    ).values_list(
+        'date', 'letter', 'total_occurrences', 'total_errors',
+        'average_hit_time_ms'
+    ).order_by('date', 'letter'))
+    bigrams = list(DailyBigramStatistics.objects.filter(
+        user=user
+    ).values_list(
+        'date', 'bigram', 'total_occurrences', 'total_errors',
+        'average_transition_time_ms'
+    ).order_by('date', 'bigram'))
+    return general, letters, bigrams
+
+
+class DailyStatsServiceTest(TestCase):
+    """Модульные тесты инкрементального обновления дневной статистики"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.day = timezone.make_aware(datetime(2024, 1, 1, 12, 0))
+
+    def assertSnapshotsEqual(self, first, second):
+        for first_rows, second_rows in zip(first, second):
+            self.assertEqual(len(first_rows), len(second_rows))
+            for first_row, second_row in zip(first_rows, second_rows):
+                for a, b in zip(first_row, second_row):
+                    if isinstance(a, float):
+                        self.assertAlmostEqual(a, b, places=6)
+                    else:
+                        self.assertEqual(a, b)
+
+    def test_incremental_matches_full_recompute(self):
+        """
+        Тест: несколько сессий за день, применённых по одной
+        Ожидается: результат совпадает с полным пересчётом дня
+        """
+        sessions = [
+            (200, [('а', 10, 1, 150), ('б', 4, 2, 300)],
+             [('аб', 3, 1, 200)]),
+            (260, [('а', 6, 0, 120)],
+             [('аб', 5, 0, 100), ('ба', 2, 2, 400)]),
+            (180, [('б', 8, 1, 250), ('в', 3, 0, 90)], []),
+        ]
+        for offset, (speed, letters, bigrams) in enumerate(sessions):
+            session, letter_stats, bigram_stats = create_session(
+                self.user, self.day + timedelta(minutes=offset),
+                speed, letters, bigrams
+            )
+            DailyStatsService.apply_session(
+                session, letter_stats, bigram_stats
+            )
+
+        incremental = snapshot(self.user)
+
+        daily = DailyStatistics.objects.get(user=self.user)
+        self.assertEqual(daily.total_sessions, 3)
+        self.assertEqual(daily.best_speed_wpm, 260)
+        self.assertAlmostEqual(daily.average_speed_wpm, 640 / 3)
+
+        letter = DailyLetterStatistics.objects.get(user=self.user, letter='а')
+        self.assertEqual(letter.total_occurrences, 16)
+        self.assertEqual(letter.total_errors, 1)
+        self.assertAlmostEqual(
+            letter.average_hit_time_ms, (10 * 150 + 6 * 120) / 16
+        )
+
+        DailyStatsService.recompute_day(self.user, self.day.date())
+        self.assertSnapshotsEqual(incremental, snapshot(self.user))
+
+    def test_apply_session_upserts_in_batches(self):
+        """
+        Тест: сессия с сотнями биграмм поверх уже существующих записей дня
+        Ожидается: число запросов не зависит от числа ключей линейно
+        """
+        alphabet = 'абвгдежзиклмнопрст'
+        bigrams = [
+            (a + b, 2, 1, 100) for a in alphabet for b in alphabet
+        ][:300]
+        first, _, first_bigrams = create_session(
+            self.user, self.day, 200, bigrams=bigrams[:150]
+        )
+        DailyStatsService.apply_session(first, [], first_bigrams)
+
+        second, _, second_bigrams = create_session(
+            self.user, self.day + timedelta(minutes=5), 200, bigrams=bigrams
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            DailyStatsService.apply_session(second, [], second_bigrams)
+
+        self.assertLess(len(ctx.captured_queries), 20)
+        self.assertEqual(
+            DailyBigramStatistics.objects.filter(user=self.user).count(), 300
+        )
+        self.assertEqual(
+            DailyBigramStatistics.objects.get(
+                user=self.user, bigram=bigrams[0][0]
+            ).total_occurrences,
+            4
+        )
+
+    def test_apply_session_reads_stats_from_db(self):
+        """
+        Тест: статистика сессии не передана явно
+        Ожидается: она читается из БД по сессии
+        """
+        session, _, _ = create_session(
+            self.user, self.day, 200, [('а', 10, 1, 150)], [('аб', 3, 1, 200)]
+        )
+        DailyStatsService.apply_session(session)
+
+        self.assertEqual(
+            DailyLetterStatistics.objects.get(user=self.user).total_errors, 1
+        )
+        self.assertEqual(
+            DailyBigramStatistics.objects.get(user=self.user).total_occurrences,
+            3
+        )
+
+    def test_recompute_command_repairs_stale_aggregates(self):
+        """
+        Тест: дневная статистика испорчена
+        Ожидается: команда recompute_daily_stats восстанавливает её
+        """
+        session, letter_stats, bigram_stats = create_session(
+            self.user, self.day, 200, [('а', 10, 1, 150)], [('аб', 3, 1, 200)]
+        )
+        DailyStatsService.apply_session(session, letter_stats, bigram_stats)
+        expected = snapshot(self.user)
+
+        DailyStatistics.objects.update(total_sessions=42)
+        DailyLetterStatistics.objects.update(total_errors=42)
+        DailyBigramStatistics.objects.create(
+            user=self.user, date=self.day.date(), bigram='яя',
+            average_transition_time_ms=1
+        )
+
+        call_command(
+            'recompute_daily_stats', user='testuser', stdout=StringIO()
+        )
+        self.assertSnapshotsEqual(expected, snapshot(self.user))
+
+    def test_recompute_command_clears_days_without_sessions(self):
+        """
+        Тест: все сессии дня удалены, дневные записи остались
+        Ожидается: команда с --date пересчитывает этот день и удаляет их
+        """
+        session, letter_stats, bigram_stats = create_session(
+            self.user, self.day, 200, [('а', 10, 1, 150)], [('аб', 3, 1, 200)]
+        )
+        DailyStatsService.apply_session(session, letter_stats, bigram_stats)
+        session.delete()
+
+        out = StringIO()
+        call_command(
+            'recompute_daily_stats', date=self.day.date(), stdout=out
+        )
+        self.assertIn('Пересчитано дней: 1', out.getvalue())
+        for model in (
+            DailyStatistics, DailyLetterStatistics, DailyBigramStatistics
+        ):
+            self.assertFalse(model.objects.exists())
+
+    def test_recompute_keeps_rows_without_session_date(self):
+        """
+        Тест: статистика сессий сохранена до появления session_date
+        (поле не заполнено), затем день пересчитывается и сессия удаляется
+        Ожидается: пересчёт учитывает такие строки по времени сессии,
+        удаление вычитает их вклад
+        """
+        create_session(
+            self.user, self.day, 200, [('а', 10, 1, 150)], [('аб', 3, 1, 200)]
+        )
+        removed, _, _ = create_session(
+            self.user, self.day + timedelta(minutes=1), 220,
+            [('а', 4, 0, 100)]
+        )
+        LetterStatistics.objects.update(session_date=None)
+        BigramStatistics.objects.update(session_date=None)
+
+        DailyStatsService.recompute_day(self.user, self.day.date())
+        letter = DailyLetterStatistics.objects.get(user=self.user, letter='а')
+        self.assertEqual(letter.total_occurrences, 14)
+        self.assertTrue(DailyBigramStatistics.objects.filter(
+            user=self.user, bigram='аб'
+        ).exists())
+
+        SessionRollbackService.delete_sessions(self.user, [removed])
+        letter.refresh_from_db()
+        self.assertEqual(letter.total_occurrences, 10)
+
+
+class AggregationQueueTest(TestCase):
+    """Модульные тесты очереди отложенной агрегации"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.day = timezone.make_aware(datetime(2024, 1, 1, 12, 0))
+
+    def test_sessions_of_one_day_coalesced(self):
+        """
+        Тест: три сессии за один день и одна за другой день в очереди
+        Ожидается: два пересчёта дня, очередь пуста
+        """
+        for offset in range(3):
+            session, _, _ = create_session(
+                self.user, self.day + timedelta(minutes=offset), 200,
+                [('а', 10, 1, 150)]
+            )
+            AggregationQueue.enqueue(session)
+        session, _, _ = create_session(
+            self.user, self.day + timedelta(days=1), 200, [('а', 10, 1, 150)]
+        )
+        AggregationQueue.enqueue(session)
+        self.assertTrue(AggregationQueue.is_pending(self.user))
+
+        with mock.patch.object(
+            DailyStatsService, 'recompute_day',
+            wraps=DailyStatsService.recompute_day
+        ) as recompute:
+            processed = AggregationQueue.process()
+
+        self.assertEqual(processed, 4)
+        self.assertEqual(recompute.call_count, 2)
+        self.assertFalse(AggregationQueue.is_pending(self.user))
+        self.assertEqual(
+            DailyLetterStatistics.objects.get(
+                user=self.user, date=self.day.date()
+            ).total_occurrences,
+            30
+        )
+
+    def test_deleted_session_still_recomputes_day(self):
+        """
+        Тест: сессия удалена, пока ждала в очереди
+        Ожидается: задача обработана, день пересчитан без неё
+        """
+        session, _, _ = create_session(self.user, self.day, 200)
+        AggregationQueue.enqueue(session)
+        session.delete()
+
+        call_command('run_aggregation_worker', once=True, stdout=StringIO())
+
+        self.assertEqual(AggregationJob.objects.count(), 0)
+        self.assertFalse(DailyStatistics.objects.exists())
+
+    def test_queued_sessions_counted_once_without_totals(self):
+        """
+        Тест: итогов по клавишам нет, в очереди две сессии
+        Ожидается: итоги пересобираются без сессий из очереди,
+        каждая сессия учтена один раз
+        """
+        for offset in (0, 1):
+            session, _, _ = create_session(
+                self.user, self.day + timedelta(days=offset), 200,
+                [('а', 10, 1, 150)]
+            )
+            AggregationQueue.enqueue(session)
+
+        AggregationQueue.process(limit=1)
+        self.assertEqual(
+            UserLetterTotals.objects.get(letter='а').total_occurrences, 10
+        )
+        self.assertEqual(KeyTotalsService.find_mismatches(self.user), [])
+
+        AggregationQueue.process()
+        self.assertEqual(
+            UserLetterTotals.objects.get(letter='а').total_occurrences, 20
+        )
+
+    def test_failing_group_rolled_back_and_retried(self):
+        """
+        Тест: пересчёт одного из двух дней падает
+        Ожидается: другой день обработан, задачи упавшего дня остались
+        в очереди с попыткой; после STATS_AGGREGATION_MAX_ATTEMPTS
+        попыток они помечены failed и больше не берутся
+        """
+        for offset in (0, 1):
+            session, _, _ = create_session(
+                self.user, self.day + timedelta(days=offset), 200,
+                [('а', 10, 1, 150)]
+            )
+            AggregationQueue.enqueue(session)
+        bad_date = (self.day + timedelta(days=1)).date()
+        recompute_day = DailyStatsService.recompute_day
+
+        def failing_recompute(user, date):
+            recompute_day(user, date)
+            if date == bad_date:
+                raise RuntimeError('сбой')
+
+        with self.settings(STATS_AGGREGATION_MAX_ATTEMPTS=2), \
+                mock.patch.object(
+                    DailyStatsService, 'recompute_day',
+                    side_effect=failing_recompute
+                ), \
+                self.assertLogs('stats.services', 'ERROR'):
+            self.assertEqual(AggregationQueue.process(), 1)
+            job = AggregationJob.objects.get()
+            self.assertEqual((job.attempts, job.failed), (1, False))
+            self.assertIn('сбой', job.last_error)
+
+            self.assertEqual(AggregationQueue.process(), 0)
+            job.refresh_from_db()
+            self.assertEqual((job.attempts, job.failed), (2, True))
+            self.assertEqual(AggregationQueue.process(), 0)
+
+        # Откат группы: ни дня, ни итогов по клавишам от упавшей сессии
+        self.assertEqual(
+            list(DailyStatistics.objects.values_list('date', flat=True)),
+            [self.day.date()]
+        )
+        self.assertEqual(
+            UserLetterTotals.objects.get(letter='а').total_occurrences, 10
+        )
+
+        call_command(
+            'run_aggregation_worker', once=True, retry_failed=True,
+            stdout=StringIO()
+        )
+        self.assertFalse(AggregationJob.objects.exists())
+        self.assertEqual(
+            UserLetterTotals.objects.get(letter='а').total_occurrences, 20
+        )
+
+    def test_worker_survives_queue_errors(self):
+        """
+        Тест: чтение очереди падает (например, потеряно соединение с БД)
+        Ожидается: воркер пишет ошибку в лог и продолжает работу;
+        с --once - завершается с CommandError
+        """
+        calls = [RuntimeError('нет соединения'), 3, KeyboardInterrupt()]
+        out = StringIO()
+        with mock.patch.object(
+            AggregationQueue, 'process', side_effect=calls
+        ), mock.patch('time.sleep'), self.assertLogs(
+            'stats.management.commands.run_aggregation_worker', 'ERROR'
+        ):
+            call_command('run_aggregation_worker', stdout=out)
+        self.assertIn('Обработано задач: 3', out.getvalue())
+
+        with mock.patch.object(
+            AggregationQueue, 'process', side_effect=RuntimeError('сбой')
+        ), self.assertRaises(CommandError):
+            call_command('run_aggregation_worker', once=True, stdout=out)
+
+
+class KeyTotalsServiceTest(TestCase):
+    """Модульные тесты итогов по клавишам за всё время"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.day = timezone.make_aware(datetime(2024, 1, 1, 12, 0))
+
+        for offset, letters, bigrams in [
+            (0, [('а', 10, 1, 150), ('б', 4, 2, 300)], [('аб', 3, 1, 200)]),
+            (1, [('а', 6, 0, 120), ('а', 2, 1, 100)], [('аб', 5, 0, 100)]),
+            (40, [('б', 8, 1, 250)], [('ба', 2, 2, 400)]),
+        ]:
+            session, letter_stats, bigram_stats = create_session(
+                self.user, self.day + timedelta(days=offset), 200,
+                letters, bigrams
+            )
+            DailyStatsService.apply_session(
+                session, letter_stats, bigram_stats
+            )
+            KeyTotalsService.apply_session(
+                session, letter_stats, bigram_stats
+            )
+
+    def test_totals_updated_on_ingest(self):
+        """
+        Тест: сессии за разные дни
+        Ожидается: итоги суммируют все сессии и совпадают с дневными
+        """
+        letter = UserLetterTotals.objects.get(user=self.user, letter='а')
+        self.assertEqual(letter.total_occurrences, 18)
+        self.assertEqual(letter.total_errors, 2)
+        self.assertEqual(letter.timed_occurrences, 18)
+        self.assertAlmostEqual(
+            letter.total_time_ms, 10 * 150 + 6 * 120 + 2 * 100
+        )
+        self.assertEqual(
+            UserBigramTotals.objects.filter(user=self.user).count(), 2
+        )
+        self.assertEqual(KeyTotalsService.find_mismatches(self.user), [])
+
+    def test_check_command_detects_and_fixes_drift(self):
+        """
+        Тест: итоги разошлись со статистикой сессий
+        Ожидается: проверка падает, с --fix итоги пересобираются
+        """
+        UserBigramTotals.objects.filter(bigram='аб').update(total_errors=99)
+        UserLetterTotals.objects.filter(letter='б').delete()
+
+        with self.assertRaises(CommandError):
+            call_command('check_key_totals', stdout=StringIO())
+
+        call_command('check_key_totals', fix=True, stdout=StringIO())
+        self.assertEqual(KeyTotalsService.find_mismatches(self.user), [])
+        self.assertEqual(
+            UserBigramTotals.objects.get(bigram='аб').total_errors, 1
+        )
+
+    def test_backfill_command_rebuilds_from_sessions(self):
+        """
+        Тест: итоги отсутствуют (данные до появления таблиц)
+        Ожидается: команда backfill_key_totals восстанавливает их
+        """
+        UserLetterTotals.objects.all().delete()
+        UserBigramTotals.objects.all().delete()
+
+        call_command('backfill_key_totals', stdout=StringIO())
+
+        self.assertEqual(
+            UserLetterTotals.objects.get(letter='б').total_occurrences, 12
+        )
+        self.assertEqual(KeyTotalsService.find_mismatches(self.user), [])
+
+    def test_rows_seeded_and_locked_in_key_order(self):
+        """
+        Тест: сессия с клавишами не по алфавиту
+        Ожидается: пустые строки вставляются, а блокируемые читаются
+        в порядке клавиш (одинаковый порядок блокировок - без взаимных
+        блокировок параллельных сессий)
+        """
+        session, letter_stats, bigram_stats = create_session(
+            self.user, self.day + timedelta(days=2), 200,
+            [('я', 1, 0, 100), ('в', 1, 0, 100), ('к', 1, 0, 100)],
+            [('яв', 1, 0, 100), ('ак', 1, 0, 100)]
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            DailyStatsService.apply_session(
+                session, letter_stats, bigram_stats
+            )
+            KeyTotalsService.apply_session(
+                session, letter_stats, bigram_stats
+            )
+
+        for table, key_field, keys in (
+            ('stats_dailyletterstatistics', 'letter', ['в', 'к', 'я']),
+            ('stats_userlettertotals', 'letter', ['в', 'к', 'я']),
+            ('stats_userbigramtotals', 'bigram', ['ак', 'яв']),
+        ):
+            seed = next(
+                query['sql'] for query in ctx.captured_queries
+                if query['sql'].startswith('INSERT')
+                and f'"{table}"' in query['sql']
+            )
+            select = next(
+                query['sql'] for query in ctx.captured_queries
+                if query['sql'].startswith(f'SELECT "{table}"."id"')
+            )
+            self.assertLess(*(seed.index(f"'{key}'") for key in keys[:2]))
+            self.assertIn(f'ORDER BY "{table}"."{key_field}"', select)
+
+    def test_rebuild_counts_timed_occurrences_like_ingest(self):
+        """
+        Тест: в один день сессия с временем и сессия без времени по букве
+        Ожидается: пересборка даёт те же timed_occurrences, что
+        инкрементальное обновление (только нажатия с временем)
+        """
+        session, letter_stats, bigram_stats = create_session(
+            self.user, self.day + timedelta(hours=1), 200,
+            [('а', 5, 0, 0)], [('аб', 4, 1, 0)]
+        )
+        DailyStatsService.apply_session(session, letter_stats, bigram_stats)
+        KeyTotalsService.apply_session(session, letter_stats, bigram_stats)
+
+        incremental = totals_snapshot(self.user)
+        self.assertEqual(
+            UserLetterTotals.objects.get(letter='а').timed_occurrences, 18
+        )
+        self.assertEqual(KeyTotalsService.find_mismatches(self.user), [])
+
+        KeyTotalsService.rebuild(self.user)
+        self.assertEqual(totals_snapshot(self.user), incremental)
+
+        UserLetterTotals.objects.filter(letter='а').update(
+            timed_occurrences=23
+        )
+        self.assertEqual(
+            KeyTotalsService.find_mismatches(self.user),
+            [('а', 'timed_occurrences', 23, 18)]
+        )
+
+
+class StatsSummaryServiceTest(TestCase):
+    """Модульные тесты итогов пользователя для профиля"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.day = timezone.make_aware(datetime(2024, 1, 1, 12, 0))
+
+    def assertSummaryMatchesLive(self):
+        live = TrainingSession.objects.filter(user=self.user).aggregate(
+            total_sessions=Count('id'),
+            total_time=Sum('total_duration_seconds'),
+            speed_sum=Sum('average_speed_wpm'),
+            accuracy_sum=Sum('accuracy_percentage'),
+            best_speed=Max('average_speed_wpm')
+        )
+        summary = UserStatsSummary.objects.get(pk=self.user.pk)
+        self.assertEqual(summary.total_sessions, live['total_sessions'])
+        self.assertEqual(summary.total_time_seconds, live['total_time'] or 0)
+        self.assertAlmostEqual(summary.speed_sum, live['speed_sum'] or 0)
+        self.assertAlmostEqual(summary.accuracy_sum, live['accuracy_sum'] or 0)
+        self.assertEqual(summary.best_speed, live['best_speed'] or 0)
+
+    def test_random_create_delete_sequences(self):
+        """
+        Тест: случайные последовательности сохранений и удалений сессий
+        (в том числе сессий с лучшей скоростью и пачками)
+        Ожидается: после каждого шага итоги равны живому агрегату
+        """
+        for seed in range(5):
+            rng = random.Random(seed)
+            TrainingSession.objects.all().delete()
+            UserStatsSummary.objects.all().delete()
+            sessions = []
+
+            for step in range(40):
+                if sessions and rng.random() < 0.4:
+                    count = rng.choice([1, 1, 2, 3])
+                    removed = [
+                        sessions.pop(rng.randrange(len(sessions)))
+                        for _ in range(min(count, len(sessions)))
+                    ]
+                    TrainingSession.objects.filter(
+                        pk__in=[session.pk for session in removed]
+                    ).delete()
+                    StatsSummaryService.remove_sessions(self.user, removed)
+                else:
+                    session, _, _ = create_session(
+                        self.user, self.day + timedelta(minutes=step),
+                        rng.choice([150, 200, 250.5, rng.uniform(50, 400)])
+                    )
+                    sessions.append(session)
+                    StatsSummaryService.add_session(session)
+                self.assertSummaryMatchesLive()
+
+    def test_missing_summary_rebuilt_from_history(self):
+        """
+        Тест: история сессий есть, итогов нет (данные до их появления)
+        Ожидается: итоги пересобираются при чтении, новой сессии и командой
+        """
+        for offset in range(3):
+            create_session(self.user, self.day + timedelta(minutes=offset), 200)
+
+        self.assertEqual(StatsSummaryService.get(self.user).total_sessions, 3)
+
+        UserStatsSummary.objects.all().delete()
+        session, _, _ = create_session(self.user, self.day, 300)
+        StatsSummaryService.add_session(session)
+        self.assertSummaryMatchesLive()
+
+        UserStatsSummary.objects.update(total_sessions=42)
+        call_command('rebuild_stats_summary', stdout=StringIO())
+        self.assertSummaryMatchesLive()
+
+
+class ExportSessionsCommandTest(TestCase):
+    """Тесты команды выгрузки истории сессий"""
+
+    def test_export_to_stdout_and_unknown_user(self):
+        """
+        Тест: выгрузка NDJSON пачками по одной сессии, неизвестный пользователь
+        Ожидается: все сессии со статистикой, для неизвестного - ошибка
+        """
+        user = User.objects.create_user(username='testuser', password='12345')
+        day = timezone.make_aware(datetime(2024, 1, 1, 12, 0))
+        for offset in range(3):
+            create_session(
+                user, day + timedelta(minutes=offset), 200,
+                [('а', 5, 1, 100)], [('аб', 2, 0, 150)] * offset
+            )
+
+        out = StringIO()
+        call_command(
+            'export_sessions', user='testuser', export_format='ndjson',
+            chunk_size=1, stdout=out
+        )
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(
+            [len(line['bigram_stats']) for line in lines], [0, 1, 2]
+        )
+        self.assertEqual(lines[0]['letter_stats'][0]['key'], 'а')
+
+        with self.assertRaises(CommandError):
+            call_command('export_sessions', user='nobody', stdout=StringIO())
+
+
+class SessionRollbackServiceTest(TestCase):
+    """Модульные тесты удаления сессий с откатом агрегатов"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.day = timezone.make_aware(datetime(2024, 1, 1, 12, 0))
+        self.lesson = Lesson.objects.create(
+            title='Урок', description='', content='абв', order_index=1,
+            required_speed=200, required_accuracy=50, lesson_type='basic'
+        )
+
+    assertSnapshotsEqual = DailyStatsServiceTest.assertSnapshotsEqual
+
+    def ingest(self, finished_at, speed, letters=(), bigrams=(), lesson=None):
+        """Сессия, учтённая во всех агрегатах, как после сериализатора"""
+        session, letter_stats, bigram_stats = create_session(
+            self.user, finished_at, speed, letters, bigrams
+        )
+        if lesson:
+            session.lesson = lesson
+            session.save(update_fields=['lesson'])
+            UserLessonProgressSerializer.update_from_session(session)
+        DailyStatsService.apply_session(session, letter_stats, bigram_stats)
+        KeyTotalsService.apply_session(session, letter_stats, bigram_stats)
+        StatsSummaryService.add_session(session)
+        return session
+
+    def progress_snapshot(self):
+        return list(UserLessonProgress.objects.filter(
+            user=self.user
+        ).values_list(
+            'lesson', 'best_speed', 'best_accuracy', 'completion_count',
+            'last_completed_at', 'is_passed', 'passed_at'
+        ))
+
+    def assertMatchesFullRecompute(self, dates):
+        incremental = snapshot(self.user)
+        totals = totals_snapshot(self.user)
+        progress = self.progress_snapshot()
+
+        for date in dates:
+            DailyStatsService.recompute_day(self.user, date)
+        KeyTotalsService.rebuild(self.user)
+        UserLessonProgress.objects.filter(user=self.user).delete()
+        for session in TrainingSession.objects.filter(
+            user=self.user, lesson__isnull=False
+        ).order_by('finished_at'):
+            UserLessonProgressSerializer.update_from_session(session)
+
+        self.assertSnapshotsEqual(incremental, snapshot(self.user))
+        self.assertSnapshotsEqual(totals, totals_snapshot(self.user))
+        self.assertEqual(progress, self.progress_snapshot())
+
+    def test_random_deletions_match_full_recompute(self):
+        """
+        Тест: сессии за два дня, удаляемые случайными пачками
+        Ожидается: после каждого удаления агрегаты равны полному пересчёту
+        """
+        rng = random.Random(7)
+        days = [self.day, self.day + timedelta(days=1)]
+        sessions = []
+        for step in range(12):
+            finished_at = days[step // 6] + timedelta(minutes=step)
+            sessions.append(self.ingest(
+                finished_at, rng.choice([150, 220, 300.5]),
+                [(letter, rng.randint(1, 9), rng.randint(0, 3),
+                  rng.uniform(80, 300))
+                 for letter in rng.sample('абвг', 2)],
+                [(bigram, rng.randint(1, 5), rng.randint(0, 2),
+                  rng.uniform(100, 400))
+                 for bigram in rng.sample(['аб', 'бв', 'вг'], 2)],
+                lesson=self.lesson if step % 3 else None
+            ))
+
+        dates = [session_day(day) for day in days]
+        while sessions:
+            removed = [
+                sessions.pop(rng.randrange(len(sessions)))
+                for _ in range(min(rng.choice([1, 2, 3]), len(sessions)))
+            ]
+            SessionRollbackService.delete_sessions(self.user, removed)
+            self.assertMatchesFullRecompute(dates)
+
+        self.assertFalse(DailyStatistics.objects.filter(user=self.user).exists())
+        self.assertFalse(UserLetterTotals.objects.filter(user=self.user).exists())
+        self.assertFalse(
+            UserLessonProgress.objects.filter(user=self.user).exists()
+        )
+        self.assertEqual(StatsSummaryService.get(self.user).total_sessions, 0)
+
+    def test_best_speed_reread_only_when_max_deleted(self):
+        """
+        Тест: удаление обычной сессии и сессии с лучшей скоростью дня
+        Ожидается: максимум перечитывается только во втором случае
+        """
+        self.ingest(self.day, 200)
+        best = self.ingest(self.day + timedelta(minutes=1), 300)
+        slow = self.ingest(self.day + timedelta(minutes=2), 100)
+
+        with CaptureQueriesContext(connection) as queries:
+            SessionRollbackService.delete_sessions(self.user, [slow])
+        max_queries = [
+            query for query in queries.captured_queries
+            if 'MAX(' in query['sql'].upper()
+        ]
+        self.assertEqual(max_queries, [])
+
+        SessionRollbackService.delete_sessions(self.user, [best])
+        daily = DailyStatistics.objects.get(user=self.user)
+        self.assertEqual(daily.total_sessions, 1)
+        self.assertEqual(daily.best_speed_wpm, 200)
+
+    def test_pending_session_left_to_worker(self):
+        """
+        Тест: удаление сессии, ещё не обработанной очередью агрегации
+        Ожидается: дневная статистика не вычитается, воркер пересчитывает день
+        """
+        self.ingest(self.day, 200, [('а', 5, 1, 100)])
+        pending, _, _ = create_session(
+            self.user, self.day + timedelta(minutes=1), 300, [('а', 5, 0, 90)]
+        )
+        StatsSummaryService.add_session(pending)
+        AggregationJob.objects.create(
+            user=self.user, date=session_day(self.day), session=pending
+        )
+
+        SessionRollbackService.delete_sessions(self.user, [pending])
+        daily = DailyStatistics.objects.get(user=self.user)
+        self.assertEqual(daily.total_sessions, 1)
+
+        AggregationQueue.process()
+        self.assertMatchesFullRecompute([session_day(self.day)])
+        self.assertEqual(StatsSummaryService.get(self.user).total_sessions, 1)
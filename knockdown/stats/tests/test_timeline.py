@@ -0,0 +1,223 @@
+import random
+import struct
+import zlib
+from collections import defaultdict
+
+from django.test import SimpleTestCase
+from stats import timeline
+from stats.timeline import Timeline
+
+
+def legacy_key_stats(keys, intervals, errors):
+    """Та же статистика обычным циклом - для сравнения"""
+    def letter(char):
+        return '\\s' if char == ' ' else char.lower()
+
+    letters = defaultdict(lambda: [0, 0, 0, 0])
+    bigrams = defaultdict(lambda: [0, 0, 0, 0])
+    for i, char in enumerate(keys):
+        row = letters[letter(char)]
+        row[0] += 1
+        row[1] += int(errors[i])
+        if intervals[i]:
+            row[2] += intervals[i]
+            row[3] += 1
+        if i and not keys[i - 1].isspace() and not char.isspace():
+            row = bigrams[letter(keys[i - 1]) + letter(char)]
+            row[0] += 1
+            row[1] += int(errors[i])
+            if intervals[i]:
+                row[2] += intervals[i]
+                row[3] += 1
+
+    def result(rows):
+        return {
+            key: (occ, err, total / timed if timed else 0)
+            for key, (occ, err, total, timed) in rows.items()
+        }
+    return result(letters), result(bigrams)
+
+
+class TimelineFormatTest(SimpleTestCase):
+    """Тесты компактного формата записи нажатий"""
+
+    def make_timeline(self, rng, size):
+        keys = ''.join(
+            rng.choice('Мама мыла раму. ёЁ\U0001F600') for _ in range(size)
+        )
+        intervals = [rng.randint(0, 90_000) for _ in range(size)]
+        errors = [rng.random() < 0.1 for _ in range(size)]
+        return keys, intervals, errors
+
+    def test_round_trip(self):
+        """
+        Тест: запись и чтение случайных нажатий со сжатием и без
+        Ожидается: те же символы и ошибки, паузы обрезаны до uint16
+        """
+        rng = random.Random(1)
+        for size in (0, 1, 7, 2000):
+            keys, intervals, errors = self.make_timeline(rng, size)
+            source = Timeline.from_keys(keys, intervals, errors)
+            for compress in (True, False):
+                decoded = timeline.decode(timeline.encode(source, compress))
+                self.assertEqual(decoded.keys, keys)
+                self.assertEqual(
+                    decoded.intervals.tolist(),
+                    [min(value, 65535) for value in intervals]
+                )
+                self.assertEqual(decoded.errors.tolist(), errors)
+
+    def test_compact_size(self):
+        """
+        Тест: 2000 нажатий русских букв
+        Ожидается: коды по байту до сжатия, после сжатия - меньше
+        """
+        rng = random.Random(2)
+        keys = ''.join(rng.choice('мамамылараму') for _ in range(2000))
+        source = Timeline.from_keys(
+            keys, [rng.randint(80, 400) for _ in keys], [False] * 2000
+        )
+        raw = timeline.encode(source, compress=False)
+        self.assertEqual(
+            len(raw), timeline.HEADER.size + 2000 * 3 + 2000 // 8
+        )
+        self.assertLess(len(timeline.encode(source)), len(raw))
+
+    def test_corrupted_data_rejected(self):
+        """
+        Тест: обрезанная, дополненная, чужая и «раздутая» запись;
+        разности кодов, уводящие за пределы Unicode или в суррогаты
+        Ожидается: ValueError
+        """
+        data = timeline.encode(
+            Timeline.from_keys('абв', [0, 100, 120], [0, 1, 0])
+        )
+        header = timeline.HEADER.pack(
+            b'KT', 1, timeline.FLAG_ZLIB | (1 << 1), 10, 1072
+        )
+        bomb = header + zlib.compress(b'\0' * 10_000_000)
+        bad_codes = [
+            self.raw_record(first, delta)
+            for first, delta in (
+                (1072, -1073), (1072, 0x10FFFF), (0xD7FF, 1), (0, 0)
+            )
+        ]
+        for bad in (
+            data[:-3], data + b'x', b'XX' + data[2:], b'', bomb, *bad_codes
+        ):
+            with self.assertRaises(ValueError):
+                timeline.decode(bad)
+
+        with self.assertRaises(ValueError):
+            timeline.encode(Timeline.from_keys('а\ud800', [0, 1], [0, 0]))
+
+    def raw_record(self, first, delta):
+        """Запись из двух нажатий без сжатия с произвольной разностью кодов"""
+        zigzag = (delta << 1) ^ (delta >> 63)
+        return (
+            timeline.HEADER.pack(b'KT', 1, 2 << 1, 2, first)
+            + struct.pack('<II', 0, zigzag & 0xFFFFFFFF)
+            + struct.pack('<HH', 0, 100)
+            + b'\0'
+        )
+
+    def test_key_stats_match_python_implementation(self):
+        """
+        Тест: статистика по случайным нажатиям
+        Ожидается: совпадает с подсчётом обычным циклом
+        """
+        rng = random.Random(3)
+        keys, intervals, errors = self.make_timeline(rng, 3000)
+        intervals = [min(value, 65535) for value in intervals]
+        letters, bigrams = timeline.key_stats(
+            Timeline.from_keys(keys, intervals, errors)
+        )
+        expected_letters, expected_bigrams = legacy_key_stats(
+            keys, intervals, errors
+        )
+
+        for rows, expected, key_field, time_field in (
+            (letters, expected_letters, 'letter', 'average_hit_time_ms'),
+            (bigrams, expected_bigrams, 'bigram',
+             'average_transition_time_ms'),
+        ):
+            self.assertEqual(
+                {row[key_field] for row in rows}, set(expected)
+            )
+            for row in rows:
+                occ, err, time = expected[row[key_field]]
+                self.assertEqual(row['occurrences'], occ)
+                self.assertEqual(row['errors'], err)
+                self.assertAlmostEqual(row[time_field], time)
+
+
+class RawInputTest(SimpleTestCase):
+    """Тесты статистики по исходному вводу"""
+
+    def test_alignment_and_intervals(self):
+        """
+        Тест: набранный текст с ошибкой и недонабранным хвостом
+        Ожидается: ошибки по несовпадению символов, интервалы - разности
+        моментов, символ нажатия - из текста урока
+        """
+        keys = timeline.from_raw_input(
+            'Мама мыла', 'Мажа м', [5, 105, 225, 355, 655, 745]
+        )
+        self.assertEqual(keys.keys, 'Мама м')
+        self.assertEqual(keys.intervals.tolist(), [0, 100, 120, 130, 300, 90])
+        self.assertEqual(
+            keys.errors.tolist(), [False, False, True, False, False, False]
+        )
+
+        letters, bigrams = timeline.key_stats(keys)
+        letters = {row['letter']: row for row in letters}
+        self.assertEqual(letters['м']['occurrences'], 3)
+        self.assertEqual(letters['м']['errors'], 1)
+        self.assertEqual(letters['м']['average_hit_time_ms'], 105)
+        self.assertEqual(
+            {row['bigram'] for row in bigrams}, {'ма', 'ам'}
+        )
+
+    def test_invalid_input_rejected(self):
+        """
+        Тест: разные длины, лишние символы, моменты не по порядку
+        Ожидается: ValueError
+        """
+        for text, typed, timestamps in (
+            ('абв', 'аб', [0]),
+            ('аб', 'абв', [0, 1, 2]),
+            ('абв', 'абв', [0, 200, 100]),
+        ):
+            with self.assertRaises(ValueError):
+                timeline.from_raw_input(text, typed, timestamps)
+
+    def test_2000_keystrokes_match_python_implementation(self):
+        """
+        Тест: статистика по 2000 нажатий исходного ввода
+        (время - scripts/benchmark_key_stats.py)
+        Ожидается: совпадает с подсчётом обычным циклом
+        """
+        rng = random.Random(4)
+        text = ''.join(
+            rng.choice('съешь же ещё этих булок ') for _ in range(2000)
+        )
+        typed = ''.join(
+            char if rng.random() > 0.05 else 'ф' for char in text
+        )
+        timestamps = [
+            index * 150 + rng.randint(0, 100) for index in range(2000)
+        ]
+
+        letters, _ = timeline.key_stats(
+            timeline.from_raw_input(text, typed, timestamps)
+        )
+        intervals = [0] + [
+            b - a for a, b in zip(timestamps, timestamps[1:])
+        ]
+        expected, _ = legacy_key_stats(
+            text, intervals, [a != b for a, b in zip(text, typed)]
+        )
+        for row in letters:
+            occ, err, time = expected[row['letter']]
+            self.assertEqual((row['occurrences'], row['errors']), (occ, err))
+            self.assertAlmostEqual(row['average_hit_time_ms'], time)
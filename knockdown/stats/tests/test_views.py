@@ -1,10 +1,39 @@
+import base64
+import csv
+import json
+import random
+from datetime import date, datetime, timedelta
+from io import StringIO
+from unittest import mock
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.utils import timezone
 from lessons.models import Lesson, UserLessonProgress
-from stats.models import TrainingSession
+from stats import timeline
+from stats.models import (
+    AggregationJob,
+    TrainingSession,
+    LetterStatistics,
+    BigramStatistics,
+    DailyStatistics,
+    DailyLetterStatistics,
+    DailyBigramStatistics,
+    UserLetterTotals,
+    UserBigramTotals
+)
+from stats.services import (
+    AggregationQueue,
+    DailyStatsService,
+    KeyTotalsService,
+    ProblemKeysService
+)
 
 User = get_user_model()
 
@@ -57,7 +86,7 @@ class TrainingSessionAPITest(APITestCase):
 
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
     def test_create_session_authorized(self):
         """
@@ -81,6 +110,47 @@ class TrainingSessionAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(TrainingSession.objects.count(), 1)
 
+    def test_first_session_keeps_history_in_key_totals(self):
+        """
+        Тест: у пользователя есть история без итогов по клавишам
+        (до их появления), он сохраняет новую сессию
+        Ожидается: итоги включают и историю, и новую сессию
+        """
+        self.client.force_authenticate(user=self.user)
+        finished_at = timezone.now() - timedelta(days=400)
+        old = TrainingSession.objects.create(
+            user=self.user, total_duration_seconds=60,
+            total_characters_typed=100, total_errors=50,
+            average_speed_wpm=120, accuracy_percentage=50,
+            started_at=finished_at, finished_at=finished_at
+        )
+        LetterStatistics.objects.create(
+            session=old, user=self.user, letter='ы',
+            occurrences=100, errors=50, average_hit_time_ms=200
+        )
+
+        response = self.client.post(self.url, {
+            'total_duration_seconds': 60,
+            'total_characters_typed': 10,
+            'total_errors': 1,
+            'average_speed_wpm': 120,
+            'accuracy_percentage': 90,
+            'started_at': '2024-01-01T10:00:00Z',
+            'finished_at': '2024-01-01T10:01:00Z',
+            'letter_stats': [{
+                'letter': 'а', 'occurrences': 10, 'errors': 1,
+                'average_hit_time_ms': 150
+            }],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.get('/api/stats/letters/')
+        self.assertEqual(
+            {item['letter']: item['occurrences'] for item in response.data},
+            {'ы': 100, 'а': 10}
+        )
+        self.assertEqual(KeyTotalsService.find_mismatches(self.user), [])
+
     def test_create_session_without_auth(self):
         """
         Тест: создание сессии без авторизации
@@ -157,3 +227,896 @@ class TrainingSessionAPITest(APITestCase):
         self.assertEqual(progress.completion_count, 1)
 
         self.assertTrue(progress.is_passed)
+
+
+class TrainingSessionListAPITest(APITestCase):
+    """Интеграционные тесты истории сессий: пагинация и выборка полей"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.lesson = Lesson.objects.create(
+            title='Базовый урок',
+            content='текст для тренировки',
+            required_speed=100,
+            required_accuracy=90,
+            difficulty_level=1,
+            lesson_type='basic'
+        )
+        start = timezone.now() - timedelta(days=30)
+        TrainingSession.objects.bulk_create([
+            TrainingSession(
+                user=self.user,
+                lesson=self.lesson if index % 2 else None,
+                total_duration_seconds=60,
+                total_characters_typed=100,
+                total_errors=5,
+                average_speed_wpm=100 + index,
+                accuracy_percentage=95,
+                # Пары сессий с одинаковым временем окончания
+                started_at=start + timedelta(minutes=index // 2 * 5),
+                finished_at=start + timedelta(minutes=index // 2 * 5, seconds=60)
+            )
+            for index in range(120)
+        ])
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('session-list')
+
+    def test_cursor_pagination_walks_all_sessions(self):
+        """
+        Тест: обход истории по ссылкам next
+        Ожидается: все сессии ровно один раз, от новых к старым,
+        число запросов на страницу не зависит от числа уроков
+        """
+        seen = []
+        url = self.url + '?page_size=50'
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 50)
+            seen.extend(response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(len(seen), 120)
+        self.assertEqual(len({item['id'] for item in seen}), 120)
+        finished = [item['finished_at'] for item in seen]
+        self.assertEqual(finished, sorted(finished, reverse=True))
+        self.assertIn('Базовый урок', {item.get('lesson_title') for item in seen})
+
+    def test_sparse_fields(self):
+        """
+        Тест: запрос только скорости, точности и времени окончания
+        Ожидается: в ответе только эти поля; неизвестное поле - 400
+        """
+        response = self.client.get(
+            self.url,
+            {'fields': 'average_speed_wpm,accuracy_percentage,finished_at'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            set(response.data['results'][0]),
+            {'average_speed_wpm', 'accuracy_percentage', 'finished_at'}
+        )
+
+        response = self.client.get(self.url, {'fields': 'id,letter_stats'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DashboardAPITest(APITestCase):
+    """Интеграционные тесты краткой статистики профиля"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def create(self, speed, minute):
+        return self.client.post(reverse('session-list'), {
+            'total_duration_seconds': 60,
+            'total_characters_typed': 100,
+            'total_errors': 5,
+            'average_speed_wpm': speed,
+            'accuracy_percentage': 90,
+            'started_at': f'2024-01-01T10:{minute:02d}:00Z',
+            'finished_at': f'2024-01-01T10:{minute + 1:02d}:00Z'
+        }, format='json').data['id']
+
+    def test_dashboard_follows_create_and_delete(self):
+        """
+        Тест: три сессии, затем удаление сессии с лучшей скоростью
+        Ожидается: итоги читаются по первичному ключу и учитывают удаление
+        """
+        self.create(100, 0)
+        best = self.create(300, 10)
+        self.create(200, 20)
+
+        with self.assertNumQueries(2):  # итоги + очередь агрегации
+            response = self.client.get('/api/stats/dashboard/')
+        self.assertEqual(response.data['total_sessions'], 3)
+        self.assertEqual(response.data['best_speed'], 300)
+        self.assertEqual(response.data['avg_speed'], 200)
+        self.assertEqual(response.data['total_time'], 3)
+
+        self.client.delete(reverse('session-detail', args=[best]))
+
+        response = self.client.get('/api/stats/dashboard/')
+        self.assertEqual(response.data['total_sessions'], 2)
+        self.assertEqual(response.data['best_speed'], 200)
+        self.assertEqual(response.data['avg_speed'], 150)
+
+    def test_delete_last_sessions(self):
+        """
+        Тест: удаление двух последних сессий и неверный count
+        Ожидается: удалены самые поздние, дневная статистика откатана,
+        при неверном count - 400 без удаления
+        """
+        first = self.create(100, 0)
+        self.create(300, 10)
+        self.create(200, 20)
+
+        response = self.client.delete('/api/stats/sessions/last/?count=x')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(TrainingSession.objects.count(), 3)
+
+        response = self.client.delete('/api/stats/sessions/last/?count=2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'deleted': 2})
+        self.assertEqual(
+            list(TrainingSession.objects.values_list('id', flat=True)),
+            [first]
+        )
+
+        daily = DailyStatistics.objects.get(user=self.user)
+        self.assertEqual(daily.total_sessions, 1)
+        self.assertEqual(daily.best_speed_wpm, 100)
+        self.assertEqual(daily.average_speed_wpm, 100)
+        self.assertEqual(
+            self.client.get('/api/stats/dashboard/').data['best_speed'], 100
+        )
+
+
+class SessionExportAPITest(APITestCase):
+    """Интеграционные тесты потоковой выгрузки истории сессий"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        other = User.objects.create_user(username='other', password='12345')
+        start = timezone.now() - timedelta(days=3)
+        for user in (self.user, other):
+            for index in range(5):
+                session = TrainingSession.objects.create(
+                    user=user,
+                    total_duration_seconds=60,
+                    total_characters_typed=100,
+                    total_errors=5,
+                    average_speed_wpm=100 + index,
+                    accuracy_percentage=95,
+                    started_at=start + timedelta(minutes=index),
+                    finished_at=start + timedelta(minutes=index, seconds=60)
+                )
+                LetterStatistics.objects.bulk_create([
+                    LetterStatistics(
+                        session=session, user=user, letter=letter,
+                        occurrences=10, errors=index, average_hit_time_ms=150
+                    )
+                    for letter in 'аб'[:index % 3]
+                ])
+                if index % 2:
+                    BigramStatistics.objects.create(
+                        session=session, user=user, bigram='аб',
+                        occurrences=4, errors=1,
+                        average_transition_time_ms=200
+                    )
+        self.client.force_authenticate(user=self.user)
+
+    def export(self, export_format):
+        response = self.client.get(
+            f'/api/stats/export/?export_format={export_format}'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_ndjson_nested_stats_with_constant_queries(self):
+        """
+        Тест: выгрузка NDJSON пачками по две сессии
+        Ожидается: сессия на строку со вложенной статистикой,
+        только свои данные, три запроса на пачку (сессии, буквы, биграммы)
+        """
+        with mock.patch('stats.export.CHUNK_SIZE', 2), \
+                self.assertNumQueries(9):
+            response, content = self.export('ndjson')
+        self.assertTrue(response['Content-Type'].startswith(
+            'application/x-ndjson'
+        ))
+
+        sessions = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(sessions), 5)
+        self.assertEqual(
+            {session['id'] for session in sessions},
+            set(TrainingSession.objects.filter(
+                user=self.user
+            ).values_list('id', flat=True))
+        )
+        self.assertEqual(
+            [len(session['letter_stats']) for session in sessions],
+            [0, 1, 2, 0, 1]
+        )
+        self.assertEqual(
+            [len(session['bigram_stats']) for session in sessions],
+            [0, 1, 0, 1, 0]
+        )
+        self.assertEqual(sessions[2]['letter_stats'][1], {
+            'key': 'б', 'occurrences': 10, 'errors': 2,
+            'average_time_ms': 150.0
+        })
+
+    def test_csv_flat_rows(self):
+        """
+        Тест: выгрузка CSV и неизвестный формат
+        Ожидается: строка на сессию и на каждую строку статистики,
+        для неизвестного формата - 400
+        """
+        response, content = self.export('csv')
+        self.assertIn('sessions.csv', response['Content-Disposition'])
+
+        rows = list(csv.DictReader(content.splitlines()))
+        records = [row['record'] for row in rows]
+        self.assertEqual(records.count('session'), 5)
+        self.assertEqual(records.count('letter'), 4)
+        self.assertEqual(records.count('bigram'), 2)
+        self.assertEqual(rows[0]['average_speed_wpm'], '100.0')
+        self.assertEqual(rows[-1]['key'], 'а')
+
+        response = self.client.get('/api/stats/export/?export_format=xml')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SessionImportAPITest(APITestCase):
+    """Интеграционные тесты импорта пачки сессий"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.lesson = Lesson.objects.create(
+            title='Базовый урок',
+            content='текст для тренировки',
+            required_speed=100,
+            required_accuracy=90,
+            difficulty_level=1,
+            lesson_type='basic'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.url = '/api/stats/sessions/import/'
+
+    def make_item(self, day, minute, speed, lesson=True):
+        return {
+            'lesson': self.lesson.id if lesson else None,
+            'total_duration_seconds': 60,
+            'total_characters_typed': 100,
+            'total_errors': 5,
+            'average_speed_wpm': speed,
+            'accuracy_percentage': 95,
+            'started_at': f'2024-01-{day:02d}T10:{minute:02d}:00Z',
+            'finished_at': f'2024-01-{day:02d}T10:{minute + 1:02d}:00Z',
+            'letter_stats': [{
+                'letter': 'а', 'occurrences': 10, 'errors': 1,
+                'average_hit_time_ms': 150
+            }],
+            'bigram_stats': [{
+                'bigram': 'аб', 'occurrences': 4, 'errors': 0,
+                'average_transition_time_ms': 200
+            }]
+        }
+
+    def test_batch_imported_with_one_recompute_per_day(self):
+        """
+        Тест: пачка из сессий за два дня и одной ошибочной сессии
+        Ожидается: ошибочная пропущена с ошибками, остальные сохранены,
+        день пересчитан один раз, прогресс и итоги учитывают всю пачку
+        """
+        items = [
+            self.make_item(1, 0, 80),
+            self.make_item(1, 10, 120),
+            {**self.make_item(1, 20, 150), 'accuracy_percentage': 150},
+            self.make_item(2, 0, 110),
+            self.make_item(2, 10, 90, lesson=False),
+        ]
+        with mock.patch.object(
+            DailyStatsService, 'recompute_day',
+            wraps=DailyStatsService.recompute_day
+        ) as recompute:
+            response = self.client.post(self.url, items, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 4)
+        self.assertEqual(response.data['failed'], 1)
+        self.assertIn('accuracy_percentage', response.data['results'][2]['errors'])
+        self.assertNotIn('id', response.data['results'][2])
+        self.assertEqual(recompute.call_count, 2)
+
+        ids = [
+            result['id'] for result in response.data['results']
+            if 'id' in result
+        ]
+        self.assertEqual(
+            list(TrainingSession.objects.order_by('id').values_list(
+                'average_speed_wpm', flat=True
+            )),
+            [80, 120, 110, 90]
+        )
+        self.assertEqual(sorted(ids), list(
+            TrainingSession.objects.order_by('id').values_list('id', flat=True)
+        ))
+        self.assertEqual(LetterStatistics.objects.count(), 4)
+
+        daily = DailyStatistics.objects.get(user=self.user, date=date(2024, 1, 1))
+        self.assertEqual(daily.total_sessions, 2)
+        self.assertEqual(daily.best_speed_wpm, 120)
+        self.assertEqual(
+            DailyLetterStatistics.objects.get(
+                user=self.user, date=date(2024, 1, 2), letter='а'
+            ).total_occurrences,
+            20
+        )
+
+        progress = UserLessonProgress.objects.get(user=self.user)
+        self.assertEqual(progress.completion_count, 3)
+        self.assertEqual(progress.best_speed, 120)
+        self.assertTrue(progress.is_passed)
+        self.assertEqual(progress.passed_at.day, 1)
+        self.assertEqual(progress.last_completed_at.day, 2)
+
+        dashboard = self.client.get('/api/stats/dashboard/').data
+        self.assertEqual(dashboard['total_sessions'], 4)
+        self.assertEqual(dashboard['best_speed'], 120)
+
+    def test_invalid_batches_rejected(self):
+        """
+        Тест: не массив, все элементы ошибочны, слишком большая пачка
+        Ожидается: 400 и ни одной сохранённой сессии
+        """
+        response = self.client.post(
+            self.url, self.make_item(1, 0, 80), format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(
+            self.url, [{'average_speed_wpm': -1}], format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['failed'], 1)
+
+        with override_settings(STATS_IMPORT_MAX_SESSIONS=1):
+            response = self.client.post(
+                self.url,
+                [self.make_item(1, 0, 80), self.make_item(1, 10, 80)],
+                format='json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(TrainingSession.objects.exists())
+
+    @override_settings(STATS_ASYNC_AGGREGATION=True)
+    def test_async_mode_enqueues_batch(self):
+        """
+        Тест: импорт при отложенной агрегации
+        Ожидается: задачи в очереди, после воркера - дневная статистика
+        """
+        response = self.client.post(
+            self.url,
+            [self.make_item(1, 0, 80), self.make_item(1, 10, 120)],
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(AggregationJob.objects.count(), 2)
+        self.assertFalse(DailyStatistics.objects.exists())
+
+        AggregationQueue.process()
+        daily = DailyStatistics.objects.get(user=self.user)
+        self.assertEqual(daily.total_sessions, 2)
+        self.assertEqual(
+            UserLessonProgress.objects.get(user=self.user).completion_count, 2
+        )
+
+
+class KeystrokeTimelineAPITest(APITestCase):
+    """Интеграционные тесты сессий с записью нажатий"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('session-list')
+
+    def post(self, keystrokes, **extra):
+        return self.client.post(self.url, {
+            'total_duration_seconds': 60,
+            'total_characters_typed': 9,
+            'total_errors': 2,
+            'average_speed_wpm': 120,
+            'accuracy_percentage': 80,
+            'started_at': '2024-01-01T10:00:00Z',
+            'finished_at': '2024-01-01T10:01:00Z',
+            **({'keystrokes': keystrokes} if keystrokes else {}),
+            **extra
+        }, format='json')
+
+    def test_stats_derived_from_timeline(self):
+        """
+        Тест: сессия с записью нажатий и расходящейся статистикой клиента
+        Ожидается: статистика посчитана по записи, запись доступна
+        для повтора и не попадает в историю
+        """
+        keys = timeline.Timeline.from_keys(
+            'Мама мыла', [0, 100, 120, 130, 300, 90, 100, 110, 105],
+            [0, 0, 1, 0, 0, 0, 0, 1, 0]
+        )
+        encoded = base64.b64encode(timeline.encode(keys)).decode()
+        response = self.post(encoded, letter_stats=[{
+            'letter': 'я', 'occurrences': 99, 'errors': 99,
+            'average_hit_time_ms': 1
+        }])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('keystrokes', response.data)
+
+        letters = {
+            stat.letter: stat for stat in LetterStatistics.objects.all()
+        }
+        self.assertEqual(set(letters), {'м', 'а', 'ы', 'л', '\\s'})
+        self.assertEqual(letters['м'].occurrences, 3)
+        self.assertEqual(letters['м'].errors, 1)
+        self.assertAlmostEqual(letters['а'].average_hit_time_ms, 335 / 3)
+        bigram = BigramStatistics.objects.get(bigram='ма')
+        self.assertEqual(bigram.occurrences, 2)
+        self.assertEqual(bigram.average_transition_time_ms, 115)
+        self.assertEqual(
+            DailyLetterStatistics.objects.get(letter='м').total_occurrences, 3
+        )
+
+        session_id = response.data['id']
+        response = self.client.get(
+            reverse('session-keystroke-timeline', args=[session_id])
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['keys'], 'Мама мыла')
+        self.assertEqual(response.data['intervals'][4], 300)
+        self.assertEqual(response.data['errors'][2], True)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertNotIn('keystrokes', response.data['results'][0])
+
+    def test_stats_computed_from_raw_input(self):
+        """
+        Тест: сессия с исходным вводом вместо статистики; вместе с keystrokes
+        Ожидается: статистика посчитана сервером, запись нажатий сохранена;
+        оба поля сразу и лишние символы - 400
+        """
+        raw_input = {
+            'text': 'Мама мыла раму',
+            'typed': 'Мажа мыла',
+            'timestamps': [0, 100, 220, 350, 650, 740, 840, 950, 1055],
+        }
+        response = self.post(None, raw_input=raw_input)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        letter = LetterStatistics.objects.get(letter='м')
+        self.assertEqual(letter.occurrences, 3)
+        self.assertEqual(letter.errors, 1)
+        self.assertEqual(letter.average_hit_time_ms, 105)
+        self.assertEqual(
+            BigramStatistics.objects.get(bigram='ыл').errors, 0
+        )
+        response = self.client.get(
+            reverse('session-keystroke-timeline', args=[response.data['id']])
+        )
+        self.assertEqual(response.data['keys'], 'Мама мыла')
+
+        encoded = base64.b64encode(timeline.encode(
+            timeline.Timeline.from_keys('аб', [0, 100], [0, 0])
+        )).decode()
+        for keystrokes, data in (
+            (encoded, raw_input),
+            (None, {**raw_input, 'typed': 'Мама мыла раму!'}),
+        ):
+            response = self.post(keystrokes, raw_input=data)
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST
+            )
+            self.assertIn('raw_input', response.data)
+        self.assertEqual(TrainingSession.objects.count(), 1)
+
+    def test_oversized_raw_input_rejected(self):
+        """
+        Тест: исходный ввод длиннее MAX_KEYSTROKES
+        Ожидается: 400 по raw_input, сессия не сохранена
+        """
+        size = timeline.MAX_KEYSTROKES + 1
+        response = self.post(None, raw_input={
+            'text': 'а' * size,
+            'typed': 'а' * size,
+            'timestamps': list(range(size)),
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('raw_input', response.data)
+        self.assertFalse(TrainingSession.objects.exists())
+
+    def test_invalid_timeline_rejected(self):
+        """
+        Тест: не base64, повреждённая запись; сессия без записи
+        Ожидается: 400 без сохранения; 404 на запрос записи
+        """
+        data = base64.b64encode(timeline.encode(
+            timeline.Timeline.from_keys('аб', [0, 100], [0, 0])
+        )[:-2]).decode()
+        for keystrokes in ('не base64', data):
+            response = self.post(keystrokes)
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST
+            )
+            self.assertIn('keystrokes', response.data)
+        self.assertFalse(TrainingSession.objects.exists())
+
+        session_id = self.client.post(self.url, {
+            'total_duration_seconds': 60,
+            'total_characters_typed': 9,
+            'total_errors': 2,
+            'average_speed_wpm': 120,
+            'accuracy_percentage': 80,
+            'started_at': '2024-01-01T10:00:00Z',
+            'finished_at': '2024-01-01T10:01:00Z',
+        }, format='json').data['id']
+        response = self.client.get(
+            reverse('session-keystroke-timeline', args=[session_id])
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TrainingSessionBulkInsertTest(APITestCase):
+    """Бенчмарк количества запросов при сохранении большой сессии"""
+
+    LETTERS = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюя'
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('session-list')
+
+    def make_session_data(self, bigrams_count):
+        bigrams = [
+            a + b for a in self.LETTERS for b in self.LETTERS
+        ][:bigrams_count]
+        return {
+            'total_duration_seconds': 60,
+            'total_characters_typed': 1000,
+            'total_errors': 10,
+            'average_speed_wpm': 300,
+            'accuracy_percentage': 99,
+            'started_at': '2024-01-01T10:00:00Z',
+            'finished_at': '2024-01-01T10:01:00Z',
+            'letter_stats': [
+                {
+                    'letter': letter,
+                    'occurrences': 10,
+                    'errors': 1,
+                    'average_hit_time_ms': 150
+                }
+                for letter in self.LETTERS
+            ],
+            'bigram_stats': [
+                {
+                    'bigram': bigram,
+                    'occurrences': 3,
+                    'errors': 0,
+                    'average_transition_time_ms': 180
+                }
+                for bigram in bigrams
+            ],
+        }
+
+    def count_inserts(self, queries, table):
+        return sum(
+            1 for query in queries
+            if query['sql'].startswith(f'INSERT INTO "{table}"')
+        )
+
+    def test_500_bigram_session_query_count(self):
+        """
+        Тест: сессия с 33 буквами и 500 биграммами
+        Ожидается: статистика пишется пачками, а не по строке на ключ
+        """
+        data = self.make_session_data(500)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(self.url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(LetterStatistics.objects.count(), 33)
+        self.assertEqual(BigramStatistics.objects.count(), 500)
+
+        letter_inserts = self.count_inserts(
+            ctx.captured_queries, LetterStatistics._meta.db_table
+        )
+        bigram_inserts = self.count_inserts(
+            ctx.captured_queries, BigramStatistics._meta.db_table
+        )
+
+        self.assertEqual(letter_inserts, 1)
+        # SQLite ограничивает число параметров, поэтому пачек может быть
+        # несколько, но их число не зависит от числа строк линейно
+        self.assertLess(bigram_inserts, 10)
+        # Вместе с агрегатами и первой сборкой итогов по клавишам
+        # (в SQLite - 52 запроса); по запросу на строку было бы больше 500
+        self.assertLessEqual(len(ctx.captured_queries), 60)
+
+    def test_invalid_nested_stats_rejected_without_writes(self):
+        """
+        Тест: невалидная вложенная статистика
+        Ожидается: 400 и ни одной записи в БД
+        """
+        data = self.make_session_data(5)
+        data['bigram_stats'][0].pop('average_transition_time_ms')
+
+        response = self.client.post(self.url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(TrainingSession.objects.count(), 0)
+        self.assertEqual(BigramStatistics.objects.count(), 0)
+
+
+@override_settings(STATS_ASYNC_AGGREGATION=True)
+class AsyncAggregationAPITest(APITestCase):
+    """Интеграционные тесты отложенной агрегации"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.lesson = Lesson.objects.create(
+            title='Базовый урок',
+            content='текст для тренировки',
+            required_speed=100,
+            required_accuracy=90,
+            difficulty_level=1,
+            lesson_type='basic'
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_aggregates_pending_until_worker_runs(self):
+        """
+        Тест: сессия сохранена при включённой очереди
+        Ожидается: дашборд сообщает о незавершённой агрегации,
+        после воркера прогресс и дневная статистика обновлены
+        """
+        data = {
+            'lesson': self.lesson.id,
+            'total_duration_seconds': 60,
+            'total_characters_typed': 100,
+            'total_errors': 5,
+            'average_speed_wpm': 120,
+            'accuracy_percentage': 95,
+            'started_at': '2024-01-01T10:00:00Z',
+            'finished_at': '2024-01-01T10:01:00Z'
+        }
+        response = self.client.post(reverse('session-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(UserLessonProgress.objects.exists())
+        self.assertFalse(DailyStatistics.objects.exists())
+
+        response = self.client.get('/api/stats/dashboard/')
+        self.assertTrue(response.data['aggregates_pending'])
+        response = self.client.get('/api/stats/daily/')
+        self.assertEqual(response['X-Aggregates-Pending'], 'true')
+
+        call_command('run_aggregation_worker', once=True, stdout=StringIO())
+
+        response = self.client.get('/api/stats/dashboard/')
+        self.assertFalse(response.data['aggregates_pending'])
+        response = self.client.get('/api/stats/daily/')
+        self.assertEqual(response['X-Aggregates-Pending'], 'false')
+        self.assertEqual(len(response.data), 1)
+        self.assertTrue(
+            UserLessonProgress.objects.get(user=self.user).is_passed
+        )
+
+
+def legacy_problem_keys(stats, key_field, time_field, min_occurrences):
+    """Прежняя реализация агрегации в Python (эталон для сравнения)"""
+    aggregated = {}
+    for stat in stats:
+        key = getattr(stat, key_field)
+        if key not in aggregated:
+            aggregated[key] = {
+                'occurrences': 0, 'errors': 0, 'total_time': 0, 'count': 0
+            }
+        aggregated[key]['occurrences'] += stat.total_occurrences
+        aggregated[key]['errors'] += stat.total_errors
+        if getattr(stat, time_field):
+            aggregated[key]['total_time'] += (
+                getattr(stat, time_field) * stat.total_occurrences
+            )
+            aggregated[key]['count'] += stat.total_occurrences
+
+    result = []
+    for key, data in aggregated.items():
+        if data['occurrences'] > min_occurrences:
+            result.append({
+                key_field: key,
+                'occurrences': data['occurrences'],
+                'errors': data['errors'],
+                'error_percent': round(
+                    data['errors'] / data['occurrences'] * 100, 1
+                ),
+                'avg_time': round(
+                    data['total_time'] / data['count'], 1
+                ) if data['count'] > 0 else 0
+            })
+    return result
+
+
+class ProblemKeysAPITest(APITestCase):
+    """Регрессионные тесты агрегации проблемных клавиш в БД"""
+
+    LETTERS = 'абвгдежзийклмнопрстуфхцчшщыьэюя'
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+
+        rng = random.Random(42)
+        start = date(2024, 1, 1)
+        letters, bigrams = [], []
+        for day in range(60):
+            for letter in rng.sample(self.LETTERS, 10):
+                letters.append(DailyLetterStatistics(
+                    user=self.user,
+                    date=start + timedelta(days=day),
+                    letter=letter,
+                    total_occurrences=rng.randint(0, 20),
+                    total_errors=rng.randint(0, 5),
+                    average_hit_time_ms=rng.choice(
+                        [0, rng.uniform(80, 400)]
+                    )
+                ))
+            for bigram in rng.sample(self.LETTERS, 12):
+                bigrams.append(DailyBigramStatistics(
+                    user=self.user,
+                    date=start + timedelta(days=day),
+                    bigram=bigram + 'а',
+                    total_occurrences=rng.randint(0, 10),
+                    total_errors=rng.randint(0, 4),
+                    average_transition_time_ms=rng.uniform(80, 400)
+                ))
+        DailyLetterStatistics.objects.bulk_create(letters)
+        DailyBigramStatistics.objects.bulk_create(bigrams)
+
+        # Одна сессия в день с теми же строками, что и дневная статистика
+        sessions = {}
+        for day in sorted({stat.date for stat in letters + bigrams}):
+            moment = timezone.make_aware(
+                datetime.combine(day, datetime.min.time())
+            ) + timedelta(hours=12)
+            sessions[day] = TrainingSession.objects.create(
+                user=self.user, total_duration_seconds=60,
+                total_characters_typed=100, total_errors=0,
+                average_speed_wpm=200, accuracy_percentage=100,
+                started_at=moment, finished_at=moment
+            )
+        LetterStatistics.objects.bulk_create([
+            LetterStatistics(
+                session=sessions[stat.date], user=self.user,
+                session_date=stat.date, letter=stat.letter,
+                occurrences=stat.total_occurrences, errors=stat.total_errors,
+                average_hit_time_ms=stat.average_hit_time_ms
+            )
+            for stat in letters
+        ])
+        BigramStatistics.objects.bulk_create([
+            BigramStatistics(
+                session=sessions[stat.date], user=self.user,
+                session_date=stat.date, bigram=stat.bigram,
+                occurrences=stat.total_occurrences, errors=stat.total_errors,
+                average_transition_time_ms=stat.average_transition_time_ms
+            )
+            for stat in bigrams
+        ])
+        KeyTotalsService.rebuild(self.user)
+
+    def assertMatchesLegacy(self, data, expected, key_field):
+        self.assertEqual(len(data), len(expected))
+        by_key = {item[key_field]: item for item in expected}
+        previous = None
+        for item in data:
+            reference = by_key[item[key_field]]
+            self.assertEqual(item['occurrences'], reference['occurrences'])
+            self.assertEqual(item['errors'], reference['errors'])
+            self.assertAlmostEqual(
+                item['error_percent'], reference['error_percent'], places=6
+            )
+            self.assertAlmostEqual(
+                item['avg_time'], reference['avg_time'], places=6
+            )
+            if previous is not None:
+                self.assertGreaterEqual(
+                    previous['error_percent'], item['error_percent']
+                )
+            previous = item
+
+    def test_letters_match_python_implementation(self):
+        """
+        Тест: проблемные буквы из итогов за всё время
+        Ожидается: один запрос, результат совпадает с прежним расчётом
+        """
+        expected = legacy_problem_keys(
+            DailyLetterStatistics.objects.filter(user=self.user),
+            'letter', 'average_hit_time_ms', 5
+        )
+        expected.sort(key=lambda x: (-x['error_percent'], -x['avg_time']))
+        expected = expected[:15]
+
+        with self.assertNumQueries(1):
+            ProblemKeysService.letters(self.user, limit=15)
+
+        response = self.client.get('/api/stats/letters/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertMatchesLegacy(response.data, expected, 'letter')
+
+    def test_bigrams_match_python_implementation(self):
+        """
+        Тест: проблемные биграммы из итогов за всё время
+        Ожидается: один запрос, результат совпадает с прежним расчётом
+        """
+        expected = legacy_problem_keys(
+            DailyBigramStatistics.objects.filter(user=self.user),
+            'bigram', 'average_transition_time_ms', 3
+        )
+        expected.sort(key=lambda x: (-x['error_percent'], x['bigram']))
+        expected = expected[:15]
+
+        with self.assertNumQueries(1):
+            ProblemKeysService.bigrams(self.user, limit=15)
+
+        response = self.client.get('/api/stats/bigrams/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertMatchesLegacy(response.data, expected, 'bigram')
+
+    def test_missing_totals_rebuilt_on_read(self):
+        """
+        Тест: статистика сессий есть, итогов нет (история до их появления)
+        Ожидается: итоги пересобираются при первом чтении, ответы
+        те же, что после пересборки; при следующем чтении - один запрос
+        """
+        expected_letters = ProblemKeysService.letters(self.user)
+        expected_bigrams = ProblemKeysService.bigrams(self.user)
+        UserLetterTotals.objects.all().delete()
+        UserBigramTotals.objects.all().delete()
+
+        response = self.client.get('/api/stats/letters/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item['letter'] for item in response.data],
+            [item['letter'] for item in expected_letters]
+        )
+        self.assertEqual(ProblemKeysService.bigrams(self.user), expected_bigrams)
+        self.assertEqual(KeyTotalsService.find_mismatches(self.user), [])
+
+        with self.assertNumQueries(1):
+            ProblemKeysService.letters(self.user)
@@ -0,0 +1,251 @@
+"""
+Компактная запись нажатий сессии (TrainingSession.keystrokes).
+
+Формат (little-endian):
+- заголовок: b'KT', версия, флаги, количество нажатий (uint32),
+  код первого символа (uint32);
+  флаги: бит 0 - данные сжаты zlib, биты 1-2 - ширина кода (1, 2 или 4 байта);
+- коды символов: разности соседних кодов в zigzag (первая - нулевая),
+  т.е. при наборе в одной раскладке код занимает байт;
+- интервалы от предыдущего нажатия, мс (uint16, длинные паузы обрезаются);
+- флаги ошибок, по биту на нажатие (np.packbits).
+"""
+import struct
+import zlib
+from typing import NamedTuple
+
+import numpy as np
+
+MAGIC = b'KT'
+VERSION = 1
+HEADER = struct.Struct('<2sBBII')
+
+FLAG_ZLIB = 0x01
+WIDTHS = {1: (0, np.uint8), 2: (1, np.uint16), 4: (2, np.uint32)}
+
+# Защита от «zip-бомб» и случайно огромных записей
+MAX_KEYSTROKES = 100_000
+MAX_INTERVAL_MS = np.iinfo(np.uint16).max
+
+
+class Timeline(NamedTuple):
+    """Нажатия сессии: ожидаемые символы, интервалы (мс), ошибки"""
+    codes: np.ndarray  # int64, коды символов Unicode
+    intervals: np.ndarray  # uint16
+    errors: np.ndarray  # bool
+
+    @classmethod
+    def from_keys(cls, keys, intervals, errors):
+        if not (len(keys) == len(intervals) == len(errors)):
+            raise ValueError('Длины keys, intervals и errors различаются')
+        intervals = np.asarray(intervals, dtype=np.int64)
+        if len(intervals) and intervals.min() < 0:
+            raise ValueError('Интервал не может быть отрицательным')
+        return cls(
+            codes=_codes(keys),
+            intervals=np.minimum(intervals, MAX_INTERVAL_MS).astype(np.uint16),
+            errors=np.asarray(errors, dtype=bool)
+        )
+
+    @property
+    def keys(self):
+        return ''.join(map(chr, self.codes.tolist()))
+
+
+def from_raw_input(text, typed, timestamps):
+    """
+    Нажатия по тексту урока, набранному тексту и моментам нажатий (мс).
+    Каждое нажатие сдвигает курсор: i-й набранный символ сравнивается
+    с i-м символом текста, ошибка - несовпадение. Символом нажатия
+    считается ожидаемый символ текста
+    """
+    if len(typed) != len(timestamps):
+        raise ValueError('Длины typed и timestamps различаются')
+    if len(typed) > len(text):
+        raise ValueError('Набрано больше символов, чем в тексте')
+
+    expected = _codes(text[:len(typed)])
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    intervals = np.diff(timestamps, prepend=timestamps[:1])
+    if len(intervals) and intervals.min() < 0:
+        raise ValueError('Моменты нажатий должны не убывать')
+    return Timeline(
+        codes=expected,
+        intervals=np.minimum(intervals, MAX_INTERVAL_MS).astype(np.uint16),
+        errors=_codes(typed) != expected
+    )
+
+
+def encode(timeline, compress=True):
+    """Запись нажатий в байты"""
+    count = len(timeline.codes)
+    if count > MAX_KEYSTROKES:
+        raise ValueError(f'Больше {MAX_KEYSTROKES} нажатий')
+
+    codes = timeline.codes.astype(np.int64)
+    if not _valid_codes(codes):
+        raise ValueError('Недопустимый символ в записи нажатий')
+    first = int(codes[0]) if count else 0
+    deltas = np.diff(codes, prepend=first)
+    zigzag = (deltas << 1) ^ (deltas >> 63)
+    peak = int(zigzag.max()) if count else 0
+    width = next(
+        width for width, (_, dtype) in WIDTHS.items()
+        if peak <= np.iinfo(dtype).max
+    )
+    width_bits = WIDTHS[width][0]
+
+    payload = b''.join([
+        zigzag.astype(f'<u{width}').tobytes(),
+        timeline.intervals.astype('<u2').tobytes(),
+        np.packbits(timeline.errors, bitorder='little').tobytes(),
+    ])
+    flags = width_bits << 1
+    if compress:
+        payload = zlib.compress(payload)
+        flags |= FLAG_ZLIB
+    return HEADER.pack(MAGIC, VERSION, flags, count, first) + payload
+
+
+def decode(data):
+    """Нажатия из байтов; ValueError, если запись повреждена"""
+    data = bytes(data)
+    if len(data) < HEADER.size:
+        raise ValueError('Запись нажатий повреждена')
+    magic, version, flags, count, first = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('Неизвестный формат записи нажатий')
+    if count > MAX_KEYSTROKES:
+        raise ValueError(f'Больше {MAX_KEYSTROKES} нажатий')
+
+    widths = {bits: width for width, (bits, _) in WIDTHS.items()}
+    width = widths.get((flags >> 1) & 0x03)
+    if width is None:
+        raise ValueError('Неизвестная ширина кода')
+    size = count * (width + 2) + (count + 7) // 8
+
+    payload = data[HEADER.size:]
+    if flags & FLAG_ZLIB:
+        try:
+            decompressor = zlib.decompressobj()
+            payload = decompressor.decompress(payload, size + 1)
+        except zlib.error as error:
+            raise ValueError('Запись нажатий повреждена') from error
+        # Поток оборван или после него лишние данные
+        if not decompressor.eof or decompressor.unused_data:
+            raise ValueError('Запись нажатий повреждена')
+    if len(payload) != size:
+        raise ValueError('Запись нажатий повреждена')
+
+    zigzag = np.frombuffer(
+        payload, dtype=f'<u{width}', count=count
+    ).astype(np.int64)
+    deltas = (zigzag >> 1) ^ -(zigzag & 1)
+    intervals = np.frombuffer(
+        payload, dtype='<u2', count=count, offset=count * width
+    ).astype(np.uint16)
+    errors = np.unpackbits(
+        np.frombuffer(payload, dtype=np.uint8, offset=count * (width + 2)),
+        count=count, bitorder='little'
+    ).astype(bool)
+    codes = first + np.cumsum(deltas)
+    if not _valid_codes(codes):
+        raise ValueError('Запись нажатий повреждена')
+    return Timeline(codes, intervals, errors)
+
+
+def key_stats(timeline):
+    """
+    Статистика по буквам и биграммам (в полях LetterStatsSerializer
+    и BigramStatsSerializer) одним векторным проходом по нажатиям.
+    Время буквы - интервал до её нажатия, время биграммы - интервал
+    до её второго символа, ошибка биграммы - ошибка на втором символе.
+    Нулевые интервалы (первое нажатие) во время не входят
+    """
+    codes, intervals, errors = timeline
+    if not len(codes):
+        return [], []
+
+    # Клавиши без учёта регистра, пробел - '\s'
+    unique_codes, inverse = np.unique(codes, return_inverse=True)
+    labels, label_index = np.unique(
+        [_letter(chr(code)) for code in unique_codes.tolist()],
+        return_inverse=True
+    )
+    keys = label_index[inverse]
+    intervals = intervals.astype(np.float64)
+    size = len(labels)
+    labels = labels.tolist()
+
+    letters = [
+        {
+            'letter': labels[key],
+            'occurrences': occurrences,
+            'errors': errors_count,
+            'average_hit_time_ms': time,
+        }
+        for key, occurrences, errors_count, time in _group(
+            keys, size, intervals, errors
+        )
+    ]
+
+    # Биграммы - пары соседних нажатий без пробельных символов
+    spaces = np.array([label.isspace() or label == '\\s' for label in labels])
+    pairs = keys[:-1] * size + keys[1:]
+    mask = ~(spaces[keys[:-1]] | spaces[keys[1:]])
+    unique_pairs, pair_keys = np.unique(pairs[mask], return_inverse=True)
+    firsts = (unique_pairs // size).tolist()
+    seconds = (unique_pairs % size).tolist()
+    bigrams = [
+        {
+            'bigram': labels[firsts[pair]] + labels[seconds[pair]],
+            'occurrences': occurrences,
+            'errors': errors_count,
+            'average_transition_time_ms': time,
+        }
+        for pair, occurrences, errors_count, time in _group(
+            pair_keys, len(unique_pairs),
+            intervals[1:][mask], errors[1:][mask]
+        )
+    ]
+    return letters, bigrams
+
+
+def _group(keys, size, intervals, errors):
+    """(ключ, нажатия, ошибки, среднее время) по номерам ключей"""
+    occurrences = np.bincount(keys, minlength=size)
+    errors_count = np.bincount(keys, weights=errors, minlength=size)
+    timed = intervals > 0
+    time_sum = np.bincount(keys[timed], weights=intervals[timed], minlength=size)
+    time_count = np.bincount(keys[timed], minlength=size)
+    average = np.divide(
+        time_sum, time_count,
+        out=np.zeros(size), where=time_count > 0
+    )
+    present = np.flatnonzero(occurrences)
+    return zip(
+        present.tolist(),
+        occurrences[present].tolist(),
+        errors_count[present].astype(np.int64).tolist(),
+        average[present].tolist()
+    )
+
+
+def _valid_codes(codes):
+    """Коды - символы Unicode: 1..0x10FFFF без суррогатов"""
+    return not len(codes) or bool(
+        codes.min() >= 1
+        and codes.max() <= 0x10FFFF
+        and not np.any((codes >= 0xD800) & (codes <= 0xDFFF))
+    )
+
+
+def _codes(string):
+    """Коды символов строки без цикла по символам"""
+    return np.frombuffer(
+        string.encode('utf-32-le', 'surrogatepass'), dtype='<u4'
+    ).astype(np.int64)
+
+
+def _letter(char):
+    return '\\s' if char == ' ' else char.lower()
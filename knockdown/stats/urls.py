@@ -11,4 +11,5 @@ urlpatterns = [
     path('daily/', views.DailyStatsView.as_view()),
     path('letters/', views.LetterStatsView.as_view()),
     path('bigrams/', views.BigramStatsView.as_view()),
+    path('export/', views.SessionExportView.as_view()),
 ]
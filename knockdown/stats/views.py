@@ -1,9 +1,10 @@
-from rest_framework import viewsets, permissions
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.generics import get_object_or_404
 from .models import (
     TrainingSession,
-    DailyStatistics,
-    DailyLetterStatistics,
-    DailyBigramStatistics
+    DailyStatistics
 )
 from .serializers import (
     TrainingSessionSerializer,
@@ -12,22 +13,134 @@ from .serializers import (
     ProblemLetterSerializer,
     ProblemBigramSerializer
 )
+from .pagination import SessionCursorPagination
+from . import export, timeline
+from .services import (
+    AggregationQueue,
+    ProblemKeysService,
+    SessionImportService,
+    SessionRollbackService,
+    StatsSummaryService
+)
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from django.db.models import Sum, Count, Avg, Max
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+
+class AggregatesPendingMixin:
+    """
+    Заголовок X-Aggregates-Pending: дневная статистика ещё не учитывает
+    часть сессий (ждут в очереди агрегации)
+    """
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if request.user.is_authenticated and response.status_code == 200:
+            pending = AggregationQueue.is_pending(request.user)
+            response['X-Aggregates-Pending'] = 'true' if pending else 'false'
+        return super().finalize_response(request, response, *args, **kwargs)
 
 
 class TrainingSessionViewSet(viewsets.ModelViewSet):
     """Работа с сессиями"""
     serializer_class = TrainingSessionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = SessionCursorPagination
 
     def get_queryset(self):
-        return TrainingSession.objects.filter(user=self.request.user)
+        # lesson_title и lesson_order - из того же запроса
+        # Запись нажатий читается только отдельным запросом timeline
+        return TrainingSession.objects.filter(
+            user=self.request.user
+        ).select_related('lesson').defer('keystrokes')
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    def perform_destroy(self, instance):
+        # Вклад сессии вычитается из агрегатов без полного пересчёта
+        SessionRollbackService.delete_sessions(instance.user, [instance])
+
+    @action(detail=False, methods=['delete'], url_path='last')
+    def delete_last(self, request):
+        """Удаление последних N сессий: DELETE /sessions/last/?count=N"""
+        try:
+            count = int(request.query_params.get('count', 1))
+        except ValueError:
+            count = 0
+        if count < 1:
+            raise ValidationError({'count': 'Ожидается целое число не меньше 1'})
+
+        sessions = self.get_queryset().order_by('-finished_at', '-id')[:count]
+        deleted = SessionRollbackService.delete_sessions(
+            request.user, sessions
+        )
+        return Response({'deleted': deleted}, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'], url_path='timeline')
+    def keystroke_timeline(self, request, pk=None):
+        """Запись нажатий сессии для повтора: GET /sessions/{id}/timeline/"""
+        session = get_object_or_404(
+            TrainingSession.objects.only('keystrokes'),
+            user=request.user, pk=pk
+        )
+        if not session.keystrokes:
+            raise NotFound('У сессии нет записи нажатий')
+
+        keys = timeline.decode(session.keystrokes)
+        return Response({
+            'keys': keys.keys,
+            'intervals': keys.intervals.tolist(),
+            'errors': keys.errors.tolist(),
+        })
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_sessions(self, request):
+        """
+        Импорт массива сессий (офлайн-клиенты): POST /sessions/import/.
+        Ошибочные элементы пропускаются, по каждому элементу
+        в ответе - id созданной сессии или ошибки
+        """
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError({
+                'non_field_errors': 'Ожидается массив сессий'
+            })
+        if len(items) > settings.STATS_IMPORT_MAX_SESSIONS:
+            raise ValidationError({
+                'non_field_errors':
+                f'Не больше {settings.STATS_IMPORT_MAX_SESSIONS} '
+                'сессий за запрос'
+            })
+
+        results = []
+        valid = []
+        for index, item in enumerate(items):
+            serializer = self.get_serializer(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+                results.append({'index': index})
+            else:
+                results.append({'index': index, 'errors': serializer.errors})
+
+        sessions = SessionImportService.import_sessions(
+            request.user, [data for _, data in valid]
+        )
+        for (index, _), session in zip(valid, sessions):
+            results[index]['id'] = session.id
+
+        return Response(
+            {
+                'created': len(sessions),
+                'failed': len(items) - len(sessions),
+                'results': results,
+            },
+            status=(
+                status.HTTP_201_CREATED if sessions
+                else status.HTTP_400_BAD_REQUEST
+            )
+        )
+
     # PUT, PATCH отключаем пока
     http_method_names = ['get', 'post', 'delete', 'head', 'options']
 
@@ -39,27 +152,25 @@ class DashboardStatsView(APIView):
     def get(self, request):
         user = request.user
 
-        stats = TrainingSession.objects.filter(user=user).aggregate(
-            total_sessions=Count('id'),
-            total_time=Sum('total_duration_seconds'),
-            avg_speed=Avg('average_speed_wpm'),
-            best_speed=Max('average_speed_wpm'),
-            avg_accuracy=Avg('accuracy_percentage')
-        )
+        summary = StatsSummaryService.get(user)
+        sessions = summary.total_sessions
 
         data = {
-            'total_sessions': stats['total_sessions'] or 0,
-            'total_time': round((stats['total_time'] or 0) / 60),
-            'avg_speed': round(stats['avg_speed'] or 0),
-            'best_speed': stats['best_speed'] or 0,
-            'avg_accuracy': round(stats['avg_accuracy'] or 0),
+            'total_sessions': sessions,
+            'total_time': round(summary.total_time_seconds / 60),
+            'avg_speed': round(summary.speed_sum / sessions) if sessions else 0,
+            'best_speed': summary.best_speed,
+            'avg_accuracy': (
+                round(summary.accuracy_sum / sessions) if sessions else 0
+            ),
+            'aggregates_pending': AggregationQueue.is_pending(user),
         }
 
         serializer = DashboardStatsSerializer(data)
         return Response(serializer.data)
 
 
-class DailyStatsView(APIView):
+class DailyStatsView(AggregatesPendingMixin, APIView):
     """Дневная статистика для графика"""
     permission_classes = [permissions.IsAuthenticated]
 
@@ -72,92 +183,43 @@ class DailyStatsView(APIView):
         return Response(serializer.data)
 
 
-class LetterStatsView(APIView):
+class LetterStatsView(AggregatesPendingMixin, APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-        stats = DailyLetterStatistics.objects.filter(user=user)
-
-        aggregated = {}
-        for stat in stats:
-            if stat.letter not in aggregated:
-                aggregated[stat.letter] = {
-                    'occurrences': 0,
-                    'errors': 0,
-                    'total_time': 0,
-                    'count': 0
-                }
-            aggregated[stat.letter]['occurrences'] += stat.total_occurrences
-            aggregated[stat.letter]['errors'] += stat.total_errors
-            if stat.average_hit_time_ms:
-                aggregated[stat.letter]['total_time'] += (
-                    stat.average_hit_time_ms * stat.total_occurrences
-                )
-                aggregated[stat.letter]['count'] += stat.total_occurrences
-
-        result = []
-        for letter, data in aggregated.items():
-            if data['occurrences'] > 5:
-                result.append({
-                    'letter': letter,
-                    'occurrences': data['occurrences'],
-                    'errors': data['errors'],
-                    'error_percent': round(
-                        data['errors'] / data['occurrences'] * 100, 1
-                    ),
-                    'avg_time': round(
-                        data['total_time'] / data['count'], 1
-                    ) if data['count'] > 0 else 0
-                })
-
-        # Сортировка: сначала по проценту ошибок (от большего к меньшему), затем по времени перехода (от большего к меньшему)
-        result.sort(key=lambda x: (-x['error_percent'], -x['avg_time']))
-
-        serializer = ProblemLetterSerializer(result[:15], many=True)
+        result = ProblemKeysService.letters(request.user, limit=15)
+        serializer = ProblemLetterSerializer(result, many=True)
         return Response(serializer.data)
 
 
-class BigramStatsView(APIView):
+class BigramStatsView(AggregatesPendingMixin, APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-        stats = DailyBigramStatistics.objects.filter(user=user)
-
-        aggregated = {}
-        for stat in stats:
-            if stat.bigram not in aggregated:
-                aggregated[stat.bigram] = {
-                    'occurrences': 0,
-                    'errors': 0,
-                    'total_time': 0,
-                    'count': 0
-                }
-            aggregated[stat.bigram]['occurrences'] += stat.total_occurrences
-            aggregated[stat.bigram]['errors'] += stat.total_errors
-            if stat.average_transition_time_ms:
-                aggregated[stat.bigram]['total_time'] += (
-                    stat.average_transition_time_ms * stat.total_occurrences
-                )
-                aggregated[stat.bigram]['count'] += stat.total_occurrences
-
-        result = []
-        for bigram, data in aggregated.items():
-            if data['occurrences'] > 3:
-                result.append({
-                    'bigram': bigram,
-                    'occurrences': data['occurrences'],
-                    'errors': data['errors'],
-                    'error_percent': round(
-                        data['errors'] / data['occurrences'] * 100, 1
-                    ),
-                    'avg_time': round(
-                        data['total_time'] / data['count'], 1
-                    ) if data['count'] > 0 else 0
-                })
-
-        result.sort(key=lambda x: x['error_percent'], reverse=True)
-
-        serializer = ProblemBigramSerializer(result[:15], many=True)
+        result = ProblemKeysService.bigrams(request.user, limit=15)
+        serializer = ProblemBigramSerializer(result, many=True)
         return Response(serializer.data)
+
+
+class SessionExportView(APIView):
+    """
+    Выгрузка всей истории сессий пользователя со статистикой по клавишам:
+    GET /export/?export_format=csv|ndjson (параметр format занят DRF)
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        name = request.query_params.get('export_format', 'csv')
+        if name not in export.FORMATS:
+            raise ValidationError({
+                'export_format': f'Ожидается одно из: {", ".join(export.FORMATS)}'
+            })
+
+        rows, content_type, extension = export.FORMATS[name]
+        response = StreamingHttpResponse(
+            rows(request.user), content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="sessions.{extension}"'
+        )
+        return response
@@ -17,6 +17,9 @@ python3 manage.py migrate lessons
 python3 manage.py migrate stats
 python3 manage.py migrate
 
+echo "Backfilling session dates"
+python3 manage.py backfill_session_dates
+
 echo "Collecting static files"
 python3 manage.py collectstatic --noinput --clear
 